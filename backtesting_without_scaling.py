@@ -3,61 +3,109 @@ import numpy as np
 import matplotlib.pyplot as plt
 import warnings
 
+from kernels import (
+    ohlc_arrays, without_scaling_kernel, mae_mfe, trade_bars_from_times, trades_to_frame, TRADE_DTYPE,
+)
+from feature_cache import frame_digest
+from instrumentation import stage
+from pivots import PivotQueries, PIVOT_HIGH, PIVOT_LOW
+from features import (
+    FEATURE_COLUMNS, swing_levels, liquidity_grabs, signals_from_grabs, grab_labels,
+)
+
 warnings.filterwarnings('ignore')
 
-class SwingBacktesterWithoutScaling:
+class SwingBacktesterWithoutScaling(PivotQueries):
     """
     Backtester with vectorized swing detection (minor pivots) and configurable lag/window.
     """
-    def __init__(self, data: pd.DataFrame, lag: int, window: int, ):
+    variant = 'without_scaling'
+
+    def __init__(self, data: pd.DataFrame, lag: int, window: int, feature_cache=None):
         """
         :param data: DataFrame with ['o','h','l','c'] indexed by datetime
         :param lag: number of bars to lag swing detection (avoids lookahead)
         :param window: half-window size for centered swing detection
+        :param feature_cache: optional FeatureCache; features of unchanged data are loaded instead of recomputed
         """
         self.lag = lag
         self.window = window
+        self.feature_cache = feature_cache
         self.data = data.copy()
         self.bt = None
         self.results = []
+        self.entry_bars = None
+        self.exit_bars = None
+        self._pivots = {}
         self.process_all()
 
     def process_all(self):
-        self.compute_vectorized_swings()
-        self.map_swing_levels()
-        self.calculate_liquidity_grabs()
-        self.generate_entry_signals()
+        bars = len(self.data)
+        if self.feature_cache is not None:
+            with stage('process_all.feature_cache_get', bars=bars):
+                key = self.feature_cache.key(frame_digest(self.data), self.window, self.lag, self.variant)
+                cached = self.feature_cache.get(key)
+                if cached is not None:
+                    for col in FEATURE_COLUMNS:
+                        self.data[col] = cached[col]
+            if cached is not None:
+                return
+        with stage('process_all.compute_vectorized_swings', bars=bars):
+            self.compute_vectorized_swings()
+        with stage('process_all.map_swing_levels', bars=bars):
+            self.map_swing_levels()
+        with stage('process_all.calculate_liquidity_grabs', bars=bars):
+            self.calculate_liquidity_grabs()
+        with stage('process_all.generate_entry_signals', bars=bars):
+            self.generate_entry_signals()
+        if self.feature_cache is not None:
+            with stage('process_all.feature_cache_put', bars=bars):
+                self.feature_cache.put(key, {col: self.data[col].to_numpy() for col in FEATURE_COLUMNS})
 
     def compute_vectorized_swings(self):
-        span = 2 * self.window + 1
-        max_h = self.data['h'].rolling(window=span, center=True, min_periods=1).max()
-        min_l = self.data['l'].rolling(window=span, center=True, min_periods=1).min()
-        self.data['is_swing_high'] = (self.data['h'] == max_h).shift(self.lag)
-        self.data['is_swing_low']  = (self.data['l'] == min_l).shift(self.lag)
+        pivots = self.pivot_index()
+        # bool all the way: the first `lag` bars have no lagged pivot and count as swings,
+        # which is how np.where treated the NaNs of the old object column
+        self.data['is_swing_high'] = pivots.flags(PIVOT_HIGH, self.lag, fill=True)
+        self.data['is_swing_low'] = pivots.flags(PIVOT_LOW, self.lag, fill=True)
 
     def map_swing_levels(self):
-        self.data['swing_high_level'] = (
-            pd.Series(np.where(self.data['is_swing_high'], self.data['h'], np.nan),index=self.data.index).ffill()
-        )
-        self.data['swing_low_level'] = (
-            pd.Series(np.where(self.data['is_swing_low'], self.data['l'], np.nan),index=self.data.index).ffill()
-        )
+        self.data['swing_high_level'] = swing_levels(self.data['is_swing_high'].to_numpy(), self.data['h'].to_numpy(dtype=np.float64))
+        self.data['swing_low_level'] = swing_levels(self.data['is_swing_low'].to_numpy(), self.data['l'].to_numpy(dtype=np.float64))
 
     def calculate_liquidity_grabs(self):
-        conds = [
-            self.data['l'] < self.data['swing_low_level'],
-            self.data['h'] > self.data['swing_high_level']
-        ]
-        choices = ['Bearish_Grab', 'Bullish_Grab']
-        self.data['liquidity_grab'] = np.select(conds, choices, default=None)
+        self.data['liquidity_grab'] = liquidity_grabs(
+            self.data['h'].to_numpy(dtype=np.float64), self.data['l'].to_numpy(dtype=np.float64),
+            self.data['swing_high_level'].to_numpy(), self.data['swing_low_level'].to_numpy(),
+        )
 
     def generate_entry_signals(self):
-        grab_prev = self.data['liquidity_grab'].shift(1)
-        bull = (grab_prev == 'Bearish_Grab') & (self.data['c'] > self.data['o'])
-        bear = (grab_prev == 'Bullish_Grab') & (self.data['c'] < self.data['o'])
-        self.data['entry_signal'] = np.where(bull, 1, np.where(bear, -1, 0))
+        self.data['entry_signal'] = signals_from_grabs(
+            self.data['o'].to_numpy(dtype=np.float64), self.data['c'].to_numpy(dtype=np.float64),
+            self.data['liquidity_grab'].to_numpy(), 1,
+        )
 
-    def run_backtest(self):
+    def labelled_data(self) -> pd.DataFrame:
+        """
+        Copy of self.data with 'liquidity_grab' codes turned into 'Bearish_Grab' / 'Bullish_Grab' / None.
+        """
+        data = self.data.copy()
+        data['liquidity_grab'] = grab_labels(data['liquidity_grab'])
+        return data
+
+    def run_backtest(self, engine: str = 'python'):
+        """
+        :param engine: 'python' for the bar-by-bar loop, 'array' for the compiled kernel over NumPy arrays
+        """
+        with stage(f'run_backtest.{engine}', bars=len(self.data)) as timer:
+            self._run_backtest(engine)
+            timer.add(trades=0 if self.bt is None else len(self.bt))
+
+    def _run_backtest(self, engine: str):
+        if engine == 'array':
+            return self._run_backtest_array()
+        if engine != 'python':
+            raise ValueError(f"Unknown engine {engine!r}, expected 'python' or 'array'")
         results = []
         in_position = False
         position = 0
@@ -118,40 +166,45 @@ class SwingBacktesterWithoutScaling:
                     in_position = True
         self.results = results
         self.bt = pd.DataFrame(results)
+        self.entry_bars, self.exit_bars = trade_bars_from_times(
+            self.data.index,
+            [r['Entry Time'] for r in results],
+            [r['Exit Time'] for r in results],
+        )
         if not self.bt.empty:
             self.bt['Cumulative PnL'] = self.bt['PnL'].cumsum()
             self.bt['Entry Time'] = pd.to_datetime(self.bt['Entry Time'])
             self.bt['Exit Time'] = pd.to_datetime(self.bt['Exit Time'])
             self.bt['Duration'] = (self.bt['Exit Time'] - self.bt['Entry Time']).dt.total_seconds() / 60
 
-    
-        
+    def _run_backtest_array(self):
+        signal, o, h, l = ohlc_arrays(self.data)
+        trades = np.empty(len(signal), dtype=TRADE_DTYPE)
+        n_trades = without_scaling_kernel(signal, o, h, l, trades)
+        self.results = trades[:n_trades]
+        self.entry_bars = self.results['entry_bar']
+        self.exit_bars = self.results['exit_bar']
+        self.bt = trades_to_frame(self.data.index, self.results)
+        if not self.bt.empty:
+            self.bt['Cumulative PnL'] = self.bt['PnL'].cumsum()
+            self.bt['Duration'] = (self.bt['Exit Time'] - self.bt['Entry Time']).dt.total_seconds() / 60
+
     def calculate_mae_mfe(self):
         if self.bt is None or self.bt.empty:
             print("Run backtest first.")
             return
-        mae_list = []
-        mfe_list = []
-        for idx, row in self.bt.iterrows():
-            entry_time = row['Entry Time']
-            exit_time = row['Exit Time']
-            entry_price = row['Entry Price']
-            direction = 1 if row['Direction'] == 'Long' else -1
-            trade_data = self.data.loc[entry_time:exit_time]
-            if direction == 1:
-                min_low = trade_data['l'].min()
-                max_high = trade_data['h'].max()
-                mae = min_low - entry_price
-                mfe = max_high - entry_price
-            else:
-                max_high = trade_data['h'].max()
-                min_low = trade_data['l'].min()
-                mae = entry_price - max_high
-                mfe = entry_price - min_low
-            mae_list.append(mae * direction)
-            mfe_list.append(mfe * direction)
-        self.bt['MAE'] = mae_list
-        self.bt['MFE'] = mfe_list
+        with stage('calculate_mae_mfe', bars=len(self.data), trades=len(self.bt)):
+            self._calculate_mae_mfe()
+
+    def _calculate_mae_mfe(self):
+        self.bt['MAE'], self.bt['MFE'] = mae_mfe(
+            self.data['h'].to_numpy(dtype=np.float64),
+            self.data['l'].to_numpy(dtype=np.float64),
+            self.entry_bars,
+            self.exit_bars,
+            self.bt['Entry Price'].to_numpy(),
+            (self.bt['Direction'] == 'Long').to_numpy(),
+        )
     def plot_trades(self, n_trades: int = 5):
         """
         Plot the close price and overlay the first n_trades entry/exit points.
@@ -0,0 +1,192 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from chunked import ChunkedFeatures
+from features import rolling_extrema
+from generate_summary import summarize
+from instrumentation import stage
+from kernels import (
+    batched_without_scaling_resume, batched_scaling_resume, mae_mfe, trades_to_frame, TRADE_DTYPE,
+    STATE_SIZE,
+)
+from sweep import SweepData, VARIANTS
+
+warnings.filterwarnings('ignore')
+
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+COMBO_KEYS = ['Lag', 'Window', 'SL Multiplier']
+
+
+def combo_grid(window_values, lag_values, sl_multipliers=(1.0,)):
+    """
+    Every (window, lag, sl_multiplier) combo, windows outermost like the sweeps.
+    """
+    return [(window, lag, float(mult)) for window in window_values for lag in lag_values for mult in sl_multipliers]
+
+
+class BatchRun:
+    """
+    Many (window, lag, SL multiplier) combos of one variant run side by side in one pass over the bars.
+
+    The history is cut into blocks. For each block, the features of every (window, lag) are built
+    into (feature sets, bars) matrices, one rolling pass per window shared by all its lags, and a
+    batched kernel steps every combo through each bar before moving to the next, with the combos'
+    position state held column-wise in a (STATE_SIZE, combos) array. Combos that only differ by
+    SL multiplier share a feature row. Blocks are sized so the matrices stay within `max_bytes`.
+    """
+    def __init__(self, data: SweepData, combos, variant: str = 'without_scaling', max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param combos: (window, lag, sl_multiplier) tuples, e.g. from combo_grid()
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+        self.data = data
+        self.combos = [(int(window), int(lag), float(mult)) for window, lag, mult in combos]
+        self.variant = variant
+        self.scaling = variant == 'scaling'
+        self.pairs = list(dict.fromkeys((window, lag) for window, lag, _ in self.combos))
+        self.column = {pair: f for f, pair in enumerate(self.pairs)}
+        self.feature = np.array([self.column[window, lag] for window, lag, _ in self.combos], dtype=np.int64)
+        self.sl_mult = np.array([mult for _, _, mult in self.combos], dtype=np.float64)
+        self.block_bars = int(max(256, max_bytes // (3 * len(self.pairs) + 1)))
+
+        n_combos = len(self.combos)
+        self.state = np.zeros((STATE_SIZE, n_combos))
+        # per-combo rows of closed trades, handed over and replaced whenever one fills up
+        self.trades = np.empty((n_combos, max(256, min(4 * self.block_bars, 1 << 20) // max(n_combos, 1))),
+                               dtype=TRADE_DTYPE)
+        self.counts = np.zeros(n_combos, dtype=np.int64)
+
+    def run(self):
+        """
+        Raw TRADE_DTYPE records of every combo over the whole history, in the order of `combos`.
+        """
+        data = self.data
+        n = len(data)
+        features = {pair: ChunkedFeatures(data.h, data.l, pair[0], pair[1], self.variant) for pair in self.pairs}
+        lags = {}
+        for window, lag in self.pairs:
+            lags.setdefault(window, []).append(lag)
+        n_pairs = len(self.pairs)
+        prev = None  # feature columns of the previous block's last bar, which the kernels look back to
+        found = [[] for _ in self.combos]
+
+        with stage('batch.run', bars=n) as timer:
+            for start in range(0, n, self.block_bars):
+                stop = min(n, start + self.block_bars)
+                first = max(0, start - 1)
+                rows = stop - first
+                signal = np.zeros((n_pairs, rows), dtype=np.int8)
+                swing_high = np.zeros((n_pairs, rows), dtype=np.bool_)
+                swing_low = np.zeros((n_pairs, rows), dtype=np.bool_)
+                if prev is not None:
+                    signal[:, 0], swing_high[:, 0], swing_low[:, 0] = prev
+                skip = start - first
+                o, c = data.o[start:stop], data.c[start:stop]
+                with stage('batch.features', bars=stop - start):
+                    for window, window_lags in lags.items():
+                        extrema = self._extrema(features, window, window_lags, start, stop)
+                        for lag in window_lags:
+                            f = self.column[window, lag]
+                            sig, high, low, _, _ = features[window, lag].block(start, stop, o, c, extrema)
+                            signal[f, skip:], swing_high[f, skip:], swing_low[f, skip:] = sig, high, low
+                prev = (signal[:, -1].copy(), swing_high[:, -1].copy(), swing_low[:, -1].copy())
+                self._run_block(signal, swing_high, swing_low, first, stop, found)
+            self._flush(found)
+            trades = [np.concatenate(chunks) if chunks else np.empty(0, dtype=TRADE_DTYPE) for chunks in found]
+            timer.add(trades=sum(len(t) for t in trades))
+        return trades
+
+    def _extrema(self, features, window, window_lags, start, stop):
+        # one range covering the halo of every lag of the window
+        halos = [features[window, lag].halo(start, stop) for lag in window_lags]
+        lo, hi = min(lo for lo, _ in halos), max(hi for _, hi in halos)
+        h = np.array(self.data.h[lo:hi], dtype=np.float64)
+        l = np.array(self.data.l[lo:hi], dtype=np.float64)
+        return (lo, h, l, *rolling_extrema(h, l, window))
+
+    def _run_block(self, signal, swing_high, swing_low, first, stop, found):
+        d = self.data
+        o, h, l = d.o[first:stop], d.h[first:stop], d.l[first:stop]
+        bar = 1  # bar 0 of the block is looked back to only
+        while bar < len(o):
+            if self.scaling:
+                bar = batched_scaling_resume(signal, o, h, l, swing_high, swing_low, self.feature, self.sl_mult,
+                                             self.state, bar, first, self.trades, self.counts)
+            else:
+                bar = batched_without_scaling_resume(signal, o, h, l, self.feature, self.sl_mult, self.state,
+                                                     bar, first, self.trades, self.counts)
+            if bar < len(o):
+                self._flush(found)
+
+    def _flush(self, found):
+        # the rows are kept as views until run() concatenates them, so a fresh buffer takes over
+        for c in np.flatnonzero(self.counts):
+            found[c].append(self.trades[c, :self.counts[c]])
+        self.trades = np.empty_like(self.trades)
+        self.counts[:] = 0
+
+
+def batch_sweep(df, window_values, lag_values, sl_multipliers=(1.0,), variant: str = 'without_scaling',
+                with_mae_mfe: bool = True, max_bytes: int = DEFAULT_MAX_BYTES, feature_cache=None):
+    """
+    Trade logs of a (window, lag, SL multiplier) grid from one batched pass over the bars.
+
+    With sl_multipliers=(1.0,) every log equals run_combo()'s for the same (lag, window).
+
+    :return: list of (lag, window, sl_multiplier, trade log DataFrame), windows outermost
+    """
+    data = df if isinstance(df, SweepData) else SweepData.from_frame(df, feature_cache)
+    combos = combo_grid(window_values, lag_values, sl_multipliers)
+    results = []
+    for (window, lag, mult), trades in zip(combos, BatchRun(data, combos, variant, max_bytes).run()):
+        with stage('trade_log', trades=len(trades)):
+            bt = trades_to_frame(data.index, trades, with_units=(variant == 'scaling'))
+            if not bt.empty:
+                bt['Cumulative PnL'] = bt['PnL'].cumsum()
+                bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+        if with_mae_mfe and not bt.empty:
+            with stage('calculate_mae_mfe', bars=len(data), trades=len(trades)):
+                bt['MAE'], bt['MFE'] = mae_mfe(data.h, data.l, trades['entry_bar'], trades['exit_bar'],
+                                               trades['entry_price'], trades['direction'] == 1)
+        results.append((lag, window, mult, bt))
+    return results
+
+
+def summarize_batch(results) -> pd.DataFrame:
+    """
+    generate_summary metrics per (Lag, Window, SL Multiplier) of batch_sweep() results.
+    """
+    logs = [(lag, window, mult, bt) for lag, window, mult, bt in results if not bt.empty]
+    if not logs:
+        return summarize(pd.DataFrame(), COMBO_KEYS)
+    sizes = [len(bt) for *_, bt in logs]
+    columns = {key: np.repeat([log[i] for log in logs], sizes) for i, key in enumerate(COMBO_KEYS)}
+    for col in ['PnL', 'Cumulative PnL', 'MAE', 'MFE']:
+        columns[col] = np.concatenate([bt[col].to_numpy(dtype=np.float64) for *_, bt in logs])
+    return summarize(pd.DataFrame(columns), COMBO_KEYS)
+
+
+def main():
+    from data_loader import load_sweep_data
+    from universe import discover_symbols
+
+    window_values = [1, 2, 3, 4, 5, 6, 7, 8]
+    lag_values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+    sl_multipliers = [0.5, 0.75, 1.0, 1.5, 2.0]
+    os.makedirs("./Summary", exist_ok=True)
+
+    for symbol, csv_path in discover_symbols("./data").items():
+        # ✅ 480 combos per variant, every bar read once per block instead of once per combo
+        for variant in VARIANTS:
+            results = batch_sweep(load_sweep_data(csv_path), window_values, lag_values, sl_multipliers, variant)
+            summary_path = os.path.join("./Summary", f"Batch_{symbol}_{variant}.csv")
+            summarize_batch(results).to_csv(summary_path, index=False)
+            print(f"🚀 {symbol} {variant}: {len(results)} combos summarized to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Timed scenarios over seeded synthetic OHLC, written to JSON, with a compare mode for regressions.
+
+    python -m benchmarks.run --sizes 10k,100k,1M,10M --output benchmarks/results/new.json
+    python -m benchmarks.run compare benchmarks/results/old.json benchmarks/results/new.json
+    python -m benchmarks.run parity --bars 20k
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from backtesting_scaling import SwingBacktesterWithScaling
+from backtesting_without_scaling import SwingBacktesterWithoutScaling
+from benchmarks.synthetic import synthetic_ohlc
+from generate_summary import generate_summary, load_trades
+from portfolio import simulate_portfolio, SIZING_RULES
+from sweep import save_trades
+from sweep_executor import parallel_sweep
+from trade_store import TradeStore
+
+warnings.filterwarnings('ignore')
+
+LAG = 3
+WINDOW = 4
+SWEEP_WINDOWS = [1, 2, 3, 4, 5, 6, 7, 8]
+SWEEP_LAGS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+BACKTESTERS = {'without_scaling': SwingBacktesterWithoutScaling, 'scaling': SwingBacktesterWithScaling}
+PARITY_COMBOS = [(1, 1), (3, 2), (4, 6), (8, 12)]
+# The scaling kernel averages a running price sum while the bar loop uses np.mean (pairwise
+# summation), so average entry prices and PnL may differ in the last bits
+PARITY_RTOL = 1e-9
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silence stdout at the file-descriptor level, so pool workers' progress prints are muted too.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+# Each scenario takes (df, workdir, options) and returns a callable to time; the callable
+# returns the number of trades it produced (or None)
+
+def process_all(variant):
+    def setup(df, workdir, options):
+        cls = BACKTESTERS[variant]
+
+        def timed():
+            cls(df, LAG, WINDOW)  # the constructor runs process_all()
+        return timed
+    return setup
+
+
+def run_backtest(variant, engine):
+    def setup(df, workdir, options):
+        bt = BACKTESTERS[variant](df, LAG, WINDOW)
+
+        def timed():
+            bt.run_backtest(engine=engine)
+            return len(bt.bt)
+        return timed
+    return setup
+
+
+def calculate_mae_mfe(variant):
+    def setup(df, workdir, options):
+        bt = BACKTESTERS[variant](df, LAG, WINDOW)
+        with quiet():
+            bt.run_backtest(engine='array')
+
+        def timed():
+            bt.calculate_mae_mfe()
+            return len(bt.bt)
+        return timed
+    return setup
+
+
+def _sweep_store(df, workdir, options):
+    store = TradeStore(os.path.join(workdir, "store"))
+    results = parallel_sweep(df, SWEEP_WINDOWS, SWEEP_LAGS, store=store, max_workers=options.workers)
+    return store, sum(count for _, _, count in results)
+
+
+def sweep(df, workdir, options):
+    return lambda: _sweep_store(df, workdir, options)[1]
+
+
+def summary(df, workdir, options):
+    store, trades = _sweep_store(df, workdir, options)
+    output = os.path.join(workdir, "summary.csv")
+
+    def timed():
+        generate_summary(store.path, output)
+        return trades
+    return timed
+
+
+SCENARIOS = {
+    'process_all.without_scaling': process_all('without_scaling'),
+    'process_all.scaling': process_all('scaling'),
+    'run_backtest.array.without_scaling': run_backtest('without_scaling', 'array'),
+    'run_backtest.array.scaling': run_backtest('scaling', 'array'),
+    'run_backtest.python.without_scaling': run_backtest('without_scaling', 'python'),
+    'run_backtest.python.scaling': run_backtest('scaling', 'python'),
+    'calculate_mae_mfe.without_scaling': calculate_mae_mfe('without_scaling'),
+    'calculate_mae_mfe.scaling': calculate_mae_mfe('scaling'),
+    'sweep_96': sweep,
+    'generate_summary_96': summary,
+}
+
+
+def _size_limit(name: str, options):
+    if '.python.' in name:
+        return options.python_max_bars
+    if name in ('sweep_96', 'generate_summary_96'):
+        return options.sweep_max_bars
+    return None
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'numba': numba_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(options):
+    results = []
+    names = [name for name in SCENARIOS if not options.scenarios or any(s in name for s in options.scenarios)]
+    for bars in options.sizes:
+        df = synthetic_ohlc(bars, volatility=options.volatility, seed=options.seed)
+        repeat = options.repeat if bars <= options.repeat_max_bars else 1
+        for name in names:
+            limit = _size_limit(name, options)
+            if limit is not None and bars > limit:
+                continue
+            with tempfile.TemporaryDirectory() as workdir:
+                with quiet():
+                    timed = SCENARIOS[name](df, workdir, options)
+                    timed()  # warm-up: JIT compilation, page cache
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        trades = timed()
+                        times.append(time.perf_counter() - start)
+            best = min(times)
+            result = {
+                'scenario': name,
+                'bars': bars,
+                'seconds': best,
+                'mean_seconds': sum(times) / len(times),
+                'repeat': repeat,
+                'bars_per_sec': bars / best if best > 0 else None,
+                'trades': trades,
+            }
+            results.append(result)
+            print(f"✅ {name:<38} {bars:>11,} bars  {best:9.4f}s  {result['bars_per_sec'] or 0:>14,.0f} bars/s")
+    report = {'environment': environment(), 'options': {k: v for k, v in vars(options).items() if k != 'func'},
+              'results': results}
+    os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n🚀 Results saved to {options.output}")
+    return report
+
+
+def compare(options):
+    """
+    Ratio new/old of every (scenario, bars) in both files; above 1 + threshold is a regression.
+
+    Scenarios faster than --min-seconds in both runs are reported but never flagged (timer noise),
+    and a changed trade count is flagged too, since the runs no longer do the same work.
+    """
+    with open(options.baseline) as f:
+        old = {(r['scenario'], r['bars']): r for r in json.load(f)['results']}
+    with open(options.candidate) as f:
+        new = {(r['scenario'], r['bars']): r for r in json.load(f)['results']}
+    regressions = 0
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[1], k[0])):
+        before, after = old[key]['seconds'], new[key]['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        if max(before, after) < options.min_seconds:
+            flag = ''
+        elif ratio > 1 + options.threshold:
+            flag = '❌ regression'
+            regressions += 1
+        elif ratio < 1 - options.threshold:
+            flag = '🚀 faster'
+        else:
+            flag = ''
+        if old[key]['trades'] != new[key]['trades']:
+            flag += f"  ⚠️ trades {old[key]['trades']} -> {new[key]['trades']}"
+            regressions += 1
+        print(f"{key[0]:<38} {key[1]:>11,}  {before:9.4f}s -> {after:9.4f}s  x{ratio:5.2f}  {flag}")
+    missing = old.keys() - new.keys()
+    if missing:
+        print(f"⚠️ {len(missing)} scenario/size pairs of {options.baseline} not in {options.candidate}")
+    print(f"\n{'❌' if regressions else '✅'} {regressions} regression(s) above {options.threshold:.0%}")
+    return regressions
+
+
+def engine_parity(df: pd.DataFrame, window: int, lag: int, variant: str):
+    """
+    Assert the 'array' engine's trade log equals the 'python' bar loop's (floats within PARITY_RTOL).
+    """
+    logs = []
+    for engine in ('python', 'array'):
+        bt = BACKTESTERS[variant](df, lag, window)
+        with quiet():
+            bt.run_backtest(engine=engine)
+        logs.append(bt.bt)
+    pd.testing.assert_frame_equal(logs[1], logs[0], check_dtype=False, rtol=PARITY_RTOL, atol=0)
+    return len(logs[0])
+
+
+def portfolio_parity(df: pd.DataFrame, workdir: str, sizing: str):
+    """
+    Assert simulate_portfolio() sizes the same trades the same way whether they were loaded from a
+    folder of trade CSVs or from a TradeStore (float64 prices, so both hold the same values).
+    """
+    capital = 100_000.0
+    csv_dir = os.path.join(workdir, 'csv')
+    store = TradeStore(os.path.join(workdir, 'store'), price_dtype=np.float64)
+    if not store.partitions():
+        with quiet():
+            for window, lag in PARITY_COMBOS:
+                bt = SwingBacktesterWithScaling(df, lag, window)
+                bt.run_backtest(engine='array')
+                save_trades(bt.bt, csv_dir, lag, window)
+                save_trades(bt.bt, None, lag, window, store=store)
+    runs = []
+    for folder in (csv_dir, store.path):
+        trades = load_trades(folder).sort_values(['Lag', 'Window', 'Entry Time'], kind='stable', ignore_index=True)
+        with quiet():
+            runs.append(simulate_portfolio(trades, {'gold': df}, capital, sizing))
+    (csv_sized, csv_curve, _), (store_sized, store_curve, _) = runs
+    columns = ['Lag', 'Window', 'Entry Time', 'Exit Time', 'Risk', 'Size', 'Sized PnL']
+    pd.testing.assert_frame_equal(csv_sized[columns], store_sized[columns], check_dtype=False,
+                                  rtol=PARITY_RTOL, atol=0)
+    # marks net out to ~0 between positions, so the curve is compared on the scale of the account
+    pd.testing.assert_frame_equal(csv_curve, store_curve, check_index_type=False, rtol=PARITY_RTOL,
+                                  atol=PARITY_RTOL * capital)
+    return len(csv_sized)
+
+
+def parity(options):
+    df = synthetic_ohlc(options.bars, options.volatility, options.seed)
+    for variant in BACKTESTERS:
+        for window, lag in PARITY_COMBOS:
+            trades = engine_parity(df, window, lag, variant)
+            print(f"✅ {variant} lag={lag} win={window}: array engine matches the bar loop ({trades} trades)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for sizing in SIZING_RULES:
+            trades = portfolio_parity(df, workdir, sizing)
+            print(f"✅ portfolio {sizing}: trade CSVs and TradeStore size the same ({trades} trades)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+
+    cmp = sub.add_parser('compare', help="flag regressions between two result files")
+    cmp.add_argument('baseline')
+    cmp.add_argument('candidate')
+    cmp.add_argument('--threshold', type=float, default=0.10, help="relative slowdown tolerated (default 0.10)")
+    cmp.add_argument('--min-seconds', type=float, default=0.01, help="never flag scenarios faster than this")
+
+    par = sub.add_parser('parity', help="check the array engine against the bar loop, and portfolio sizing of "
+                                        "trade CSVs against a TradeStore, on synthetic bars")
+    par.add_argument('--bars', type=parse_size, default=20_000)
+    par.add_argument('--volatility', type=float, default=0.5)
+    par.add_argument('--seed', type=int, default=0)
+
+    parser.add_argument('--sizes', default='10k,100k,1M,10M', help="comma separated bar counts, e.g. 10k,1M")
+    parser.add_argument('--scenarios', default='', help="comma separated substrings of scenario names to run")
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per scenario; the best is reported")
+    parser.add_argument('--repeat-max-bars', type=int, default=1_000_000, help="above this size, time once")
+    parser.add_argument('--python-max-bars', type=int, default=100_000, help="largest size for the bar loop")
+    parser.add_argument('--sweep-max-bars', type=int, default=10_000_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--volatility', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(argv)
+
+    if options.command == 'compare':
+        return 1 if compare(options) else 0
+    if options.command == 'parity':
+        parity(options)
+        return 0
+    options.sizes = [parse_size(size) for size in options.sizes.split(',')]
+    options.scenarios = [s for s in options.scenarios.split(',') if s]
+    run(options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
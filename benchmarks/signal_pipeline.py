@@ -0,0 +1,76 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backtesting_without_scaling import SwingBacktesterWithoutScaling
+from backtesting_scaling import SwingBacktesterWithScaling
+from benchmarks.synthetic import synthetic_ohlc
+from features import FEATURE_COLUMNS
+
+
+
+def legacy_process_all(df: pd.DataFrame, lag: int, window: int, scaling: bool) -> pd.DataFrame:
+    """
+    The previous process_all: object-dtype swing flags and 'Bearish_Grab'/'Bullish_Grab'/None labels.
+    """
+    data = df.copy()
+    span = 2 * window + 1
+    max_h = data['h'].rolling(window=span, center=True, min_periods=1).max()
+    min_l = data['l'].rolling(window=span, center=True, min_periods=1).min()
+    if scaling:
+        data['is_swing_high'] = data['h'] == max_h.shift(window + lag)
+        data['is_swing_low'] = data['l'] == min_l.shift(window + lag)
+    else:
+        data['is_swing_high'] = (data['h'] == max_h).shift(lag)
+        data['is_swing_low'] = (data['l'] == min_l).shift(lag)
+    data['swing_high_level'] = pd.Series(np.where(data['is_swing_high'], data['h'], np.nan), index=data.index).ffill()
+    data['swing_low_level'] = pd.Series(np.where(data['is_swing_low'], data['l'], np.nan), index=data.index).ffill()
+    conds = [data['l'] < data['swing_low_level'], data['h'] > data['swing_high_level']]
+    data['liquidity_grab'] = np.select(conds, ['Bearish_Grab', 'Bullish_Grab'], default=None)
+    grab_prev = data['liquidity_grab'].shift(window + lag + 1 if scaling else 1)
+    bull = (grab_prev == 'Bearish_Grab') & (data['c'] > data['o'])
+    bear = (grab_prev == 'Bullish_Grab') & (data['c'] < data['o'])
+    data['entry_signal'] = np.where(bull, 1, np.where(bear, -1, 0))
+    return data
+
+
+def measure(build):
+    """
+    (seconds, peak traced MiB, feature-column MiB) of a pipeline; timed and traced in separate runs.
+    """
+    start = time.perf_counter()
+    data = build()
+    elapsed = time.perf_counter() - start
+    del data
+    tracemalloc.start()
+    data = build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    columns = data[FEATURE_COLUMNS].memory_usage(index=False, deep=True).sum()
+    return elapsed, peak / 2 ** 20, columns / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Object-label vs int8/bool feature pipeline")
+    parser.add_argument("--bars", type=int, default=2_000_000)
+    parser.add_argument("--lag", type=int, default=3)
+    parser.add_argument("--window", type=int, default=4)
+    args = parser.parse_args()
+
+    df = synthetic_ohlc(args.bars)
+    print(f"🚀 {args.bars:,} bars, lag={args.lag}, window={args.window}")
+    for name, cls, scaling in [('without_scaling', SwingBacktesterWithoutScaling, False),
+                               ('scaling', SwingBacktesterWithScaling, True)]:
+        old = measure(lambda: legacy_process_all(df, args.lag, args.window, scaling))
+        new = measure(lambda: cls(df, args.lag, args.window).data)
+        print(f"📅 {name}")
+        for label, (elapsed, peak, columns) in [('object labels', old), ('int8/bool codes', new)]:
+            print(f"   {label:<16} {elapsed:7.2f}s  peak {peak:8.1f} MiB  feature columns {columns:7.1f} MiB")
+        print(f"   ✅ {old[0] / new[0]:.1f}x faster, {old[2] / new[2]:.1f}x smaller feature columns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+
+def synthetic_ohlc(n: int, volatility: float = 0.5, seed: int = 0, price: float = 1900.0,
+                   start: str = '2023-06-14', freq: str = '5min') -> pd.DataFrame:
+    """
+    Seeded random-walk OHLC bars shaped like the gold data.
+
+    :param n: number of bars
+    :param volatility: standard deviation of the close-to-close step (also scales the wicks)
+    :param seed: same seed, same bars
+    :return: DataFrame with ['o','h','l','c'] indexed by datetime 't'
+    """
+    rng = np.random.default_rng(seed)
+    c = price + np.cumsum(rng.normal(0, volatility, n)).round(2)
+    o = np.r_[c[:1], c[:-1]]
+    wick = 0.6 * volatility
+    h = np.maximum(o, c) + rng.exponential(wick, n).round(2)
+    l = np.minimum(o, c) - rng.exponential(wick, n).round(2)
+    index = pd.date_range(start, periods=n, freq=freq, name='t')
+    return pd.DataFrame({'o': o, 'h': h, 'l': l, 'c': c}, index=index)
+
+
+def write_ohlc_csv(df: pd.DataFrame, path: str):
+    """
+    Write bars in the data/ CSV layout ('t' as UNIX ms), e.g. to benchmark loading.
+    """
+    out = df.reset_index()
+    out['t'] = df.index.to_numpy(dtype='datetime64[ms]').view(np.int64)
+    out.to_csv(path, index=False)
+    return path
@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import load_raw_columns
+from features import rolling_extrema, swing_levels, liquidity_grabs, NO_GRAB, BEARISH_GRAB, BULLISH_GRAB
+from kernels import (
+    without_scaling_resume, scaling_resume, trade_excursions, excursion_mae_mfe, trades_to_frame, TRADE_DTYPE,
+    STATE_SIZE, ST_IN_POSITION, ST_ENTRY_BAR,
+)
+from sweep import VARIANTS
+
+
+class ChunkedFeatures:
+    """
+    process_all() features of one variant, computed block by block over full-length columns.
+
+    A block [start, stop) reads a halo of window + delay bars before it (and window - lag bars
+    after it for the non-scaling variant, whose centered window looks ahead of the lagged flag),
+    so its rolling extrema match the single-pass run. The last swing levels and the grabs still
+    waiting to turn into signals are carried from block to block.
+    """
+    def __init__(self, h, l, window: int, lag: int, variant: str = 'without_scaling'):
+        """
+        :param h: highs of the whole history, typically memory-mapped; only halo + block is read
+        :param l: lows of the whole history
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+        self.h = h
+        self.l = l
+        self.window = window
+        self.scaling = variant == 'scaling'
+        self.delay = window + lag if self.scaling else lag
+        self.high_level = np.nan
+        self.low_level = np.nan
+        self.grab_tail = np.full(window + lag + 1 if self.scaling else 1, NO_GRAB, dtype=np.int8)
+
+    def halo(self, start: int, stop: int):
+        """
+        [lo, hi) bars whose highs / lows the block [start, stop) reads.
+        """
+        return (max(0, start - self.delay - self.window),
+                min(len(self.h), max(stop, stop - self.delay + self.window)))
+
+    def block(self, start: int, stop: int, o: np.ndarray, c: np.ndarray, extrema=None):
+        """
+        (entry_signal, is_swing_high, is_swing_low, h, l) of bars [start, stop); blocks must come in order.
+
+        :param extrema: (lo, h, l, max_h, min_l) of this window over any range covering halo(), so
+                        the lags of one window can share one rolling pass
+        """
+        if extrema is None:
+            lo, hi = self.halo(start, stop)
+            h = np.array(self.h[lo:hi], dtype=np.float64)
+            l = np.array(self.l[lo:hi], dtype=np.float64)
+            max_h, min_l = rolling_extrema(h, l, self.window)
+        else:
+            lo, h, l, max_h, min_l = extrema
+
+        bars = slice(start - lo, stop - lo)
+        swing_high = self._flags(h, max_h, start, stop, lo)
+        swing_low = self._flags(l, min_l, start, stop, lo)
+        h, l = h[bars], l[bars]
+
+        high_levels = swing_levels(swing_high, h)
+        low_levels = swing_levels(swing_low, l)
+        high_levels[np.isnan(high_levels)] = self.high_level
+        low_levels[np.isnan(low_levels)] = self.low_level
+        if len(h):
+            self.high_level, self.low_level = high_levels[-1], low_levels[-1]
+
+        grabs = liquidity_grabs(h, l, high_levels, low_levels)
+        grab_prev = np.concatenate([self.grab_tail, grabs])
+        self.grab_tail = grab_prev[len(grab_prev) - len(self.grab_tail):]
+        grab_prev = grab_prev[:len(grabs)]
+        bull = (grab_prev == BEARISH_GRAB) & (c > o)
+        bear = (grab_prev == BULLISH_GRAB) & (c < o)
+        signal = np.where(bull, 1, np.where(bear, -1, 0)).astype(np.int8)
+        return signal, swing_high, swing_low, h, l
+
+    def _flags(self, price, extremum, start, stop, lo):
+        # bars whose lagged source bar lies before the history: True (non-scaling) / False (scaling)
+        skip = min(stop - start, max(0, self.delay - start))
+        src = slice(start + skip - self.delay - lo, stop - self.delay - lo)
+        flags = np.empty(stop - start, dtype=np.bool_)
+        flags[:skip] = not self.scaling
+        if self.scaling:
+            flags[skip:] = price[start + skip - lo:stop - lo] == extremum[src]
+        else:
+            flags[skip:] = price[src] == extremum[src]
+        return flags
+
+
+class BlockRunner:
+    """
+    Kernel state of one combo carried across consecutive blocks of bars.
+
+    Holds the open position (with its running entry-price sum), the previous block's last bar (the
+    kernels look one bar back) and the running excursion of the open trade, so trades and
+    MAE/MFE of every block equal those of a single run over the whole history.
+    """
+    def __init__(self, variant: str = 'without_scaling'):
+        self.scaling = variant == 'scaling'
+        self.state = np.zeros(STATE_SIZE)
+        self.prev = None                      # (signal, swing_high, swing_low, o, h, l) of the last bar run
+        self.run_high = self.run_low = np.nan  # excursion of the open position before the next block
+
+    def run(self, start: int, signal, swing_high, swing_low, o, h, l, with_mae_mfe: bool = True):
+        """
+        Trades closed in bars [start, start + len(signal)), and their MAE / MFE (None without with_mae_mfe).
+        """
+        h_bars, l_bars = h, l
+        offset = start
+        if self.prev is not None:
+            # prepend the previous block's last bar, which the kernels look back to
+            signal, swing_high, swing_low, o, h, l = (
+                np.concatenate([p, a]) for p, a in zip(self.prev, (signal, swing_high, swing_low, o, h, l))
+            )
+            offset = start - 1
+        self.prev = tuple(a[-1:] for a in (signal, swing_high, swing_low, o, h, l))
+
+        state = self.state
+        trades = np.empty(len(signal), dtype=TRADE_DTYPE)
+        if self.scaling:
+            k = scaling_resume(signal, o, h, l, swing_high, swing_low, trades, state, offset)
+        else:
+            k = without_scaling_resume(signal, o, h, l, trades, state, offset)
+        trades = trades[:k].copy()
+        if not with_mae_mfe:
+            return trades, None, None
+
+        max_high, min_low = trade_excursions(
+            h_bars, l_bars, np.maximum(trades['entry_bar'], start) - start, trades['exit_bar'] - start,
+        )
+        if k and trades['entry_bar'][0] < start:  # the position carried into this block
+            max_high[0] = np.fmax(max_high[0], self.run_high)
+            min_low[0] = np.fmin(min_low[0], self.run_low)
+        mae, mfe = excursion_mae_mfe(max_high, min_low, trades['entry_price'], trades['direction'] == 1)
+        if state[ST_IN_POSITION]:
+            entry_bar = int(state[ST_ENTRY_BAR])
+            first = max(entry_bar, start) - start
+            block_high, block_low = np.fmax.reduce(h_bars[first:]), np.fmin.reduce(l_bars[first:])
+            if entry_bar < start:
+                self.run_high, self.run_low = np.fmax(self.run_high, block_high), np.fmin(self.run_low, block_low)
+            else:
+                self.run_high, self.run_low = block_high, block_low
+        return trades, mae, mfe
+
+
+def run_chunked(o, h, l, c, t, time_dtype: str, lag: int, window: int, variant: str = 'without_scaling',
+                chunk_size: int = 1_000_000, with_mae_mfe: bool = True) -> pd.DataFrame:
+    """
+    Backtest full-length (memory-mapped) columns `chunk_size` bars at a time.
+
+    The open position, its entry-price sum and the running excursion of the open trade are
+    carried across blocks, so the trade log equals run_combo() on the whole history while only
+    O(chunk_size) bars are held in memory.
+
+    :param t: int64 epoch times of the bars, viewed as `time_dtype`
+    """
+    features = ChunkedFeatures(h, l, window, lag, variant)
+    runner = BlockRunner(variant)
+    n = len(o)
+    blocks, maes, mfes = [], [], []
+
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        o_block = np.array(o[start:stop], dtype=np.float64)
+        c_block = np.array(c[start:stop], dtype=np.float64)
+        signal, swing_high, swing_low, h_block, l_block = features.block(start, stop, o_block, c_block)
+        trades, mae, mfe = runner.run(start, signal, swing_high, swing_low, o_block, h_block, l_block, with_mae_mfe)
+        blocks.append(trades)
+        maes.append(mae)
+        mfes.append(mfe)
+
+    trades = np.concatenate(blocks) if blocks else np.empty(0, dtype=TRADE_DTYPE)
+    bt = trades_to_frame(np.asarray(t).view(time_dtype), trades, with_units=(variant == 'scaling'))
+    if not bt.empty:
+        bt['Cumulative PnL'] = bt['PnL'].cumsum()
+        bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+        if with_mae_mfe:
+            bt['MAE'], bt['MFE'] = np.concatenate(maes), np.concatenate(mfes)
+    return bt
+
+
+def chunked_backtest(csv_path: str, lag: int, window: int, variant: str = 'without_scaling',
+                     chunk_size: int = 1_000_000, with_mae_mfe: bool = True, cache_dir: str = None) -> pd.DataFrame:
+    """
+    run_backtest() + calculate_mae_mfe() for a history larger than memory, streamed from its binary cache.
+
+    The cache itself is built in blocks (data_loader.build_cache), so neither step holds the whole history.
+    """
+    columns, time_dtype = load_raw_columns(csv_path, cache_dir)
+    return run_chunked(columns['o'], columns['h'], columns['l'], columns['c'], columns['t'], time_dtype,
+                       lag, window, variant, chunk_size, with_mae_mfe)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from sweep import SweepData
+
+OHLC_COLUMNS = ['o', 'h', 'l', 'c']
+CACHE_VERSION = 2
+
+
+def _parse_ohlc(df: pd.DataFrame) -> pd.DataFrame:
+    if pd.api.types.is_numeric_dtype(df['t']) and df['t'].iloc[0] > 1e12:  # UNIX ms timestamp
+        df['t'] = pd.to_datetime(df['t'], unit='ms')
+    else:
+        df['t'] = pd.to_datetime(df['t'], format='%d-%m-%Y %H:%M')
+    df.set_index('t', inplace=True)
+    return df[OHLC_COLUMNS]  # Keep only OHLC
+
+
+def parse_ohlc_csv(csv_path: str) -> pd.DataFrame:
+    """
+    Read an OHLC CSV with a 't' column (UNIX ms or '%d-%m-%Y %H:%M') into a datetime-indexed frame.
+    """
+    return _parse_ohlc(pd.read_csv(csv_path))
+
+
+def iter_ohlc_csv(csv_path: str, chunk_rows: int = 1_000_000):
+    """
+    parse_ohlc_csv() in blocks of `chunk_rows` rows, for files larger than memory.
+    """
+    with pd.read_csv(csv_path, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _parse_ohlc(chunk)
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_cache_dir(csv_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".ohlc_cache", stem)
+
+
+def read_meta(cache_dir: str):
+    """
+    meta.json of a binary cache directory, or None if it is missing, unreadable or of another CACHE_VERSION.
+    """
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CACHE_VERSION else None
+
+
+def _cache_is_fresh(meta, csv_path: str, cache_dir: str) -> bool:
+    if meta is None:
+        return False
+    stat = os.stat(csv_path)
+    if meta['source_size'] != stat.st_size:
+        return False
+    if meta['source_mtime_ns'] == stat.st_mtime_ns:
+        return True
+    # touched but maybe not changed: fall back to the content hash and refresh the mtime on a match
+    if meta['source_digest'] != file_digest(csv_path):
+        return False
+    meta['source_mtime_ns'] = stat.st_mtime_ns
+    write_meta(cache_dir, meta)
+    return True
+
+
+def write_meta(cache_dir: str, meta):
+    """
+    Atomically replace the cache directory's meta.json; written last, it marks the cache complete.
+    """
+    tmp = os.path.join(cache_dir, "meta.json.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(cache_dir, "meta.json"))
+
+
+def build_cache(csv_path: str, cache_dir: str = None, chunk_rows: int = 1_000_000) -> str:
+    """
+    Parse the CSV once, `chunk_rows` rows at a time, and append float64 OHLC plus int64 epoch
+    times to raw column files, so building the cache never holds the whole history in memory.
+    """
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(csv_path)
+    digest = file_digest(csv_path)
+
+    # meta.json is written last, so a half-written cache is never picked up
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    rows = 0
+    time_dtype = 'datetime64[ns]'
+    files = {col: open(os.path.join(cache_dir, f"{col}.bin"), 'wb') for col in OHLC_COLUMNS + ['t']}
+    try:
+        for df in iter_ohlc_csv(csv_path, chunk_rows):
+            if rows == 0:
+                time_dtype = str(df.index.dtype)
+            for col in OHLC_COLUMNS:
+                df[col].to_numpy(dtype=np.float64).tofile(files[col])
+            df.index.to_numpy(dtype=time_dtype).view(np.int64).tofile(files['t'])
+            rows += len(df)
+    finally:
+        for f in files.values():
+            f.close()
+    write_meta(cache_dir, {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(csv_path),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_digest': digest,
+        'time_dtype': time_dtype,
+        'rows': rows,
+    })
+    return cache_dir
+
+
+def load_column(cache_dir: str, name: str, dtype, rows: int, mmap: bool):
+    """
+    Column `<name>.bin` of a cache directory, memory-mapped read-only or read into memory.
+    """
+    path = os.path.join(cache_dir, f"{name}.bin")
+    if not mmap:
+        return np.fromfile(path, dtype=dtype, count=rows)
+    if rows == 0:
+        return np.empty(0, dtype=dtype)  # np.memmap cannot map an empty file
+    return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+
+
+def load_raw_columns(csv_path: str, cache_dir: str = None, mmap: bool = True):
+    """
+    OHLC columns and int64 epoch times straight from the binary cache, (re)building it when the source changed.
+
+    :return: (dict of 'o','h','l','c' float64 and 't' int64 arrays, time dtype)
+    """
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    meta = read_meta(cache_dir)
+    if not _cache_is_fresh(meta, csv_path, cache_dir):
+        with stage('load.build_cache', bytes=os.path.getsize(csv_path)):
+            build_cache(csv_path, cache_dir)
+        meta = read_meta(cache_dir)
+    with stage('load', bars=meta['rows']):
+        columns = {col: load_column(cache_dir, col, np.float64, meta['rows'], mmap) for col in OHLC_COLUMNS}
+        columns['t'] = load_column(cache_dir, 't', np.int64, meta['rows'], mmap)
+    return columns, meta['time_dtype']
+
+
+def load_columns(csv_path: str, cache_dir: str = None, mmap: bool = True):
+    """
+    Memory-mapped OHLC columns for a CSV, (re)building the binary cache when the source changed.
+
+    :return: (dict of 'o','h','l','c' float64 arrays, DatetimeIndex)
+    """
+    columns, time_dtype = load_raw_columns(csv_path, cache_dir, mmap)
+    index = pd.DatetimeIndex(columns.pop('t').view(time_dtype), name='t')
+    return columns, index
+
+
+def load_ohlc(csv_path: str, cache_dir: str = None, mmap: bool = True) -> pd.DataFrame:
+    """
+    Drop-in replacement for read_csv + timestamp sniffing, served from the binary cache.
+    """
+    columns, index = load_columns(csv_path, cache_dir, mmap)
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def load_sweep_data(csv_path: str, cache_dir: str = None, feature_cache=None):
+    """
+    SweepData straight over the memory-mapped columns, without building a DataFrame.
+    """
+    columns, index = load_columns(csv_path, cache_dir)
+    return SweepData(columns['o'], columns['h'], columns['l'], columns['c'], index, feature_cache)
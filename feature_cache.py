@@ -0,0 +1,129 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from features import FEATURE_COLUMNS
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Part of every key: bump whenever features.py, pivots.py or the backtesters' process_all() change
+# what they compute, so entries of the old pipeline are never served (they age out through eviction)
+FEATURE_VERSION = 1
+
+
+def ohlc_digest(o, h, l, c, chunk_rows: int = 1 << 20) -> str:
+    """
+    Content hash of the OHLC values (timestamps do not affect the features), read in blocks
+    so memory-mapped columns are never copied whole.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.int64(len(o)).tobytes())
+    for values in (o, h, l, c):
+        for start in range(0, len(values), chunk_rows):
+            digest.update(np.ascontiguousarray(values[start:start + chunk_rows], dtype=np.float64).data)
+    return digest.hexdigest()
+
+
+def frame_digest(df) -> str:
+    return ohlc_digest(*(df[col].to_numpy(dtype=np.float64) for col in ['o', 'h', 'l', 'c']))
+
+
+class FeatureCache:
+    """
+    Persistent process_all() feature arrays keyed by (OHLC digest, FEATURE_VERSION, variant, window, lag).
+
+    Every entry is a directory of .npy files, loaded memory-mapped. Entries are written to a
+    temporary directory and renamed into place, so concurrent sweep workers never see half an
+    entry. A hit refreshes the entry's mtime, and after each write the least recently used
+    entries are evicted until the cache fits in `max_bytes`.
+    """
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(digest: str, window: int, lag: int, variant: str) -> str:
+        return f"{digest}_v{FEATURE_VERSION}_{variant}_win{window}_lag{lag}"
+
+    def get(self, key: str):
+        """
+        {column: read-only memory-mapped array} of a cached entry, or None on a miss.
+
+        An entry missing any FEATURE_COLUMNS (caught mid-eviction by another process) is a miss.
+        """
+        entry = os.path.join(self.path, key)
+        try:
+            arrays = {os.path.splitext(file)[0]: np.load(os.path.join(entry, file), mmap_mode='r')
+                      for file in os.listdir(entry) if file.endswith('.npy')}
+            os.utime(entry)
+        except (OSError, ValueError):  # missing, or evicted by another process while reading
+            return None
+        if any(col not in arrays for col in FEATURE_COLUMNS):
+            return None
+        return arrays
+
+    def put(self, key: str, arrays) -> str:
+        """
+        Store {column: array} under `key` (a no-op if another writer got there first), then evict.
+        """
+        entry = os.path.join(self.path, key)
+        if not os.path.isdir(entry):
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+            for name, values in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(values))
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+        return entry
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Cached arrays for `key`, or compute() -> {column: array}, stored before being returned.
+        """
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+    def entries(self):
+        """
+        (mtime, size in bytes, key) of every entry, least recently used first.
+        """
+        found = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith('.tmp-') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+                found.append((os.path.getmtime(entry), size, key))
+            except OSError:
+                continue
+        return sorted(found)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: str = None):
+        """
+        Drop least recently used entries until the cache fits in max_bytes (`keep` is never dropped).
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, key in self.entries():
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
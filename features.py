@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+# liquidity_grab codes; labels are only attached on export (grab_labels)
+NO_GRAB, BEARISH_GRAB, BULLISH_GRAB = 0, 1, 2
+GRAB_LABELS = np.array([None, 'Bearish_Grab', 'Bullish_Grab'], dtype=object)
+
+# Columns process_all() adds to the backtesters' data
+FEATURE_COLUMNS = ['is_swing_high', 'is_swing_low', 'swing_high_level', 'swing_low_level',
+                   'liquidity_grab', 'entry_signal']
+
+
+def rolling_extrema(h, l, window: int):
+    """
+    Centered rolling max of highs / min of lows over 2 * window + 1 bars.
+
+    Depends only on `window`, so a sweep computes it once and reuses it for every lag.
+    """
+    span = 2 * window + 1
+    h = pd.Series(h, copy=False)
+    l = pd.Series(l, copy=False)
+    max_h = h.rolling(window=span, center=True, min_periods=1).max().to_numpy(dtype=np.float64)
+    min_l = l.rolling(window=span, center=True, min_periods=1).min().to_numpy(dtype=np.float64)
+    return max_h, min_l
+
+
+def shift_flags(flags: np.ndarray, periods: int, fill) -> np.ndarray:
+    """
+    Series.shift(periods) for bool / code arrays without upcasting: the first `periods` bars get `fill`.
+    """
+    if periods == 0:
+        return flags
+    out = np.empty_like(flags)
+    out[:periods] = fill
+    out[periods:] = flags[:-periods]
+    return out
+
+
+def swing_levels(flags: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """
+    Price at the most recent flagged bar, NaN before the first one (np.where + ffill).
+    """
+    valid = flags & ~np.isnan(price)
+    last = np.where(valid, np.arange(len(price)), -1)
+    np.maximum.accumulate(last, out=last)
+    levels = price[last]
+    levels[last < 0] = np.nan
+    return levels
+
+
+def liquidity_grabs(h, l, swing_high_level, swing_low_level) -> np.ndarray:
+    """
+    int8 grab codes: BEARISH_GRAB where the low breaks the swing low, else BULLISH_GRAB
+    where the high breaks the swing high, else NO_GRAB.
+    """
+    bearish = l < swing_low_level
+    bullish = ~bearish & (h > swing_high_level)
+    return np.where(bearish, BEARISH_GRAB, np.where(bullish, BULLISH_GRAB, NO_GRAB)).astype(np.int8)
+
+
+def signals_from_grabs(o, c, grabs: np.ndarray, grab_shift: int) -> np.ndarray:
+    """
+    +1 / -1 / 0 entry signal from grab codes seen `grab_shift` bars earlier.
+    """
+    grab_prev = shift_flags(grabs, grab_shift, NO_GRAB)
+    bull = (grab_prev == BEARISH_GRAB) & (c > o)
+    bear = (grab_prev == BULLISH_GRAB) & (c < o)
+    return np.where(bull, 1, np.where(bear, -1, 0)).astype(np.int8)
+
+
+def entry_signals(o, h, l, c, swing_high_level, swing_low_level, grab_shift: int) -> np.ndarray:
+    """
+    +1 / -1 / 0 entry signal from liquidity grabs seen `grab_shift` bars earlier.
+    """
+    return signals_from_grabs(o, c, liquidity_grabs(h, l, swing_high_level, swing_low_level), grab_shift)
+
+
+def grab_labels(grabs) -> pd.Series:
+    """
+    'Bearish_Grab' / 'Bullish_Grab' / None labels for grab codes, for export only.
+    """
+    index = grabs.index if isinstance(grabs, pd.Series) else None
+    return pd.Series(GRAB_LABELS.take(np.asarray(grabs)), index=index, dtype=object)
+
+
+def delayed_swing_flags(price, extremum, delay: int) -> np.ndarray:
+    """
+    price == extremum.shift(delay) as bool; the first `delay` bars compare against NaN and are False.
+    """
+    flags = np.zeros(len(price), dtype=np.bool_)
+    if delay < len(price):
+        flags[delay:] = price[delay:] == extremum[:len(price) - delay]
+    return flags
+
+
+def without_scaling_features(o, h, l, c, max_h, min_l, lag: int):
+    """
+    Entry signal and swing flags of SwingBacktesterWithoutScaling.process_all from shared extrema.
+
+    The first `lag` bars have no lagged pivot and count as swings.
+    """
+    swing_high = shift_flags(h == max_h, lag, True)
+    swing_low = shift_flags(l == min_l, lag, True)
+    signal = entry_signals(o, h, l, c, swing_levels(swing_high, h), swing_levels(swing_low, l), 1)
+    return signal, swing_high, swing_low
+
+
+def scaling_features(o, h, l, c, max_h, min_l, window: int, lag: int):
+    """
+    Entry signal and swing flags of SwingBacktesterWithScaling.process_all from shared extrema.
+    """
+    delay = window + lag
+    swing_high = delayed_swing_flags(h, max_h, delay)
+    swing_low = delayed_swing_flags(l, min_l, delay)
+    signal = entry_signals(o, h, l, c, swing_levels(swing_high, h), swing_levels(swing_low, l), delay + 1)
+    return signal, swing_high, swing_low
+
+
+def feature_arrays(o, h, l, c, max_h, min_l, window: int, lag: int, variant: str = 'without_scaling'):
+    """
+    Every FEATURE_COLUMNS array of a variant's process_all, keyed by column name.
+    """
+    if variant == 'scaling':
+        swing_high = delayed_swing_flags(h, max_h, window + lag)
+        swing_low = delayed_swing_flags(l, min_l, window + lag)
+        grab_shift = window + lag + 1
+    else:
+        swing_high = shift_flags(h == max_h, lag, True)
+        swing_low = shift_flags(l == min_l, lag, True)
+        grab_shift = 1
+    swing_high_level = swing_levels(swing_high, h)
+    swing_low_level = swing_levels(swing_low, l)
+    grabs = liquidity_grabs(h, l, swing_high_level, swing_low_level)
+    return {
+        'is_swing_high': swing_high,
+        'is_swing_low': swing_low,
+        'swing_high_level': swing_high_level,
+        'swing_low_level': swing_low_level,
+        'liquidity_grab': grabs,
+        'entry_signal': signals_from_grabs(o, c, grabs, grab_shift),
+    }
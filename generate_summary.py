@@ -3,91 +3,224 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 import glob
+import re
 import concurrent.futures
 import warnings
 
 
 from backtesting_without_scaling import SwingBacktesterWithoutScaling  # assuming the class is in this file/module
+from instrumentation import stage
+from trade_store import TradeStore
 
-def safe_divide(a, b):
-    return a / b if b != 0 else np.nan
+# `<symbol>_lag<lag>_win<window>.csv`, symbols may contain underscores
+_TRADE_LOG = re.compile(r"^(?P<symbol>.+)_lag(?P<lag>\d+)_win(?P<window>\d+)\.csv$")
 
 
-def generate_summary(trades_folder, output_file):
-    pattern = os.path.join(trades_folder, "*.csv")
-    summary_rows = []
+SUMMARY_COLUMNS = [
+    'Total Trades',
+    # 'Total Units',
+    'Win Rate (%)',
+    'Total PnL',
+    'Average PnL',
+    'Max Drawdown',
+    'Risk-Reward',
+    'Avg Win',
+    'Avg Loss',
+    'Average MAE',
+    'Max MAE',
+    'Average MFE',
+    'Max MFE',
+    'Winning PnL',
+    'Losing PnL',
+    'Avg Trade Efficiency (%)',
+    'Sharpe-like Ratio',
+    'Sortino Ratio',
+    'Expectancy',
+    'Normalized PnL',
+    # 'PnL per Unit',
+    'Efficiency Ratio',
+]
 
-    for file in glob.glob(pattern):
-        filename = os.path.basename(file)
-        parts = filename.replace(".csv", "").split("_")
 
-        try:
-            lag = int(parts[1].replace("lag", ""))
-            window = int(parts[2].replace("win", ""))
-        except ValueError:
-            continue
+def _safe_divide(a, b):
+    return np.where(b != 0, a / np.where(b != 0, b, 1), np.nan)
 
-        df = pd.read_csv(file)
-        if df.empty:
-            continue
 
-        total_trades = len(df)
-        win_trades = (df['PnL'] > 0).sum()
-        win_rate = win_trades / total_trades * 100
-        total_pnl = df['PnL'].sum()
-        avg_pnl = df['PnL'].mean()
-        max_drawdown = (df['Cumulative PnL'].cummax() - df['Cumulative PnL']).max()
-        avg_win = df.loc[df['PnL'] > 0, 'PnL'].mean()
-        avg_loss = df.loc[df['PnL'] < 0, 'PnL'].mean()
-        rr = abs(avg_win) / abs(avg_loss) if avg_loss != 0 else float('inf')
-        avg_mae = df['MAE'].mean()
-        max_mae = df['MAE'].min()
-        avg_mfe = df['MFE'].mean()
-        max_mfe = df['MFE'].max()
-        winning_pnl = df.loc[df['PnL'] > 0, 'PnL'].sum()
-        losing_pnl = df.loc[df['PnL'] < 0, 'PnL'].sum()
-        efficiency = (df['PnL'] / df['MFE'].replace(0, float('nan'))) * 100
-        avg_efficiency = efficiency.mean()
-        # total_units = df['Units'].sum()
-
-        sharpe_like = safe_divide(avg_pnl, np.std([avg_win, abs(avg_loss)]))
-        expectancy = (win_rate / 100) * avg_win + (1 - win_rate / 100) * avg_loss
-        normalized_pnl = safe_divide(total_pnl, total_trades)
-        # pnl_per_unit = safe_divide(total_pnl, total_units)
-        efficiency_ratio = safe_divide(avg_pnl, abs(avg_mae))
-
-        downside_returns = df[df['PnL'] < 0]['PnL']
-        downside_deviation = downside_returns.std() if not downside_returns.empty else 0
-        sortino_ratio = safe_divide(avg_pnl, downside_deviation)
-
-        summary_rows.append({
-            'Lag': lag,
-            'Window': window,
-            'Total Trades': total_trades,
-            # 'Total Units': total_units,
+def summary_metrics(trades, wins, losses, total_pnl, win_pnl, loss_pnl, loss_m2, max_drawdown, mae_sum, mae_min,
+                    mfe_sum, mfe_max, efficiency_sum, efficiency_trades):
+    """
+    {SUMMARY_COLUMNS: values} from per-combo aggregates, numbers or arrays with one entry per combo.
+
+    Shared by summarize() and incremental.RunningSummary, so a summary of whole trade logs and one
+    kept up to date trade by trade use the same formulas.
+
+    :param loss_m2: sum of the losing trades' squared deviations from their mean
+    :param mae_min: most negative MAE (the 'Max MAE' column)
+    :param efficiency_sum: sum of PnL / MFE * 100 over the efficiency_trades trades with a non-zero MFE
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_pnl = total_pnl / trades
+        avg_win = win_pnl / np.where(wins > 0, wins, np.nan)
+        avg_loss = loss_pnl / np.where(losses > 0, losses, np.nan)
+        # sample std of the losing trades (ddof=1)
+        loss_var = loss_m2 / np.where(losses > 1, losses - 1, np.nan)
+        # no losing trades: downside deviation counts as 0, which makes the ratio NaN
+        downside_deviation = np.where(losses > 0, np.sqrt(loss_var), 0)
+
+        win_rate = wins / trades * 100
+        # np.std([avg_win, abs(avg_loss)]) spelled out per combo
+        pair_mean = (avg_win + np.abs(avg_loss)) / 2
+        pair_std = np.sqrt(((avg_win - pair_mean) ** 2 + (np.abs(avg_loss) - pair_mean) ** 2) / 2)
+        avg_mae = mae_sum / trades
+        return {
+            'Total Trades': trades,
             'Win Rate (%)': win_rate,
             'Total PnL': total_pnl,
             'Average PnL': avg_pnl,
             'Max Drawdown': max_drawdown,
-            'Risk-Reward': rr,
+            'Risk-Reward': np.where(avg_loss != 0, np.abs(avg_win) / np.abs(avg_loss), np.inf),
             'Avg Win': avg_win,
             'Avg Loss': avg_loss,
             'Average MAE': avg_mae,
-            'Max MAE': max_mae,
-            'Average MFE': avg_mfe,
-            'Max MFE': max_mfe,
-            'Winning PnL': winning_pnl,
-            'Losing PnL': losing_pnl,
-            'Avg Trade Efficiency (%)': avg_efficiency,
-            'Sharpe-like Ratio': sharpe_like,
-            'Sortino Ratio': sortino_ratio,
-            'Expectancy': expectancy,
-            'Normalized PnL': normalized_pnl,
-            # 'PnL per Unit': pnl_per_unit,
-            'Efficiency Ratio': efficiency_ratio
-        })
-
-    summary_df = pd.DataFrame(summary_rows)
+            'Max MAE': mae_min,
+            'Average MFE': mfe_sum / trades,
+            'Max MFE': mfe_max,
+            'Winning PnL': win_pnl,
+            'Losing PnL': loss_pnl,
+            'Avg Trade Efficiency (%)': efficiency_sum / np.where(efficiency_trades > 0, efficiency_trades, np.nan),
+            'Sharpe-like Ratio': _safe_divide(avg_pnl, pair_std),
+            'Sortino Ratio': _safe_divide(avg_pnl, downside_deviation),
+            'Expectancy': (win_rate / 100) * avg_win + (1 - win_rate / 100) * avg_loss,
+            'Normalized PnL': _safe_divide(total_pnl, trades),
+            'Efficiency Ratio': _safe_divide(avg_pnl, np.abs(avg_mae)),
+        }
+
+
+def summarize(trades, keys=('Lag', 'Window')):
+    """
+    Summary metrics for every combo of a trades table in one grouped pass.
+
+    :param trades: trade logs of all combos stacked, with key columns (e.g. 'Lag', 'Window'); each
+                   combo's trades must be in trade order. 'Cumulative PnL' is recomputed per combo
+                   when missing.
+    :return: one row per combo, key columns first, in order of first appearance
+    """
+    keys = list(keys)
+    if 'Symbol' in trades and 'Symbol' not in keys:
+        keys = ['Symbol'] + keys
+    if trades.empty:
+        return pd.DataFrame(columns=keys + SUMMARY_COLUMNS)
+
+    group = trades.groupby(keys, sort=False, observed=True).ngroup().to_numpy()
+    order = None
+    if np.any(np.diff(group) < 0):
+        # combos are interleaved: make each one contiguous, keeping trade order inside it
+        order = np.argsort(group, kind='stable')
+        group = group[order]
+
+    def column(name):
+        values = trades[name].to_numpy(dtype=np.float64)
+        return values if order is None else values[order]
+
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    total_trades = np.diff(np.r_[starts, len(group)])
+    pnl = column('PnL')
+    mae = column('MAE')
+    mfe = column('MFE')
+    if 'Cumulative PnL' in trades:
+        cum = column('Cumulative PnL')
+    else:
+        cum = pd.Series(pnl).groupby(group).cumsum().to_numpy()
+    drawdown = pd.Series(cum).groupby(group).cummax().to_numpy() - cum
+
+    def seg_sum(values):
+        return np.add.reduceat(values, starts)
+
+    is_win = pnl > 0
+    is_loss = pnl < 0
+    win_trades = seg_sum(is_win.astype(np.int64))
+    loss_trades = seg_sum(is_loss.astype(np.int64))
+    losing_pnl = seg_sum(np.where(is_loss, pnl, 0.0))
+    efficiency = pnl / np.where(mfe == 0, np.nan, mfe) * 100
+    has_efficiency = ~np.isnan(efficiency)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # losing trades' squared deviations from their mean, two-pass like pandas
+        loss_mean = losing_pnl / np.where(loss_trades > 0, loss_trades, np.nan)
+        loss_dev = np.where(is_loss, pnl - np.repeat(loss_mean, total_trades), 0.0)
+
+    first_rows = starts if order is None else order[starts]
+    summary = trades.iloc[first_rows][keys].reset_index(drop=True)
+    metrics = pd.DataFrame(summary_metrics(
+        trades=total_trades, wins=win_trades, losses=loss_trades, total_pnl=seg_sum(pnl),
+        win_pnl=seg_sum(np.where(is_win, pnl, 0.0)), loss_pnl=losing_pnl, loss_m2=seg_sum(loss_dev ** 2),
+        max_drawdown=np.fmax.reduceat(drawdown, starts), mae_sum=seg_sum(mae), mae_min=np.fmin.reduceat(mae, starts),
+        mfe_sum=seg_sum(mfe), mfe_max=np.fmax.reduceat(mfe, starts),
+        efficiency_sum=seg_sum(np.where(has_efficiency, efficiency, 0.0)),
+        efficiency_trades=seg_sum(has_efficiency.astype(np.int64)),
+    ))
+    return pd.concat([summary, metrics], axis=1)
+
+
+def summarize_sweep(results, keys=('Lag', 'Window')):
+    """
+    In-memory summary straight from a sweep's (lag, window, trade log) results, without touching disk.
+
+    (symbol, lag, window, trade log) results add a 'Symbol' column.
+    """
+    logs = [result for result in results if isinstance(result[-1], pd.DataFrame) and not result[-1].empty]
+    if not logs:
+        return summarize(pd.DataFrame(), keys)
+    # stack only the columns the metrics read instead of concatenating whole trade logs
+    sizes = [len(result[-1]) for result in logs]
+    columns = {}
+    if len(logs[0]) == 4:
+        columns['Symbol'] = pd.Categorical(np.repeat([result[0] for result in logs], sizes))
+    columns['Lag'] = np.repeat([result[-3] for result in logs], sizes)
+    columns['Window'] = np.repeat([result[-2] for result in logs], sizes)
+    for col in ['PnL', 'Cumulative PnL', 'MAE', 'MFE']:
+        columns[col] = np.concatenate([result[-1][col].to_numpy(dtype=np.float64) for result in logs])
+    return summarize(pd.DataFrame(columns), keys)
+
+
+def _iter_trade_logs(trades_folder):
+    for file in glob.glob(os.path.join(trades_folder, "*.csv")):
+        match = _TRADE_LOG.match(os.path.basename(file))
+        if match is None:
+            continue
+        yield match['symbol'], int(match['lag']), int(match['window']), pd.read_csv(file)
+
+
+def load_trades(trades_folder):
+    """
+    Every trade log of a folder of per-combo CSVs or a TradeStore, stacked with Symbol / Lag / Window columns.
+    """
+    with stage('generate_summary.load') as timer:
+        if TradeStore.is_store(trades_folder):
+            trades = TradeStore(trades_folder).read()
+        else:
+            trades = pd.concat([df.assign(Symbol=symbol, Lag=lag, Window=window)
+                                for symbol, lag, window, df in _iter_trade_logs(trades_folder)
+                                if not df.empty] or [pd.DataFrame()], ignore_index=True)
+            # CSVs hold the times as text; a TradeStore gives them back as datetimes
+            for col in ('Entry Time', 'Exit Time'):
+                if col in trades:
+                    trades[col] = pd.to_datetime(trades[col])
+        timer.add(trades=len(trades))
+    return trades
+
+
+def generate_summary(trades_folder, output_file):
+    """
+    :param trades_folder: folder of per-combo trade CSVs, or a TradeStore directory
+    :return: one row per (Symbol, Lag, Window)
+    """
+    trades = load_trades(trades_folder)
+
+    with stage('generate_summary.summarize', trades=len(trades)):
+        summary_df = summarize(trades)
     # summary_df.sort_values(by=["Lag", "Window"], inplace=True)
-    summary_df.to_csv(output_file, index=False)
+    with stage('generate_summary.write') as timer:
+        summary_df.to_csv(output_file, index=False)
+        timer.add(bytes=os.path.getsize(output_file))
     print(f"\n🚀 Final summary saved to {output_file}")
+    return summary_df
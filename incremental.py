@@ -0,0 +1,337 @@
+import copy
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from chunked import BlockRunner, ChunkedFeatures
+from generate_summary import SUMMARY_COLUMNS, summary_metrics
+from instrumentation import stage
+from kernels import trades_to_frame, TRADE_DTYPE, STATE_SIZE
+from pruning import RunningMetrics
+from sweep import VARIANTS
+
+warnings.filterwarnings('ignore')
+
+
+class RunningSummary(RunningMetrics):
+    """
+    Every generate_summary metric of a growing trade log, from aggregates updated in O(new trades).
+
+    On top of the RunningMetrics counts, PnL and drawdown, it keeps the losing trades' sum of
+    squared deviations (merged batch by batch, for the Sortino ratio's sample std) and the
+    MAE / MFE / trade efficiency sums and extremes.
+    """
+    FIELDS = ('trades', 'wins', 'losses', 'win_pnl', 'loss_pnl', 'cumulative', 'peak', 'max_drawdown', 'loss_m2',
+              'mae_sum', 'mae_min', 'mfe_sum', 'mfe_max', 'efficiency_sum', 'efficiency_trades')
+
+    def __init__(self):
+        super().__init__()
+        self.loss_m2 = 0.0
+        self.mae_sum = 0.0
+        self.mae_min = np.nan
+        self.mfe_sum = 0.0
+        self.mfe_max = np.nan
+        self.efficiency_sum = 0.0
+        self.efficiency_trades = 0
+
+    def update(self, pnl, mae=None, mfe=None):
+        pnl = np.asarray(pnl, dtype=np.float64)
+        if len(pnl) == 0:
+            return
+        losses = pnl[pnl < 0]
+        if len(losses):
+            # Chan et al. pairwise update of the losses' squared deviations
+            mean = self.loss_pnl / self.losses if self.losses else 0.0
+            batch_mean = losses.mean()
+            self.loss_m2 += (((losses - batch_mean) ** 2).sum()
+                             + (batch_mean - mean) ** 2 * self.losses * len(losses) / (self.losses + len(losses)))
+        super().update(pnl)
+        if mae is not None:
+            self.mae_sum += mae.sum()
+            self.mae_min = np.fmin(self.mae_min, np.fmin.reduce(mae))
+        if mfe is not None:
+            self.mfe_sum += mfe.sum()
+            self.mfe_max = np.fmax(self.mfe_max, np.fmax.reduce(mfe))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                efficiency = pnl / np.where(mfe == 0, np.nan, mfe) * 100
+            valid = ~np.isnan(efficiency)
+            self.efficiency_sum += efficiency[valid].sum()
+            self.efficiency_trades += int(valid.sum())
+
+    def row(self) -> dict:
+        """
+        SUMMARY_COLUMNS of the trades so far, from generate_summary.summary_metrics().
+        """
+        # NumPy scalars, so empty counts divide to NaN instead of raising
+        row = summary_metrics(
+            trades=np.int64(self.trades), wins=np.int64(self.wins), losses=np.int64(self.losses),
+            total_pnl=np.float64(self.cumulative), win_pnl=np.float64(self.win_pnl),
+            loss_pnl=np.float64(self.loss_pnl), loss_m2=np.float64(self.loss_m2), max_drawdown=self.max_drawdown,
+            mae_sum=np.float64(self.mae_sum), mae_min=self.mae_min, mfe_sum=np.float64(self.mfe_sum),
+            mfe_max=self.mfe_max, efficiency_sum=np.float64(self.efficiency_sum),
+            efficiency_trades=np.int64(self.efficiency_trades),
+        )
+        return {col: float(row[col]) if col != 'Total Trades' else self.trades for col in SUMMARY_COLUMNS}
+
+    def state(self) -> np.ndarray:
+        return np.array([getattr(self, field) for field in self.FIELDS], dtype=np.float64)
+
+    @classmethod
+    def from_state(cls, values):
+        summary = cls()
+        for field, value in zip(cls.FIELDS, values):
+            setattr(summary, field, int(value) if field in ('trades', 'wins', 'losses', 'efficiency_trades')
+                    else float(value))
+        return summary
+
+
+class IncrementalRun:
+    """
+    One (lag, window) combo of a growing history, checkpointed at the last bar whose features are final.
+
+    The non-scaling variant's centered window looks window - lag bars ahead, so the features of
+    its last bars change when bars are appended; the scaling variant never looks ahead. update()
+    resumes from the checkpoint: the open position, its SL and entry-price sum, the carried swing
+    levels and grabs, and the running summary aggregates. Bars past the new checkpoint are run
+    on a copy of that state and their trades are provisional: they are logged and reported,
+    but replayed on the next update.
+    """
+    def __init__(self, window: int, lag: int, variant: str = 'without_scaling'):
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+        self.window = window
+        self.lag = lag
+        self.variant = variant
+        self.settled = 0              # bars [0, settled) are final
+        self.runner = BlockRunner(variant)
+        self.high_level = self.low_level = np.nan
+        self.grab_tail = None         # grabs still waiting to turn into signals
+        self.summary = RunningSummary()
+        self.log_rows = 0             # final trades in the trade log
+        self.log_bytes = 0            # size of the trade log up to its last final trade
+        self.anchor = None            # (int64 time, [o, h, l, c]) of bar settled - 1, to detect a replaced history
+        self.provisional = RunningSummary()
+
+    def lookahead(self) -> int:
+        return max(0, self.window - self.lag) if self.variant == 'without_scaling' else 0
+
+    def update(self, df: pd.DataFrame, chunk_size: int = 1_000_000):
+        """
+        Run the bars appended since the last checkpoint.
+
+        :param df: the whole history, typically memory-mapped (only the tail and a halo are read)
+        :return: (new final trades, provisional trades), in the run_combo() layout
+        """
+        n = len(df)
+        self._check_anchor(df)
+        settled = max(self.settled, n - self.lookahead())
+        o, h, l, c = (df[col].to_numpy(dtype=np.float64) for col in ['o', 'h', 'l', 'c'])
+        features = ChunkedFeatures(h, l, self.window, self.lag, self.variant)
+        features.high_level, features.low_level = self.high_level, self.low_level
+        if self.grab_tail is not None:
+            features.grab_tail = self.grab_tail
+
+        with stage('incremental.run', bars=n - self.settled):
+            final = self._run(features, self.runner, o, c, self.settled, settled, chunk_size)
+            self.high_level, self.low_level = features.high_level, features.low_level
+            self.grab_tail = features.grab_tail.copy()
+            # the unsettled tail runs on a copy, so the checkpoint stays at `settled`
+            provisional = self._run(features, copy.deepcopy(self.runner), o, c, settled, n, chunk_size)
+
+        final = self._trade_log(df.index, final, self.summary)
+        self.summary.update(*_metric_columns(final))
+        self.provisional = copy.deepcopy(self.summary)
+        provisional = self._trade_log(df.index, provisional, self.summary)
+        self.provisional.update(*_metric_columns(provisional))
+        self.settled = settled
+        if settled:
+            bar = settled - 1
+            self.anchor = _bar_anchor(df, bar)
+        return final, provisional
+
+    def _check_anchor(self, df):
+        if not self.settled:
+            return
+        bar = self.settled - 1
+        if len(df) < self.settled:
+            raise ValueError(f"History has {len(df)} bars, fewer than the {self.settled} already checkpointed")
+        time, prices = _bar_anchor(df, bar)
+        if time != self.anchor[0] or not np.array_equal(prices, self.anchor[1], equal_nan=True):
+            raise ValueError(f"Bar {bar} changed since the checkpoint; re-run this combo from scratch")
+
+    def _run(self, features, runner, o, c, start, stop, chunk_size):
+        blocks, maes, mfes = [], [], []
+        for first in range(start, stop, chunk_size):
+            last = min(stop, first + chunk_size)
+            o_block, c_block = o[first:last], c[first:last]
+            signal, swing_high, swing_low, h_block, l_block = features.block(first, last, o_block, c_block)
+            trades, mae, mfe = runner.run(first, signal, swing_high, swing_low, o_block, h_block, l_block)
+            blocks.append(trades)
+            maes.append(mae)
+            mfes.append(mfe)
+        if not blocks:
+            return np.empty(0, dtype=TRADE_DTYPE), np.empty(0), np.empty(0)
+        return np.concatenate(blocks), np.concatenate(maes), np.concatenate(mfes)
+
+    def _trade_log(self, index, run, summary) -> pd.DataFrame:
+        trades, mae, mfe = run
+        bt = trades_to_frame(index, trades, with_units=(self.variant == 'scaling'))
+        if not bt.empty:
+            # continued in trade order from the carried total, as one cumsum over the whole log;
+            # the log's first trades start from nothing, so a leading -0.0 stays -0.0 like in pandas
+            if summary.trades:
+                bt['Cumulative PnL'] = np.cumsum(np.r_[summary.cumulative, trades['pnl']])[1:]
+            else:
+                bt['Cumulative PnL'] = np.cumsum(trades['pnl'])
+            bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+            bt['MAE'], bt['MFE'] = mae, mfe
+        return bt
+
+    def append_log(self, path: str, final: pd.DataFrame, provisional: pd.DataFrame):
+        """
+        Replace the log's provisional rows by the new final and provisional trades, in O(new trades).
+        """
+        if self.log_bytes and (not os.path.exists(path) or os.path.getsize(path) < self.log_bytes):
+            raise ValueError(f"{path} is shorter than its checkpoint; re-run this combo from scratch")
+        if not os.path.exists(path) and final.empty and provisional.empty:
+            return
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+            f.truncate(self.log_bytes)
+            f.seek(self.log_bytes)
+            header = self.log_bytes == 0
+            for bt, is_final in ((final, True), (provisional, False)):
+                if not bt.empty:
+                    f.write(bt.to_csv(index=False, header=header).encode())
+                    header = False
+                if is_final:
+                    self.log_bytes = f.tell() if not header else 0
+                    self.log_rows += len(bt)
+
+    def row(self) -> dict:
+        """
+        Summary row of the whole log (final and provisional trades); None without trades.
+        """
+        if not self.provisional.trades:
+            return None
+        return {'Lag': self.lag, 'Window': self.window, **self.provisional.row()}
+
+    def save(self, path: str):
+        runner = self.runner
+        prev = runner.prev if runner.prev is not None else (np.empty(0),) * 6
+        arrays = {
+            'combo': np.array([self.window, self.lag]),
+            'variant': np.array(self.variant),
+            'settled': np.array(self.settled),
+            'log': np.array([self.log_rows, self.log_bytes]),
+            'anchor_time': np.array([self.anchor[0]] if self.anchor is not None else [], dtype=np.int64),
+            'anchor': self.anchor[1] if self.anchor is not None else np.empty(0),
+            'state': runner.state,
+            'excursion': np.array([runner.run_high, runner.run_low]),
+            'levels': np.array([self.high_level, self.low_level]),
+            'grab_tail': self.grab_tail if self.grab_tail is not None else np.empty(0, dtype=np.int8),
+            'summary': self.summary.state(),
+            'provisional': self.provisional.state(),
+        }
+        for name, values in zip(('signal', 'swing_high', 'swing_low', 'o', 'h', 'l'), prev):
+            arrays[f'prev_{name}'] = values
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as z:
+            window, lag = (int(v) for v in z['combo'])
+            run = cls(window, lag, str(z['variant']))
+            run.settled = int(z['settled'])
+            run.log_rows, run.log_bytes = (int(v) for v in z['log'])
+            run.anchor = (int(z['anchor_time'][0]), z['anchor'].copy()) if len(z['anchor_time']) else None
+            runner = run.runner
+            if len(z['state']) != STATE_SIZE:
+                raise ValueError(f"{path}: checkpoint of an older kernel state layout; "
+                                 f"delete the checkpoints and trade logs to rebuild them")
+            runner.state = z['state'].copy()
+            runner.run_high, runner.run_low = (float(v) for v in z['excursion'])
+            if len(z['prev_o']):
+                runner.prev = tuple(z[f'prev_{name}'].copy()
+                                    for name in ('signal', 'swing_high', 'swing_low', 'o', 'h', 'l'))
+            run.high_level, run.low_level = (float(v) for v in z['levels'])
+            run.grab_tail = z['grab_tail'].copy() if run.settled else None
+            run.summary = RunningSummary.from_state(z['summary'])
+            run.provisional = RunningSummary.from_state(z['provisional'])
+        return run
+
+
+def _bar_anchor(df: pd.DataFrame, bar: int):
+    return (int(df.index[bar:bar + 1].to_numpy().view(np.int64)[0]),
+            np.array([df[col].iloc[bar] for col in ['o', 'h', 'l', 'c']], dtype=np.float64))
+
+
+def _metric_columns(bt: pd.DataFrame):
+    if bt.empty:
+        return np.empty(0), None, None
+    return (bt['PnL'].to_numpy(dtype=np.float64), bt['MAE'].to_numpy(dtype=np.float64),
+            bt['MFE'].to_numpy(dtype=np.float64))
+
+
+def incremental_sweep(df: pd.DataFrame, window_values, lag_values, output_dir: str, variant: str = 'without_scaling',
+                      symbol_name: str = "gold", checkpoint_dir: str = None, summary_file: str = None,
+                      chunk_size: int = 1_000_000) -> pd.DataFrame:
+    """
+    Bring every combo's trade log and summary up to date with the bars appended since the last call.
+
+    Trade logs are the sweep's `<symbol>_lag<lag>_win<window>.csv` files in `output_dir`; each
+    combo's checkpoint sits next to them in `checkpoint_dir` (default `<output_dir>/.checkpoints`).
+    The first call runs the whole history, later calls only the new tail plus the few bars
+    whose features were still provisional. The summary comes from the checkpointed aggregates,
+    so no trade log is read back.
+
+    :param summary_file: if set, the summary is also written there as CSV
+    :return: one row per combo with trades, generate_summary's columns
+    """
+    checkpoint_dir = checkpoint_dir or os.path.join(output_dir, ".checkpoints")
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    rows = []
+    for window in window_values:
+        for lag in lag_values:
+            name = f"{symbol_name}_lag{lag}_win{window}"
+            checkpoint = os.path.join(checkpoint_dir, f"{name}.npz")
+            run = IncrementalRun.load(checkpoint) if os.path.exists(checkpoint) else IncrementalRun(window, lag, variant)
+            if run.variant != variant:
+                raise ValueError(f"{checkpoint} was written by the {run.variant!r} variant, not {variant!r}")
+            new_bars = len(df) - run.settled
+            final, provisional = run.update(df, chunk_size)
+            with stage('incremental.write', trades=len(final) + len(provisional)):
+                run.append_log(os.path.join(output_dir, f"{name}.csv"), final, provisional)
+                run.save(checkpoint)
+            print(f"📅 {name}: {new_bars:,} bars, {len(final)} trades settled, {len(provisional)} provisional")
+            row = run.row()
+            if row is not None:
+                rows.append({'Symbol': symbol_name, **row})
+    summary = pd.DataFrame(rows, columns=['Symbol', 'Lag', 'Window'] + SUMMARY_COLUMNS)
+    if summary_file is not None:
+        summary.to_csv(summary_file, index=False)
+        print(f"\n🚀 Incremental summary saved to {summary_file}")
+    return summary
+
+
+def main():
+    from data_loader import load_ohlc
+    from universe import discover_symbols
+
+    window_values = [1, 2, 3, 4, 5, 6, 7, 8]
+    lag_values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+    os.makedirs("./Summary", exist_ok=True)
+
+    # ✅ Run daily after new bars land in ./data: only the appended tail of every combo is processed
+    for symbol, csv_path in discover_symbols("./data").items():
+        incremental_sweep(load_ohlc(csv_path), window_values, lag_values, "./incremental/without_scaling",
+                          symbol_name=symbol,
+                          summary_file=os.path.join("./Summary", f"Incremental_{symbol}_without_scaling.csv"))
+
+
+if __name__ == "__main__":
+    main()
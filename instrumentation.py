@@ -0,0 +1,300 @@
+import cProfile
+import collections
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+COUNTERS = ('bars', 'trades', 'bytes')
+
+# recording() options of each sweep `profile` setting
+PROFILES = {None: {}, 'cprofile': {'cprofile': True}, 'sample': {'sample_interval': 0.005}}
+
+# Recorders collecting stages in this process, innermost last; stage() is a no-op while empty
+_active = []
+
+
+class _Stage:
+    """
+    Timer for one stage; counters can be added while it runs (e.g. trades once they are known).
+    """
+    __slots__ = ('name', 'counts', 'start')
+
+    def __init__(self, name: str, counts):
+        self.name = name
+        self.counts = counts
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        for recorder in _active:
+            recorder.record(self.name, elapsed, self.counts)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str, **counts):
+    """
+    Time a block as stage `name` in every active Recorder.
+
+    :param counts: 'bars', 'trades' and/or 'bytes' handled by the block; more can be added with .add()
+    """
+    if not _active:
+        return _NO_STAGE
+    return _Stage(name, counts)
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the recording thread's stack every `interval` seconds; counts the innermost frames.
+    """
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self.counts[f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Recorder:
+    """
+    Per-stage wall time and bar / trade / byte counters, reported as a JSON-ready dict.
+    """
+    def __init__(self, meta=None, cprofile: bool = False, sample_interval: float = None, top: int = 25):
+        """
+        :param meta: extra fields of the report, e.g. {'symbol': 'gold', 'lag': 3, 'window': 4}
+        :param cprofile: also run cProfile while recording; the report lists the top functions
+        :param sample_interval: seconds between stack samples of the recording thread (off if None)
+        :param top: number of cProfile functions / sampled lines in the report
+        """
+        self.meta = dict(meta or {})
+        self.stages = {}
+        self.wall_seconds = 0.0
+        self.top = top
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.sample_interval = sample_interval
+        self.sampler = None
+
+    def record(self, name: str, seconds: float, counts):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'calls': 0, 'seconds': 0.0}
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        for key, value in counts.items():
+            entry[key] = entry.get(key, 0) + value
+
+    def start(self):
+        self._start = time.perf_counter()
+        _active.append(self)
+        if self.sample_interval:
+            self.sampler = _Sampler(threading.get_ident(), self.sample_interval)
+            self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        _active.remove(self)
+        self.wall_seconds += time.perf_counter() - self._start
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(entry)
+            for key in COUNTERS:
+                if key in entry and entry['seconds'] > 0:
+                    stages[name][f'{key}_per_sec'] = entry[key] / entry['seconds']
+        report = {**self.meta, 'wall_seconds': self.wall_seconds, 'stages': stages}
+        if self.profiler is not None:
+            report['cprofile'] = profile_rows(self.profiler, self.top)
+        if self.sampler is not None:
+            report['samples'] = {
+                'interval': self.sample_interval,
+                'total': self.sampler.samples,
+                'top': [{'location': loc, 'samples': n} for loc, n in self.sampler.counts.most_common(self.top)],
+            }
+        return report
+
+    def to_json(self, path: str):
+        write_json(self.report(), path)
+        return path
+
+    def dump_stats(self, path: str):
+        """
+        Raw cProfile stats, for snakeviz / pstats.
+        """
+        self.profiler.dump_stats(path)
+
+
+def profile_rows(profiler: cProfile.Profile, top: int = 25):
+    """
+    Top `top` functions by cumulative time as dicts.
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (file, line, func), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        rows.append({'function': f"{os.path.basename(file)}:{line}:{func}", 'calls': nc,
+                     'tottime': tottime, 'cumtime': cumtime})
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:top]
+
+
+def write_json(report, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def recording(meta=None, cprofile: bool = False, sample_interval: float = None, report_path: str = None):
+    """
+    Record every stage run inside the block; writes the JSON report to `report_path` if given.
+    """
+    recorder = Recorder(meta, cprofile, sample_interval)
+    with recorder:
+        yield recorder
+    if report_path is not None:
+        recorder.to_json(report_path)
+
+
+def combo_report_path(report_dir: str, symbol: str, lag: int, window: int, variant: str) -> str:
+    return os.path.join(report_dir, f"{symbol}_{variant}_lag{lag}_win{window}.json")
+
+
+def profile_options(profile: str = None):
+    """
+    recording() options of a sweep's `profile` setting: None, 'cprofile' or 'sample'.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r}, expected one of {tuple(PROFILES)}")
+    return PROFILES[profile]
+
+
+def start_sweep_reports(report_dir: str, symbols, window_values, lag_values, variant: str, profile: str = None):
+    """
+    Combo report paths of a sweep's grid, with any report left at them by an earlier run removed.
+
+    `profile` is checked here, before any worker starts, so a bad value fails the sweep up front.
+
+    :return: the paths, to hand to write_sweep_report() once the sweep is done
+    """
+    profile_options(profile)
+    paths = [combo_report_path(report_dir, symbol, lag, window, variant)
+             for symbol in symbols for window in window_values for lag in lag_values]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return paths
+
+
+@contextmanager
+def combo_report(report_dir: str, symbol: str, lag: int, window: int, variant: str, profile: str = None):
+    """
+    recording() of one sweep combo into `<report_dir>/<symbol>_<variant>_lag<lag>_win<window>.json`;
+    no-op without a dir.
+
+    :param profile: 'cprofile' adds the top functions to the report, 'sample' the most sampled lines
+    """
+    if report_dir is None:
+        yield None
+        return
+    meta = {'symbol': symbol, 'lag': lag, 'window': window, 'variant': variant, 'pid': os.getpid()}
+    path = combo_report_path(report_dir, symbol, lag, window, variant)
+    with recording(meta, report_path=path, **profile_options(profile)) as recorder:
+        yield recorder
+
+
+def merge_stages(reports):
+    """
+    Stage totals (calls, seconds, counters and rates) summed over several reports.
+    """
+    merged = {}
+    for report in reports:
+        for name, entry in report['stages'].items():
+            total = merged.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            for key in ('calls', 'seconds') + COUNTERS:
+                if key in entry:
+                    total[key] = total.get(key, 0) + entry[key]
+    for entry in merged.values():
+        for key in COUNTERS:
+            if key in entry and entry['seconds'] > 0:
+                entry[f'{key}_per_sec'] = entry[key] / entry['seconds']
+    return merged
+
+
+def write_sweep_report(report_dir: str, wall_seconds: float, paths, **meta):
+    """
+    Aggregate the sweep's combo reports into `<report_dir>/sweep.json`; returns the report.
+
+    Only `paths` (from start_sweep_reports()) are read, so reports of other runs, grids or symbols
+    in the same directory never leak in; combos that failed before writing theirs are skipped.
+    Stage seconds are summed over workers (CPU-side time); `wall_seconds` is the sweep's elapsed time.
+    """
+    combos = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path) as f:
+                combos.append(json.load(f))
+    report = {
+        **meta,
+        'wall_seconds': wall_seconds,
+        'combos': len(combos),
+        'stages': merge_stages(combos),
+        'slowest_combos': [
+            {key: combo.get(key) for key in ('symbol', 'lag', 'window', 'wall_seconds')}
+            for combo in sorted(combos, key=lambda combo: combo['wall_seconds'], reverse=True)[:10]
+        ],
+    }
+    write_json(report, os.path.join(report_dir, "sweep.json"))
+    return report
@@ -0,0 +1,430 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # pure-Python fallback: same kernels, just not compiled
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# Exit reason codes written by the kernels, decoded to labels only in trades_to_frame()
+SL_HIT = 0
+SIGNAL_REVERSED = 1
+BEARISH_REVERSAL = 2
+BULLISH_REVERSAL = 3
+EXIT_REASONS = pd.Index(['SL Hit', 'Signal Reversed', 'Bearish Trade Reversal', 'Bullish Trade Reversal'])
+DIRECTIONS = pd.Index(['Short', 'Long'])  # indexed by direction == 1
+
+# One row per closed trade, preallocated to len(bars) and trimmed on return
+TRADE_DTYPE = np.dtype([
+    ('entry_bar', np.int64),
+    ('exit_bar', np.int64),
+    ('direction', np.int8),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('pnl', np.float64),
+    ('reason', np.int8),
+    ('sl_price', np.float64),
+    ('units', np.int64),
+])
+
+# Open-position state carried between blocks by the *_resume kernels, as float64 slots
+# (ST_PRICE_SUM: running sum of the scaling variant's entry and scale-in prices, averaged over ST_UNITS)
+ST_IN_POSITION, ST_POSITION, ST_UNITS, ST_ENTRY_BAR, ST_ENTRY_PRICE, ST_SL_PRICE, ST_PRICE_SUM = range(7)
+STATE_SIZE = 7
+
+
+def ohlc_arrays(data: pd.DataFrame):
+    """
+    Read the columns the kernels need once, as contiguous float64/int64 arrays.
+    """
+    signal = np.ascontiguousarray(data['entry_signal'].to_numpy(dtype=np.int64))
+    o = np.ascontiguousarray(data['o'].to_numpy(dtype=np.float64))
+    h = np.ascontiguousarray(data['h'].to_numpy(dtype=np.float64))
+    l = np.ascontiguousarray(data['l'].to_numpy(dtype=np.float64))
+    return signal, o, h, l
+
+
+def swing_flag_arrays(data: pd.DataFrame):
+    """
+    Swing high/low flags as contiguous bool arrays.
+    """
+    swing_high = np.ascontiguousarray(data['is_swing_high'].to_numpy(dtype=np.bool_))
+    swing_low = np.ascontiguousarray(data['is_swing_low'].to_numpy(dtype=np.bool_))
+    return swing_high, swing_low
+
+
+@njit(cache=True)
+def _record(trades, k, entry_bar, exit_bar, position, entry_price, exit_price, pnl, reason, sl_price, units):
+    t = trades[k]
+    t['entry_bar'] = entry_bar
+    t['exit_bar'] = exit_bar
+    t['direction'] = position
+    t['entry_price'] = entry_price
+    t['exit_price'] = exit_price
+    t['pnl'] = pnl
+    t['reason'] = reason
+    t['sl_price'] = sl_price
+    t['units'] = units
+
+
+@njit(cache=True)
+def without_scaling_kernel(signal, o, h, l, trades):
+    """
+    Position state machine of SwingBacktesterWithoutScaling.run_backtest over bar arrays.
+
+    Writes closed trades into the preallocated `trades` record array and returns the count.
+    """
+    return without_scaling_resume(signal, o, h, l, trades, np.zeros(STATE_SIZE), 0)
+
+
+@njit(cache=True)
+def without_scaling_resume(signal, o, h, l, trades, state, offset):
+    """
+    without_scaling_kernel over one block of a longer history.
+
+    Bar 0 of the block is the last bar of the previous block (or the first bar of the
+    history); the loop starts at bar 1 like the full run. The open position is read from
+    and written back to `state`, and recorded bars are shifted by `offset`.
+    """
+    n = len(signal)
+    k = 0
+    in_position = state[ST_IN_POSITION] != 0
+    position = np.int64(state[ST_POSITION])
+    entry_bar = np.int64(state[ST_ENTRY_BAR])
+    entry_price = state[ST_ENTRY_PRICE]
+    sl_price = state[ST_SL_PRICE]
+    for i in range(1, n):
+        sig = signal[i]
+        open_price = o[i]
+        high = h[i]
+        low = l[i]
+        entry_candle_height = open_price - low if sig == 1 else high - open_price
+        if not in_position and sig != 0:
+            position = sig
+            entry_price = open_price
+            entry_bar = i + offset
+            sl_price = entry_price - entry_candle_height if position == 1 else entry_price + entry_candle_height
+            in_position = True
+        elif in_position:
+            sl_hit = (low <= sl_price) if position == 1 else (high >= sl_price)
+            if sl_hit:
+                pnl = (sl_price - entry_price) * position
+                _record(trades, k, entry_bar, i + offset, position, entry_price, sl_price, pnl, SL_HIT, sl_price, 1)
+                k += 1
+                in_position = False
+                position = 0
+            elif sig != 0 and sig != position:
+                pnl = (open_price - entry_price) * position
+                _record(trades, k, entry_bar, i + offset, position, entry_price, open_price, pnl, SIGNAL_REVERSED,
+                        sl_price, 1)
+                k += 1
+                position = sig
+                entry_price = open_price
+                entry_bar = i + offset
+                sl_price = low if position == 1 else high
+    state[ST_IN_POSITION] = 1.0 if in_position else 0.0
+    state[ST_POSITION] = position
+    state[ST_UNITS] = 1 if in_position else 0
+    state[ST_ENTRY_BAR] = entry_bar
+    state[ST_ENTRY_PRICE] = entry_price
+    state[ST_SL_PRICE] = sl_price
+    return k
+
+
+@njit(cache=True)
+def scaling_kernel(signal, o, h, l, swing_high, swing_low, trades):
+    """
+    Pyramiding state machine of SwingBacktesterWithScaling.run_backtest over bar arrays.
+
+    The open position is tracked as a running sum of its entry / scale-in prices and a unit
+    count; closed trades are written into the preallocated `trades` record array; returns the count.
+    The average entry price is sum / units, so it can differ from the bar loop's np.mean in the
+    last bits (numpy sums pairwise); compare prices and PnL with a tolerance.
+    """
+    return scaling_resume(signal, o, h, l, swing_high, swing_low, trades, np.zeros(STATE_SIZE), 0)
+
+
+@njit(cache=True)
+def scaling_resume(signal, o, h, l, swing_high, swing_low, trades, state, offset):
+    """
+    scaling_kernel over one block of a longer history, see without_scaling_resume.
+    """
+    n = len(signal)
+    k = 0
+    in_position = state[ST_IN_POSITION] != 0
+    position = np.int64(state[ST_POSITION])
+    units = np.int64(state[ST_UNITS])
+    price_sum = state[ST_PRICE_SUM]
+    entry_bar = np.int64(state[ST_ENTRY_BAR])
+    sl_price = state[ST_SL_PRICE]
+    for i in range(1, n):
+        sig = signal[i]
+        open_price = o[i]
+        high = h[i]
+        low = l[i]
+        entry_candle_height = abs(open_price - low) if sig == 1 else abs(high - open_price)
+
+        if not in_position:
+            if sig == 1 or sig == -1:
+                position = sig
+                price_sum = open_price
+                units = 1
+                entry_bar = i + offset
+                sl_price = open_price - entry_candle_height if sig == 1 else open_price + entry_candle_height
+                in_position = True
+
+        elif position == 1:
+            if swing_low[i - 1]:
+                price_sum += open_price
+                units += 1
+                sl_price = l[i - 1]
+
+            if low <= sl_price and sig != -1:
+                avg_price = price_sum / units
+                pnl = (sl_price - avg_price) * units
+                _record(trades, k, entry_bar, i + offset, 1, avg_price, sl_price, pnl, SL_HIT, sl_price, units)
+                k += 1
+                in_position = False
+                position = 0
+                units = 0
+                price_sum = 0.0
+            elif sig == -1:
+                avg_price = price_sum / units
+                pnl = (sl_price - avg_price) * units
+                _record(trades, k, entry_bar, i + offset, 1, avg_price, sl_price, pnl, BEARISH_REVERSAL, sl_price, units)
+                k += 1
+                position = -1
+                price_sum = open_price
+                units = 1
+                entry_bar = i + offset
+                sl_price = open_price + entry_candle_height
+
+        elif position == -1:
+            if swing_high[i - 1]:
+                price_sum += open_price
+                units += 1
+                sl_price = h[i - 1]
+
+            if high >= sl_price and sig != 1:
+                avg_price = price_sum / units
+                pnl = (avg_price - sl_price) * units
+                _record(trades, k, entry_bar, i + offset, -1, avg_price, sl_price, pnl, SL_HIT, sl_price, units)
+                k += 1
+                in_position = False
+                position = 0
+                units = 0
+                price_sum = 0.0
+            elif sig == 1:
+                avg_price = price_sum / units
+                pnl = (avg_price - sl_price) * units
+                _record(trades, k, entry_bar, i + offset, -1, avg_price, sl_price, pnl, BULLISH_REVERSAL, sl_price, units)
+                k += 1
+                position = 1
+                price_sum = open_price
+                units = 1
+                entry_bar = i + offset
+                sl_price = open_price - entry_candle_height
+    state[ST_IN_POSITION] = 1.0 if in_position else 0.0
+    state[ST_POSITION] = position
+    state[ST_UNITS] = units
+    state[ST_PRICE_SUM] = price_sum
+    state[ST_ENTRY_BAR] = entry_bar
+    state[ST_SL_PRICE] = sl_price
+    return k
+
+
+@njit(cache=True)
+def batched_without_scaling_resume(signal, o, h, l, feature, sl_mult, state, first, offset, trades, counts):
+    """
+    without_scaling_resume for many combos side by side, in one pass over a block of bars.
+
+    `signal` is (feature sets, bars) with one row per (lag, window), `feature[c]` is combo c's
+    row, and `state` holds every combo's position slots as (STATE_SIZE, combos) rows. Combo c's
+    stop sits `sl_mult[c]` entry candles away (1.0 gives the backtester's stops bit for bit).
+    Runs bars [first, len(o)), appending combo c's closed trades to row c of the (combos, capacity)
+    `trades` buffer, `counts[c]` of them so far; stops early once a row is full. Returns the next bar.
+    """
+    n = len(o)
+    n_combos = len(feature)
+    capacity = trades.shape[1]
+    most = counts.max() if n_combos else 0
+    for i in range(first, n):
+        if most >= capacity:
+            return i
+        open_price = o[i]
+        high = h[i]
+        low = l[i]
+        for c in range(n_combos):
+            sig = signal[feature[c], i]
+            if state[ST_IN_POSITION, c] == 0:
+                if sig != 0:
+                    height = sl_mult[c] * (open_price - low if sig == 1 else high - open_price)
+                    state[ST_IN_POSITION, c] = 1.0
+                    state[ST_POSITION, c] = sig
+                    state[ST_UNITS, c] = 1
+                    state[ST_ENTRY_BAR, c] = i + offset
+                    state[ST_ENTRY_PRICE, c] = open_price
+                    state[ST_SL_PRICE, c] = open_price - height if sig == 1 else open_price + height
+                continue
+            position = np.int64(state[ST_POSITION, c])
+            entry_price = state[ST_ENTRY_PRICE, c]
+            sl_price = state[ST_SL_PRICE, c]
+            sl_hit = (low <= sl_price) if position == 1 else (high >= sl_price)
+            if sl_hit:
+                _record(trades[c], counts[c], np.int64(state[ST_ENTRY_BAR, c]), i + offset, position, entry_price,
+                        sl_price, (sl_price - entry_price) * position, SL_HIT, sl_price, 1)
+                counts[c] += 1
+                most = max(most, counts[c])
+                state[ST_IN_POSITION, c] = 0.0
+                state[ST_POSITION, c] = 0
+                state[ST_UNITS, c] = 0
+            elif sig != 0 and sig != position:
+                _record(trades[c], counts[c], np.int64(state[ST_ENTRY_BAR, c]), i + offset, position, entry_price,
+                        open_price, (open_price - entry_price) * position, SIGNAL_REVERSED, sl_price, 1)
+                counts[c] += 1
+                most = max(most, counts[c])
+                state[ST_POSITION, c] = sig
+                state[ST_ENTRY_BAR, c] = i + offset
+                state[ST_ENTRY_PRICE, c] = open_price
+                # the reversal bar's extreme, pushed out (sl_mult - 1) times its distance from the open
+                extreme = low if sig == 1 else high
+                state[ST_SL_PRICE, c] = extreme + (sl_mult[c] - 1.0) * (extreme - open_price)
+    return n
+
+
+@njit(cache=True)
+def batched_scaling_resume(signal, o, h, l, swing_high, swing_low, feature, sl_mult, state, first, offset, trades,
+                           counts):
+    """
+    scaling_resume for many combos side by side, see batched_without_scaling_resume.
+
+    `swing_high` / `swing_low` are (feature sets, bars) like `signal`. The multiplier scales the
+    entry stops; scale-ins still trail the stop to the previous bar's extreme.
+    """
+    n = len(o)
+    n_combos = len(feature)
+    most = counts.max() if n_combos else 0
+    for i in range(first, n):
+        if most >= trades.shape[1]:
+            return i
+        open_price = o[i]
+        high = h[i]
+        low = l[i]
+        for c in range(n_combos):
+            f = feature[c]
+            sig = signal[f, i]
+            height = sl_mult[c] * (abs(open_price - low) if sig == 1 else abs(high - open_price))
+            if state[ST_IN_POSITION, c] == 0:
+                if sig == 1 or sig == -1:
+                    state[ST_PRICE_SUM, c] = open_price
+                    state[ST_IN_POSITION, c] = 1.0
+                    state[ST_POSITION, c] = sig
+                    state[ST_UNITS, c] = 1
+                    state[ST_ENTRY_BAR, c] = i + offset
+                    state[ST_SL_PRICE, c] = open_price - height if sig == 1 else open_price + height
+                continue
+            position = np.int64(state[ST_POSITION, c])
+            units = np.int64(state[ST_UNITS, c])
+            sl_price = state[ST_SL_PRICE, c]
+            scale_in = swing_low[f, i - 1] if position == 1 else swing_high[f, i - 1]
+            if scale_in:
+                state[ST_PRICE_SUM, c] += open_price
+                units += 1
+                sl_price = l[i - 1] if position == 1 else h[i - 1]
+            sl_hit = (low <= sl_price and sig != -1) if position == 1 else (high >= sl_price and sig != 1)
+            if sl_hit or sig == -position:
+                avg_price = state[ST_PRICE_SUM, c] / units
+                pnl = (sl_price - avg_price) * units * position
+                if sl_hit:
+                    reason = SL_HIT
+                else:
+                    reason = BEARISH_REVERSAL if position == 1 else BULLISH_REVERSAL
+                _record(trades[c], counts[c], np.int64(state[ST_ENTRY_BAR, c]), i + offset, position, avg_price,
+                        sl_price, pnl, reason, sl_price, units)
+                counts[c] += 1
+                most = max(most, counts[c])
+                if sl_hit:
+                    state[ST_IN_POSITION, c] = 0.0
+                    state[ST_POSITION, c] = 0
+                    state[ST_PRICE_SUM, c] = 0.0
+                    units = 0
+                else:
+                    state[ST_POSITION, c] = -position
+                    state[ST_PRICE_SUM, c] = open_price
+                    units = 1
+                    state[ST_ENTRY_BAR, c] = i + offset
+                    sl_price = open_price + height if position == 1 else open_price - height
+            state[ST_UNITS, c] = units
+            state[ST_SL_PRICE, c] = sl_price
+    return n
+
+
+def trade_bars_from_times(index: pd.Index, entry_times, exit_times):
+    """
+    Bar positions covered by `data.loc[entry_time:exit_time]`, for trade logs without recorded bars.
+    """
+    entry_bars = index.searchsorted(entry_times, side='left').astype(np.int64)
+    exit_bars = index.searchsorted(exit_times, side='right').astype(np.int64) - 1
+    return entry_bars, exit_bars
+
+
+def trade_excursions(h: np.ndarray, l: np.ndarray, entry_bars: np.ndarray, exit_bars: np.ndarray):
+    """
+    Highest high and lowest low over each trade's bars [entry_bar, exit_bar], in one reduceat pass.
+
+    Trade ranges are interleaved as [entry_0, exit_0 + 1, entry_1, exit_1 + 1, ...] so every even
+    segment is a trade; odd segments are the gaps between trades and are dropped. NaNs are skipped
+    like pandas' min/max.
+    """
+    if len(entry_bars) == 0:
+        return np.empty(0), np.empty(0)
+    bounds = np.empty(2 * len(entry_bars), dtype=np.int64)
+    bounds[0::2] = entry_bars
+    bounds[1::2] = exit_bars + 1
+    if bounds[-1] >= len(h):
+        # last trade runs to the final bar: its segment is open-ended
+        bounds = bounds[:-1]
+    max_high = np.fmax.reduceat(h, bounds)[0::2]
+    min_low = np.fmin.reduceat(l, bounds)[0::2]
+    return max_high, min_low
+
+
+def mae_mfe(h, l, entry_bars, exit_bars, entry_price, is_long):
+    """
+    MAE/MFE per trade, signed the same way as the original per-trade loop.
+    """
+    max_high, min_low = trade_excursions(h, l, entry_bars, exit_bars)
+    return excursion_mae_mfe(max_high, min_low, entry_price, is_long)
+
+
+def excursion_mae_mfe(max_high, min_low, entry_price, is_long):
+    """
+    MAE/MFE from each trade's highest high and lowest low.
+    """
+    mae = np.where(is_long, min_low - entry_price, (entry_price - max_high) * -1)
+    mfe = np.where(is_long, max_high - entry_price, (entry_price - min_low) * -1)
+    return mae, mfe
+
+
+def trades_to_frame(index: pd.Index, trades: np.ndarray, with_units: bool = False) -> pd.DataFrame:
+    """
+    Build the trade log DataFrame (same columns as the bar-loop engines) from kernel output.
+    """
+    if len(trades) == 0:
+        return pd.DataFrame([])
+    columns = {
+        'Entry Time': index[trades['entry_bar']],
+        'Exit Time': index[trades['exit_bar']],
+        'Direction': DIRECTIONS.take((trades['direction'] == 1).astype(np.int8)),
+        'Entry Price': trades['entry_price'],
+        'Exit Price': trades['exit_price'],
+        'PnL': trades['pnl'],
+        'Exit Reason': EXIT_REASONS.take(trades['reason']),
+        'SL Price': trades['sl_price'],
+    }
+    if with_units:
+        columns['Units'] = trades['units']
+    return pd.DataFrame(columns)
@@ -0,0 +1,342 @@
+import abc
+import asyncio
+import math
+import os
+import time
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_ohlc
+from streaming import StreamingSwingDetector
+
+warnings.filterwarnings('ignore')
+
+Bar = namedtuple('Bar', ['time', 'o', 'h', 'l', 'c'])
+
+# side: +1 buy / -1 sell; kind: 'entry', 'scale_in' or 'exit'; reason: exit reason of the batch trade log;
+# stop: stop-loss price of the position after the order
+Order = namedtuple('Order', ['symbol', 'time', 'side', 'quantity', 'price', 'kind', 'reason', 'stop'])
+Fill = namedtuple('Fill', ['order', 'price', 'time'])
+
+# (window, lag) combos replayed by the __main__ parity check
+PARITY_COMBOS = ((1, 1), (4, 6), (8, 12))
+
+
+class ScalingSwingStrategy:
+    """
+    SwingBacktesterWithScaling's entries, scale-ins, stop-losses and reversals decided one bar at a time.
+
+    Features come from the StreamingSwingDetector, which releases every bar of the scaling variant
+    on the bar itself, so a decision never waits for later bars. Like the backtester, a bar is acted
+    on once it is complete and orders are priced at its open (entries / scale-ins) or at the stop.
+    """
+    def __init__(self, symbol: str, window: int, lag: int):
+        self.symbol = symbol
+        self.detector = StreamingSwingDetector(window, lag, variant='scaling')
+        self.position = 0
+        self.sl_price = math.nan
+        self._prev = None  # (is_swing_high, is_swing_low, h, l) of the previous bar
+
+    def on_bar(self, t, o: float, h: float, l: float, c: float):
+        """
+        Feed one completed bar; returns the orders it triggers, in submission order.
+        """
+        orders = []
+        for features in self.detector.update(t, o, h, l, c):
+            if self._prev is not None:
+                self._decide(orders, t, features.entry_signal, o, h, l)
+            self._prev = (features.is_swing_high, features.is_swing_low, h, l)
+        return orders
+
+    def _decide(self, orders, t, signal, o, h, l):
+        prev_swing_high, prev_swing_low, prev_h, prev_l = self._prev
+        height = abs(o - l) if signal == 1 else abs(h - o) if signal == -1 else math.nan
+
+        if self.position == 0:
+            if signal == 1 or signal == -1:
+                self._open(orders, t, signal, o, height)
+        elif self.position == 1:
+            if prev_swing_low:
+                self.sl_price = prev_l
+                orders.append(Order(self.symbol, t, 1, 1, o, 'scale_in', None, self.sl_price))
+            if l <= self.sl_price and signal != -1:
+                self._close(orders, t, 'SL Hit')
+            elif signal == -1:
+                self._close(orders, t, 'Bearish Trade Reversal')
+                self._open(orders, t, -1, o, height)
+        else:
+            if prev_swing_high:
+                self.sl_price = prev_h
+                orders.append(Order(self.symbol, t, -1, 1, o, 'scale_in', None, self.sl_price))
+            if h >= self.sl_price and signal != 1:
+                self._close(orders, t, 'SL Hit')
+            elif signal == 1:
+                self._close(orders, t, 'Bullish Trade Reversal')
+                self._open(orders, t, 1, o, height)
+
+    def _open(self, orders, t, direction, o, height):
+        self.position = direction
+        self.sl_price = o - height if direction == 1 else o + height
+        orders.append(Order(self.symbol, t, direction, 1, o, 'entry', None, self.sl_price))
+
+    def _close(self, orders, t, reason):
+        # the broker closes the whole position; quantity 0 means "all units"
+        orders.append(Order(self.symbol, t, -self.position, 0, self.sl_price, 'exit', reason, self.sl_price))
+        self.position = 0
+
+
+class Broker(abc.ABC):
+    """
+    Order sink of the LiveRuntime; subclasses connect to a real venue and must implement submit().
+    """
+    @abc.abstractmethod
+    async def submit(self, order: Order) -> Fill:
+        """
+        Send one order and return its fill; raising fails the symbol's stream.
+        """
+
+
+class SimulatedBroker(Broker):
+    """
+    In-process broker filling every order at its price, keeping positions and closed trades per symbol.
+
+    :param latency: seconds awaited per order, to exercise the runtime under a slow venue
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.positions = {}  # symbol -> [direction, entry time, sum of fill prices, units], like the kernels
+        self.trades = {}     # symbol -> list of trade dicts in the batch trade log layout
+        self.orders = 0
+
+    async def submit(self, order: Order) -> Fill:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.orders += 1
+        if order.kind == 'entry':
+            if order.symbol in self.positions:
+                raise RuntimeError(f"{order.symbol}: entry while a position is open")
+            self.positions[order.symbol] = [order.side, order.time, order.price, 1]
+        elif order.kind == 'scale_in':
+            position = self.positions[order.symbol]
+            position[2] += order.price
+            position[3] += 1
+        elif order.kind == 'exit':
+            direction, entry_time, price_sum, units = self.positions.pop(order.symbol)
+            avg_price = price_sum / units
+            if direction == 1:
+                pnl = (order.price - avg_price) * units
+            else:
+                pnl = (avg_price - order.price) * units
+            self.trades.setdefault(order.symbol, []).append({
+                'Entry Time': entry_time,
+                'Exit Time': order.time,
+                'Direction': 'Long' if direction == 1 else 'Short',
+                'Entry Price': avg_price,
+                'Exit Price': order.price,
+                'PnL': pnl,
+                'Exit Reason': order.reason,
+                'SL Price': order.stop,
+                'Units': units,
+            })
+        else:
+            raise ValueError(f"Unknown order kind {order.kind!r}")
+        return Fill(order, order.price, order.time)
+
+    def trade_log(self, symbol: str) -> pd.DataFrame:
+        """
+        Closed trades of `symbol` with the columns of the backtester's run_backtest().
+        """
+        bt = pd.DataFrame(self.trades.get(symbol, []))
+        if not bt.empty:
+            bt['Cumulative PnL'] = bt['PnL'].cumsum()
+            bt['Entry Time'] = pd.to_datetime(bt['Entry Time'])
+            bt['Exit Time'] = pd.to_datetime(bt['Exit Time'])
+            bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+        return bt
+
+
+class LatencyStats:
+    """
+    Count, mean and max of per-bar decision latency, with percentiles over the last `samples` bars.
+    """
+    def __init__(self, samples: int = 10_000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = np.empty(samples, dtype=np.float64)
+
+    def add(self, seconds: float):
+        self.recent[self.count % len(self.recent)] = seconds
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        recent = self.recent[:min(self.count, len(self.recent))]
+        p50, p99 = np.percentile(recent, [50, 99]).tolist() if len(recent) else (math.nan, math.nan)
+        return {
+            'bars': self.count,
+            'mean_us': self.total / self.count * 1e6 if self.count else math.nan,
+            'p50_us': p50 * 1e6,
+            'p99_us': p99 * 1e6,
+            'max_us': self.max * 1e6,
+        }
+
+
+class LiveRuntime:
+    """
+    One asyncio event loop running a ScalingSwingStrategy per symbol stream and sending its orders to a Broker.
+
+    A stream is any async iterable of (time, o, h, l, c) bars: frame_bars() / csv_bars() replays, or
+    socket_bars() from a feed such as serve_bars(). Streams are independent tasks, so hundreds of
+    symbols share the loop and a failing stream does not stop the others.
+    """
+    def __init__(self, broker: Broker, window: int, lag: int, latency_samples: int = 10_000):
+        self.broker = broker
+        self.window = window
+        self.lag = lag
+        self.latency_samples = latency_samples
+        self.streams = {}
+        self.strategies = {}
+        self.latency = {}
+
+    def add_stream(self, symbol: str, source, window: int = None, lag: int = None):
+        """
+        :param window: / lag: per-symbol parameters, the runtime's by default
+        """
+        self.streams[symbol] = source
+        self.strategies[symbol] = ScalingSwingStrategy(symbol, window or self.window, lag or self.lag)
+        self.latency[symbol] = LatencyStats(self.latency_samples)
+
+    async def _consume(self, symbol: str):
+        strategy, stats, submit = self.strategies[symbol], self.latency[symbol], self.broker.submit
+        async for t, o, h, l, c in self.streams[symbol]:
+            start = time.perf_counter()
+            orders = strategy.on_bar(t, o, h, l, c)
+            stats.add(time.perf_counter() - start)
+            for order in orders:
+                await submit(order)
+
+    async def run(self):
+        """
+        Consume every stream to its end; returns {symbol: exception} of the streams that failed.
+        """
+        symbols = list(self.streams)
+        outcomes = await asyncio.gather(*(self._consume(symbol) for symbol in symbols), return_exceptions=True)
+        errors = {symbol: e for symbol, e in zip(symbols, outcomes) if isinstance(e, BaseException)}
+        for symbol, e in errors.items():
+            print(f"❌ {symbol}: {e!r}")
+        return errors
+
+    def latency_report(self) -> pd.DataFrame:
+        """
+        Per-symbol decision latency (strategy time per bar, broker round trips excluded).
+        """
+        return pd.DataFrame([{'symbol': symbol, **stats.summary()} for symbol, stats in self.latency.items()])
+
+
+async def frame_bars(df: pd.DataFrame, delay: float = 0.0):
+    """
+    Replay a DataFrame's bars, `delay` seconds apart (0 still yields to the loop after every bar).
+    """
+    for bar in zip(df.index, df['o'].to_numpy().tolist(), df['h'].to_numpy().tolist(),
+                   df['l'].to_numpy().tolist(), df['c'].to_numpy().tolist()):
+        yield Bar(*bar)
+        await asyncio.sleep(delay)
+
+
+async def csv_bars(csv_path: str, delay: float = 0.0):
+    """
+    Replay an OHLC CSV (loaded through the binary cache).
+    """
+    async for bar in frame_bars(load_ohlc(csv_path), delay):
+        yield bar
+
+
+async def serve_bars(frames, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0):
+    """
+    Local stand-in for a market data feed: a client sends "<symbol>\\n" and receives that symbol's
+    bars as "<epoch ns>,<o>,<h>,<l>,<c>\\n" lines, then EOF.
+
+    :param frames: {symbol: OHLC DataFrame}
+    :return: the started asyncio server; its port is server.sockets[0].getsockname()[1]
+    """
+    async def handle(reader, writer):
+        symbol = (await reader.readline()).decode().strip()
+        df = frames.get(symbol)
+        if df is not None:
+            times = df.index.as_unit('ns').asi8
+            columns = [df[col].to_numpy().tolist() for col in ['o', 'h', 'l', 'c']]
+            for i, t in enumerate(times):
+                writer.write(f"{t},{columns[0][i]!r},{columns[1][i]!r},{columns[2][i]!r},{columns[3][i]!r}\n".encode())
+                if delay:
+                    await writer.drain()
+                    await asyncio.sleep(delay)
+                elif i % 1024 == 1023:
+                    await writer.drain()
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def socket_bars(symbol: str, host: str = '127.0.0.1', port: int = 0):
+    """
+    Bars of `symbol` read from a serve_bars() style line feed.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    writer.write(f"{symbol}\n".encode())
+    await writer.drain()
+    try:
+        async for line in reader:
+            t, o, h, l, c = line.split(b',')
+            yield Bar(pd.Timestamp(int(t)), float(o), float(h), float(l), float(c))
+    finally:
+        writer.close()
+
+
+def replay_parity(df: pd.DataFrame, window: int, lag: int, symbol: str = "gold"):
+    """
+    Assert a replay through the LiveRuntime and SimulatedBroker gives the batch backtester's trades;
+    returns the symbol's latency summary.
+    """
+    from backtesting_scaling import SwingBacktesterWithScaling
+
+    batch = SwingBacktesterWithScaling(data=df, lag=lag, window=window)
+    batch.run_backtest(engine='array')
+    broker = SimulatedBroker()
+    runtime = LiveRuntime(broker, window, lag)
+    runtime.add_stream(symbol, frame_bars(df))
+    errors = asyncio.run(runtime.run())
+    if errors:
+        raise errors[symbol]
+    pd.testing.assert_frame_equal(broker.trade_log(symbol), batch.bt, check_dtype=False, check_exact=True)
+    return runtime.latency[symbol].summary()
+
+
+def replay_grid(df: pd.DataFrame, combos=PARITY_COMBOS):
+    """
+    replay_parity() of every (window, lag) combo, printing each one's latency.
+    """
+    for window, lag in combos:
+        latency = replay_parity(df, window, lag)
+        print(f"✅ lag={lag} win={window}: same trades as the batch backtester, "
+              f"{latency['mean_us']:.1f} µs/bar (p99 {latency['p99_us']:.1f} µs)")
+
+
+if __name__ == "__main__":
+    import argparse
+    from benchmarks.synthetic import synthetic_ohlc
+
+    parser = argparse.ArgumentParser(description="Live replay vs batch backtester parity check")
+    parser.add_argument('--bars', type=int, default=20_000, help="synthetic bars to replay")
+    parser.add_argument('--full', action='store_true', help="also replay the full ./data/gold.csv history")
+    args = parser.parse_args()
+
+    replay_grid(synthetic_ohlc(args.bars))
+    if args.full:
+        replay_grid(load_ohlc(os.path.join("./data", "gold.csv")))
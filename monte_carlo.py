@@ -0,0 +1,150 @@
+import concurrent.futures
+import os
+import warnings
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from generate_summary import load_trades, summarize
+from instrumentation import stage
+
+warnings.filterwarnings('ignore')
+
+METHODS = ('shuffle', 'bootstrap', 'block')
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+def resample_pnl(rng: np.random.Generator, pnl: np.ndarray, rows: int, method: str, block_size: int = 20):
+    """
+    (rows, trades) array of `rows` resampled trade PnL sequences.
+
+    'shuffle' reorders the trades (same trades, new order), 'bootstrap' draws trades with replacement
+    and 'block' glues circular blocks of `block_size` consecutive trades, keeping streaks of wins
+    and losses together.
+    """
+    n = len(pnl)
+    if method == 'shuffle':
+        # in place, so the batch stays C-ordered for the row-wise running sums
+        values = np.tile(pnl, (rows, 1))
+        return rng.permuted(values, axis=1, out=values)
+    if method == 'bootstrap':
+        return pnl[rng.integers(0, n, size=(rows, n))]
+    if method == 'block':
+        size = max(1, min(block_size, n))
+        blocks = -(-n // size)
+        starts = rng.integers(0, n, size=(rows, blocks, 1))
+        return pnl[((starts + np.arange(size)) % n).reshape(rows, blocks * size)[:, :n]]
+    raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+
+
+def simulate(pnl: np.ndarray, n_resamples: int = 10_000, method: str = 'shuffle', block_size: int = 20,
+             seed=0, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Max drawdown and final PnL of `n_resamples` resampled equity curves of one trade log.
+
+    Resamples are drawn as 2-D (rows, trades) batches sized so a batch's indices, PnL and equity
+    arrays stay within `max_bytes`. Drawdown is measured like generate_summary's Max Drawdown,
+    from the running peak of cumulative PnL.
+
+    :return: (max drawdowns, final PnLs), one value per resample
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    n = len(pnl)
+    drawdowns = np.empty(n_resamples)
+    finals = np.empty(n_resamples)
+    if n == 0:
+        drawdowns[:] = finals[:] = np.nan
+        return drawdowns, finals
+    rng = np.random.default_rng(seed)
+    rows = int(max(1, min(n_resamples, max_bytes // (3 * 8 * n))))
+    for start in range(0, n_resamples, rows):
+        stop = min(n_resamples, start + rows)
+        equity = resample_pnl(rng, pnl, stop - start, method, block_size)
+        np.cumsum(equity, axis=1, out=equity)
+        finals[start:stop] = equity[:, -1]
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.subtract(peak, equity, out=peak)
+        drawdowns[start:stop] = peak.max(axis=1)
+    return drawdowns, finals
+
+
+def _combo_seed(seed: int, symbol: str, lag: int, window: int):
+    # the same combo gets the same draws whatever the worker or the order it runs in
+    return np.random.SeedSequence([seed, zlib.crc32(str(symbol).encode()), lag, window])
+
+
+def _combo_intervals(key, pnl, n_resamples, methods, block_size, confidence, seed, max_bytes):
+    """
+    Confidence interval columns of one (symbol, lag, window) for every method.
+    """
+    symbol, lag, window = key
+    lo, hi = (1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100
+    row = {'Symbol': symbol, 'Lag': lag, 'Window': window}
+    for method, child in zip(methods, _combo_seed(seed, symbol, lag, window).spawn(len(methods))):
+        drawdowns, finals = simulate(pnl, n_resamples, method, block_size, child, max_bytes)
+        name = method.capitalize()
+        row[f'{name} Max Drawdown p{lo:g}'], row[f'{name} Max Drawdown p50'], row[f'{name} Max Drawdown p{hi:g}'] = \
+            np.percentile(drawdowns, [lo, 50, hi])
+        if method != 'shuffle':  # reordering never changes the final PnL
+            row[f'{name} Final PnL p{lo:g}'], row[f'{name} Final PnL p50'], row[f'{name} Final PnL p{hi:g}'] = \
+                np.percentile(finals, [lo, 50, hi])
+            row[f'{name} P(Loss) (%)'] = np.mean(finals < 0) * 100
+    return row
+
+
+def monte_carlo(trades: pd.DataFrame, n_resamples: int = 10_000, methods=('shuffle', 'block'), block_size: int = 20,
+                confidence: float = 0.90, seed: int = 0, max_workers: int = 1, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Resampled max drawdown / final PnL confidence intervals per (Symbol, Lag, Window) of a trades table.
+
+    :param trades: stacked trade logs as from generate_summary.load_trades() (trade order within each combo)
+    :param methods: any of 'shuffle', 'bootstrap', 'block'
+    :param confidence: central interval reported, e.g. 0.90 gives the 5th and 95th percentiles
+    :param max_workers: processes simulating combos in parallel (1 runs in this process)
+    :param max_bytes: memory budget of one resample batch, per process
+    :return: one row per combo, in first-appearance order
+    """
+    for method in methods:
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+    if trades.empty:
+        return pd.DataFrame(columns=['Symbol', 'Lag', 'Window'])
+    if 'Symbol' not in trades:
+        trades = trades.assign(Symbol="gold")
+    pnl = trades['PnL'].to_numpy(dtype=np.float64)
+    groups = trades.groupby(['Symbol', 'Lag', 'Window'], sort=False, observed=True).indices
+    args = (n_resamples, tuple(methods), block_size, confidence, seed, max_bytes)
+
+    with stage('monte_carlo', trades=len(trades)):
+        if max_workers <= 1:
+            rows = [_combo_intervals(key, pnl[idx], *args) for key, idx in groups.items()]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                rows = list(executor.map(_combo_intervals, groups.keys(), (pnl[idx] for idx in groups.values()),
+                                         *([arg] * len(groups) for arg in args)))
+    return pd.DataFrame(rows)
+
+
+def monte_carlo_summary(trades_folder, output_file, n_resamples: int = 10_000, methods=('shuffle', 'block'),
+                        block_size: int = 20, confidence: float = 0.90, seed: int = 0, max_workers: int = 1,
+                        max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    generate_summary() of a folder of trade logs (CSVs or a TradeStore) with Monte Carlo intervals appended.
+
+    :return: one row per (Symbol, Lag, Window): the summary columns, then the resampled intervals
+    """
+    trades = load_trades(trades_folder)
+    summary = summarize(trades)
+    intervals = monte_carlo(trades, n_resamples, methods, block_size, confidence, seed, max_workers, max_bytes)
+    if not summary.empty:
+        summary = summary.merge(intervals, on=['Symbol', 'Lag', 'Window'], how='left')
+    summary.to_csv(output_file, index=False)
+    print(f"\n🚀 Monte Carlo summary saved to {output_file}")
+    return summary
+
+
+if __name__ == "__main__":
+    monte_carlo_summary("./trade_store/without_scaling",
+                        os.path.join("./Summary", "Monte_Carlo_without_scaling.csv"),
+                        max_workers=os.cpu_count())
@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+
+from kernels import njit
+
+PIVOT_HIGH, PIVOT_LOW = 1, -1
+KIND_LABELS = {PIVOT_HIGH: 'High', PIVOT_LOW: 'Low'}
+
+# One row per pivot, in bar order (a bar that is both a high and a low pivot gets two rows, high first)
+PIVOT_DTYPE = np.dtype([
+    ('bar', np.int64),
+    ('price', np.float64),
+    ('kind', np.int8),
+    ('confirm_bar', np.int64),
+])
+
+
+@njit(cache=True)
+def _is_pivot(value, left, right, strict):
+    if value != value:
+        return False
+    if strict:
+        return value > left and value > right
+    return value >= left and value >= right
+
+
+@njit(cache=True)
+def _scan_pivots(x, window, strict, bars, confirms):
+    """
+    Bars whose value is the max of [i - window, i + window] (NaNs skipped, window clipped at the edges).
+
+    One pass with a monotonic deque over the trailing `window` bars: when bar j arrives, the
+    trailing max ending at j is the right-hand side of candidate i = j - window, and the trailing
+    max ending at i - 1, kept in a ring of the last window + 2 or more of them, its left-hand side. So
+    candidate i is decided on bar i + window, its confirmation bar. The last `window` bars only
+    have the truncated right side left when the data ends and are confirmed on the last bar.
+    Writes pivot bars / confirmation bars and returns the count.
+    """
+    n = len(x)
+    # power-of-two rings, so wrapping is a mask instead of a division
+    cap = 1
+    while cap < window + 2:
+        cap *= 2
+    mask = cap - 1
+    queue = np.empty(cap, dtype=np.int64)  # bar numbers, values decreasing from the head
+    head = 0
+    size = 0
+    trailing = np.full(cap, -np.inf)       # trailing max ending at bar j, at j & mask
+    k = 0
+    for j in range(n):
+        if size > 0 and queue[head] <= j - window:
+            head = (head + 1) & mask
+            size -= 1
+        value = x[j]
+        if window > 0 and value == value:
+            while size > 0 and x[queue[(head + size - 1) & mask]] <= value:
+                size -= 1
+            queue[(head + size) & mask] = j
+            size += 1
+        right = x[queue[head]] if size > 0 else -np.inf
+        trailing[j & mask] = right
+        i = j - window
+        if i >= 0:
+            left = trailing[(i - 1) & mask] if i > 0 else -np.inf
+            if _is_pivot(x[i], left, right, strict):
+                bars[k] = i
+                confirms[k] = j
+                k += 1
+
+    # tail: right side runs into the end of the data
+    first = max(0, n - window)
+    right = -np.inf
+    suffix = np.empty(n - first, dtype=np.float64)
+    for i in range(n - 1, first - 1, -1):
+        suffix[i - first] = right
+        if x[i] == x[i]:
+            right = max(right, x[i])
+    for i in range(first, n):
+        left = trailing[(i - 1) & mask] if i > 0 else -np.inf
+        if _is_pivot(x[i], left, suffix[i - first], strict):
+            bars[k] = i
+            confirms[k] = n - 1
+            k += 1
+    return k
+
+
+class PivotIndex:
+    """
+    Compact, bar-ordered index of swing pivots: bar, price, kind (PIVOT_HIGH / PIVOT_LOW) and
+    confirmation bar, the first bar on which the pivot is known without looking ahead.
+
+    Queries take bar positions and use binary search over the index, so callers never need
+    full-length flag or level columns.
+    """
+    def __init__(self, records: np.ndarray, n_bars: int, window: int, strict: bool = False):
+        self.records = records
+        self.n_bars = n_bars
+        self.window = window
+        self.strict = strict
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return (f"PivotIndex({len(self.highs())} highs, {len(self.lows())} lows over {self.n_bars} bars, "
+                f"window={self.window}, strict={self.strict})")
+
+    def of_kind(self, kind: int) -> np.ndarray:
+        """
+        Records of one kind, in bar order.
+        """
+        return self.records[self.records['kind'] == kind]
+
+    def highs(self) -> np.ndarray:
+        return self.of_kind(PIVOT_HIGH)
+
+    def lows(self) -> np.ndarray:
+        return self.of_kind(PIVOT_LOW)
+
+    def is_pivot(self, positions, kind: int, lag: int = 0) -> np.ndarray:
+        """
+        Whether bar `position - lag` is a pivot of `kind`, per position (False before the history).
+        """
+        bars = self.of_kind(kind)['bar']
+        src = np.asarray(positions, dtype=np.int64) - lag
+        if not len(bars):
+            return np.zeros(np.shape(src), dtype=np.bool_)
+        at = np.minimum(np.searchsorted(bars, src), len(bars) - 1)
+        return bars[at] == src
+
+    def last(self, positions, kind: int, lag: int = 0, confirmed: bool = False) -> np.ndarray:
+        """
+        Row in of_kind(kind) of the latest pivot at bar <= position - lag, -1 where there is none.
+
+        :param confirmed: only pivots whose confirmation bar is <= position (lookahead-safe);
+                          confirmation bars grow with pivot bars, so this is a second search
+        """
+        pivots = self.of_kind(kind)
+        positions = np.asarray(positions, dtype=np.int64)
+        row = np.searchsorted(pivots['bar'], positions - lag, side='right') - 1
+        if confirmed:
+            row = np.minimum(row, np.searchsorted(pivots['confirm_bar'], positions, side='right') - 1)
+        return row
+
+    def level_at(self, positions, kind: int, lag: int = 0, confirmed: bool = False) -> np.ndarray:
+        """
+        Price of the latest pivot of `kind` as seen from each position (see last()), NaN before the first.
+        """
+        pivots = self.of_kind(kind)
+        row = self.last(positions, kind, lag, confirmed)
+        if not len(pivots):
+            return np.full(np.shape(row), np.nan)
+        return np.where(row >= 0, pivots['price'][np.maximum(row, 0)], np.nan)
+
+    def known_at(self, position: int) -> np.ndarray:
+        """
+        Every pivot confirmed on or before `position`.
+        """
+        return self.records[self.records['confirm_bar'] <= position]
+
+    def between(self, start: int, stop: int, kind: int = None) -> np.ndarray:
+        """
+        Pivots with bar in [start, stop], optionally of one kind.
+        """
+        records = self.records if kind is None else self.of_kind(kind)
+        bars = records['bar']
+        return records[np.searchsorted(bars, start, side='left'):np.searchsorted(bars, stop, side='right')]
+
+    def count_between(self, starts, stops, kind: int) -> np.ndarray:
+        """
+        Number of pivots of `kind` with bar in [start, stop] per pair, e.g. per trade's entry / exit bars.
+        """
+        bars = self.of_kind(kind)['bar']
+        return (np.searchsorted(bars, np.asarray(stops), side='right')
+                - np.searchsorted(bars, np.asarray(starts), side='left'))
+
+    def flags(self, kind: int, lag: int = 0, fill: bool = False) -> np.ndarray:
+        """
+        Full-length bool column: bar p flags a pivot at p - lag; the first `lag` bars get `fill`.
+
+        Only for consumers that need a column (the kernels, exported data).
+        """
+        flags = np.zeros(self.n_bars, dtype=np.bool_)
+        bars = self.of_kind(kind)['bar'] + lag
+        flags[bars[bars < self.n_bars]] = True
+        flags[:min(lag, self.n_bars)] = fill
+        return flags
+
+    def to_frame(self, index: pd.Index = None) -> pd.DataFrame:
+        """
+        The index as a DataFrame; with the bars' time index, pivot and confirmation times are added.
+        """
+        records = self.records
+        frame = pd.DataFrame({
+            'Bar': records['bar'],
+            'Type': pd.Series(records['kind']).map(KIND_LABELS).to_numpy(),
+            'Price': records['price'],
+            'Confirm Bar': records['confirm_bar'],
+        })
+        if index is not None:
+            frame.insert(1, 'Time', index[records['bar']])
+            frame['Confirm Time'] = index[records['confirm_bar']]
+        return frame
+
+
+def find_pivots(h, l, window: int, strict: bool = False) -> PivotIndex:
+    """
+    Swing highs / lows of a history in O(n): bars whose high (low) is the highest (lowest) of
+    the centered window [i - window, i + window].
+
+    :param strict: a pivot must beat every other bar of its window; otherwise ties count, so a flat
+                   top of equal highs flags every bar of it (the rolling h == max_h rule)
+    """
+    if window < 0:
+        raise ValueError(f"window must be non-negative, got {window}")
+    h = np.ascontiguousarray(h, dtype=np.float64)
+    l = np.ascontiguousarray(l, dtype=np.float64)
+    n = len(h)
+    found = []
+    for kind, values, sign in ((PIVOT_HIGH, h, 1.0), (PIVOT_LOW, l, -1.0)):
+        bars = np.empty(n, dtype=np.int64)
+        confirms = np.empty(n, dtype=np.int64)
+        k = _scan_pivots(values * sign, window, strict, bars, confirms)
+        records = np.empty(k, dtype=PIVOT_DTYPE)
+        records['bar'] = bars[:k]
+        records['price'] = values[bars[:k]]
+        records['kind'] = kind
+        records['confirm_bar'] = confirms[:k]
+        found.append(records)
+    records = np.concatenate(found)
+    # bar order, highs before lows on the same bar
+    records = records[np.lexsort((-records['kind'], records['bar']))]
+    return PivotIndex(records, n, window, strict)
+
+
+def trade_swings(pivots: PivotIndex, entry_bars, exit_bars, index: pd.Index = None) -> pd.DataFrame:
+    """
+    Swing highs / lows formed between each trade's entry and exit bars, and the latest swing
+    levels confirmed by its entry bar.
+
+    :param index: index of the returned frame, e.g. the trade log's
+    """
+    return pd.DataFrame({
+        'Swing Highs': pivots.count_between(entry_bars, exit_bars, PIVOT_HIGH),
+        'Swing Lows': pivots.count_between(entry_bars, exit_bars, PIVOT_LOW),
+        'Entry Swing High': pivots.level_at(entry_bars, PIVOT_HIGH, confirmed=True),
+        'Entry Swing Low': pivots.level_at(entry_bars, PIVOT_LOW, confirmed=True),
+    }, index=index)
+
+
+class PivotQueries:
+    """
+    Pivot queries shared by the backtesters, over their `data` highs / lows, `window`, `_pivots`
+    cache and the `bt`, `entry_bars` and `exit_bars` of the last run.
+    """
+    def pivot_index(self, strict: bool = False) -> PivotIndex:
+        """
+        PivotIndex of the window's swing highs / lows, built once per tie rule.
+
+        These are the bars that are the extremum of their own centered window; strict=True only
+        keeps bars that beat every other bar of it.
+        """
+        if strict not in self._pivots:
+            self._pivots[strict] = find_pivots(self.data['h'].to_numpy(dtype=np.float64),
+                                               self.data['l'].to_numpy(dtype=np.float64), self.window, strict)
+        return self._pivots[strict]
+
+    def trade_swings(self, strict: bool = False) -> pd.DataFrame:
+        """
+        trade_swings() of the last run's trades, from the pivot index (no full-length columns).
+        """
+        if self.bt is None or self.bt.empty:
+            return pd.DataFrame()
+        return trade_swings(self.pivot_index(strict), self.entry_bars, self.exit_bars, self.bt.index)
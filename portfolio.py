@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from kernels import njit
+
+SIZING_RULES = ('fixed_fractional', 'atr', 'sl_risk')
+STREAM_KEYS = ['Symbol', 'Lag', 'Window']
+
+
+def average_true_range(h, l, c, period: int = 14) -> np.ndarray:
+    """
+    Simple moving average of the true range over `period` bars (NaN until the window is full).
+    """
+    h, l, c = (np.asarray(x, dtype=np.float64) for x in (h, l, c))
+    prev_c = np.r_[np.nan, c[:-1]]
+    tr = np.fmax(h - l, np.fmax(np.abs(h - prev_c), np.abs(l - prev_c)))
+    atr = np.full(len(tr), np.nan)
+    if len(tr) >= period:
+        csum = np.cumsum(np.r_[0.0, tr])
+        atr[period - 1:] = (csum[period:] - csum[:-period]) / period
+    return atr
+
+
+@njit(cache=True)
+def _compounded_sizes(order, is_exit, trade, risk, notional, pnl, fraction, max_leverage, capital, sizes):
+    """
+    Walk entry / exit events in time order, sizing each entry off the equity realized so far,
+    its notional capped at `max_leverage` times that equity.
+    """
+    equity = capital
+    for e in order:
+        i = trade[e]
+        if is_exit[e]:
+            equity += sizes[i] * pnl[i]
+        elif risk[i] > 0 and equity > 0:
+            sizes[i] = fraction * equity / risk[i]
+            if notional[i] > 0:
+                sizes[i] = min(sizes[i], max_leverage * equity / notional[i])
+    return equity
+
+
+def _point_value(point_value, symbol: str) -> float:
+    """
+    Currency per price unit of `symbol`: one number for every symbol, or a {symbol: number} that must list it.
+    """
+    if not isinstance(point_value, dict):
+        return float(point_value)
+    if symbol not in point_value:
+        raise ValueError(f"No point value for symbol {symbol!r}")
+    return float(point_value[symbol])
+
+
+def _bar_positions(index: pd.DatetimeIndex, times) -> np.ndarray:
+    """
+    Bar number of every trade time in a symbol's bar index (times come from that index).
+    """
+    values = index.to_numpy().view(np.int64)
+    times = np.asarray(times).astype(index.dtype).view(np.int64)
+    return np.minimum(np.searchsorted(values, times), len(values) - 1)
+
+
+def _units(trades: pd.DataFrame) -> np.ndarray:
+    # non-scaling logs have no Units column (or NaN once stacked with scaling ones): one unit per trade
+    if 'Units' not in trades:
+        return np.ones(len(trades))
+    return np.nan_to_num(trades['Units'].to_numpy(dtype=np.float64), nan=1.0)
+
+
+def size_trades(trades: pd.DataFrame, bars=None, capital: float = 100_000.0, sizing: str = 'fixed_fractional',
+                fraction: float = 0.01, atr_period: int = 14, atr_multiple: float = 2.0, compounding: bool = True,
+                point_value=1.0, max_leverage: float = 10.0) -> pd.DataFrame:
+    """
+    Size every trade of several trade streams against one account.
+
+    A trade's size multiplies its logged position (Units units for the scaling variant, 1 otherwise):
+      - 'fixed_fractional': the position's notional is `fraction` of equity
+      - 'atr': `atr_multiple` ATRs (of the bar before entry) against the position risk `fraction` of equity
+      - 'sl_risk': the distance from the entry to 'SL Price' risks `fraction` of equity (for the scaling
+        variant this is the stop at exit, the only one logged)
+    With `compounding`, equity is the capital plus the PnL of every trade closed before the entry, over
+    all streams merged in time order (exits first on ties); otherwise sizes use the starting capital.
+    Every size is capped so the position's notional stays within `max_leverage` times that equity.
+    Trades with no risk to size against (e.g. no ATR before the entry, or a stop at the entry price)
+    are reported and left at size 0.
+
+    :param trades: stacked trade logs with 'Symbol' / 'Lag' / 'Window' (e.g. generate_summary.load_trades())
+    :param bars: {symbol: OHLC DataFrame}, needed by 'atr'
+    :param point_value: currency per price unit and unit, one number or {symbol: number} listing every symbol
+    :param max_leverage: largest position notional as a multiple of equity (None: uncapped)
+    :return: the trades in entry order with 'Risk', 'Size' and 'Sized PnL' columns
+    """
+    if sizing not in SIZING_RULES:
+        raise ValueError(f"Unknown sizing {sizing!r}, expected one of {SIZING_RULES}")
+    trades = trades.sort_values('Entry Time', kind='stable', ignore_index=True)
+    if 'Symbol' not in trades:
+        trades['Symbol'] = "gold"
+    symbols = trades['Symbol'].astype(str).to_numpy()
+    units = _units(trades)
+    points = np.empty(len(trades))
+    for symbol, rows in pd.Series(np.arange(len(trades))).groupby(symbols).indices.items():
+        points[rows] = _point_value(point_value, symbol)
+    entry = trades['Entry Price'].to_numpy(dtype=np.float64)
+    notional = np.abs(entry) * units * points
+    max_leverage = np.inf if max_leverage is None else float(max_leverage)
+
+    with stage('portfolio.size', trades=len(trades)):
+        if sizing == 'fixed_fractional':
+            risk = notional
+        elif sizing == 'sl_risk':
+            risk = np.abs(entry - trades['SL Price'].to_numpy(dtype=np.float64)) * units * points
+        else:
+            if bars is None:
+                raise ValueError("sizing='atr' needs the bars of every symbol")
+            atr = np.full(len(trades), np.nan)
+            for symbol, rows in pd.Series(np.arange(len(trades))).groupby(symbols).indices.items():
+                df = bars[symbol]
+                values = average_true_range(df['h'], df['l'], df['c'], atr_period)
+                entry_bars = _bar_positions(df.index, trades['Entry Time'].to_numpy()[rows])
+                atr[rows] = np.where(entry_bars > 0, values[np.maximum(entry_bars - 1, 0)], np.nan)
+            risk = atr_multiple * atr * units * points
+        risk = np.where(np.isfinite(risk), risk, 0.0)
+        unsized = np.flatnonzero(risk <= 0)
+        if len(unsized):
+            first = trades.iloc[unsized[0]]
+            print(f"⚠️ {len(unsized)} of {len(trades)} trades have no {sizing} risk to size against and stay "
+                  f"unsized (first: {first['Symbol']} entry {first['Entry Time']})")
+        pnl = trades['PnL'].to_numpy(dtype=np.float64) * points
+
+        sizes = np.zeros(len(trades))
+        if compounding:
+            n = len(trades)
+            times = np.r_[trades['Exit Time'].to_numpy().view(np.int64), trades['Entry Time'].to_numpy().view(np.int64)]
+            is_exit = np.r_[np.ones(n, dtype=np.bool_), np.zeros(n, dtype=np.bool_)]
+            order = np.lexsort((~is_exit, times))  # time order, exits before entries of the same bar
+            _compounded_sizes(order, is_exit, np.r_[np.arange(n), np.arange(n)], risk, notional, pnl, fraction,
+                              max_leverage, float(capital), sizes)
+        else:
+            np.divide(fraction * capital, risk, out=sizes, where=risk > 0)
+            with np.errstate(divide='ignore'):
+                cap = np.where(notional > 0, max_leverage * capital / notional, np.inf)
+            np.minimum(sizes, cap, out=sizes)
+    trades['Risk'] = risk
+    trades['Size'] = sizes
+    trades['Sized PnL'] = sizes * pnl
+    return trades
+
+
+def equity_curve(sized: pd.DataFrame, bars=None, capital: float = 100_000.0, point_value=1.0) -> pd.DataFrame:
+    """
+    Bar-level account equity of sized trades.
+
+    Realized PnL is booked on exit bars. With `bars`, open positions are also marked to each bar's
+    close: per symbol, the net signed quantity and entry cost are accumulated from entry / exit
+    events with difference arrays, so the curve costs O(bars + trades). Scaled-in positions are
+    marked at their average entry price from the entry bar on (scale-in times are not logged).
+
+    :param bars: {symbol: OHLC DataFrame}; without it the curve has one row per exit time, realized only
+    :param point_value: as for size_trades()
+    :return: DataFrame indexed by time with 'Realized', 'Unrealized', 'Equity' and 'Drawdown (%)'
+    """
+    with stage('portfolio.equity', trades=len(sized)):
+        exit_times = sized['Exit Time'].to_numpy()
+        if bars:
+            timeline = np.unique(np.concatenate([df.index.to_numpy().astype(exit_times.dtype) for df in bars.values()]))
+        else:
+            timeline = np.unique(exit_times)
+        realized = np.zeros(len(timeline))
+        np.add.at(realized, np.searchsorted(timeline, exit_times), sized['Sized PnL'].to_numpy())
+        realized = np.cumsum(realized)
+
+        unrealized = np.zeros(len(timeline))
+        if bars:
+            units = _units(sized)
+            direction = np.where(sized['Direction'].astype(str).to_numpy() == 'Long', 1.0, -1.0)
+            quantity = sized['Size'].to_numpy() * units * direction
+            symbols = sized['Symbol'].astype(str).to_numpy()
+            for symbol, rows in pd.Series(np.arange(len(sized))).groupby(symbols).indices.items():
+                df = bars[symbol]
+                points = _point_value(point_value, symbol)
+                n = len(df)
+                entry_bars = _bar_positions(df.index, sized['Entry Time'].to_numpy()[rows])
+                exit_bars = _bar_positions(df.index, exit_times[rows])
+                held, cost = np.zeros(n + 1), np.zeros(n + 1)
+                q = quantity[rows]
+                qc = q * sized['Entry Price'].to_numpy(dtype=np.float64)[rows]
+                np.add.at(held, entry_bars, q)
+                np.add.at(held, exit_bars, -q)
+                np.add.at(cost, entry_bars, qc)
+                np.add.at(cost, exit_bars, -qc)
+                marked = (np.cumsum(held)[:n] * df['c'].to_numpy(dtype=np.float64) - np.cumsum(cost)[:n]) * points
+                # carry the symbol's last mark over the other symbols' bars
+                at = np.searchsorted(df.index.to_numpy().astype(timeline.dtype), timeline, side='right') - 1
+                unrealized += np.where(at >= 0, marked[np.maximum(at, 0)], 0.0)
+
+        equity = capital + realized + unrealized
+        peak = np.maximum.accumulate(equity)
+        curve = pd.DataFrame({
+            'Realized': realized,
+            'Unrealized': unrealized,
+            'Equity': equity,
+            'Drawdown (%)': (peak - equity) / peak * 100,
+        }, index=pd.DatetimeIndex(timeline, name='t'))
+    return curve
+
+
+def portfolio_metrics(curve: pd.DataFrame, periods_per_year: int = 252) -> dict:
+    """
+    Risk-adjusted metrics of an equity curve, from its daily closing equity.
+
+    Once equity reaches zero or below the account is ruined: the curve is cut at that bar and its
+    equity floored at zero, so the run ends at -100% instead of producing returns off a negative base.
+    The Sortino ratio uses the downside deviation over all days (positive days count as zero).
+    """
+    equity = curve['Equity']
+    ruined = np.flatnonzero(equity.to_numpy() <= 0)
+    if len(ruined):
+        equity = equity.iloc[:ruined[0] + 1].clip(lower=0.0)
+    daily = equity.resample('1D').last().dropna()
+    returns = daily.pct_change().dropna().to_numpy()
+    start, end = equity.iloc[0], equity.iloc[-1]
+    years = (equity.index[-1] - equity.index[0]).total_seconds() / (365.25 * 86400)
+    cagr = (end / start) ** (1 / years) - 1 if years > 0 and start > 0 else np.nan
+    max_dd = curve['Drawdown (%)'].iloc[:len(equity)].clip(upper=100.0).max()
+    mean = returns.mean() if len(returns) else np.nan
+    downside_deviation = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) if len(returns) else np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if downside_deviation > 0:
+            sortino = mean / downside_deviation * np.sqrt(periods_per_year)
+        else:
+            sortino = np.inf if mean > 0 else np.nan  # no losing day
+        metrics = {
+            'Total Return (%)': (end / start - 1) * 100 if start > 0 else np.nan,
+            'CAGR (%)': cagr * 100,
+            'Max Drawdown (%)': max_dd,
+            'Sharpe Ratio': mean / returns.std(ddof=1) * np.sqrt(periods_per_year)
+            if len(returns) > 1 else np.nan,
+            'Sortino Ratio': sortino,
+            'Calmar Ratio': cagr * 100 / max_dd if max_dd > 0 else np.nan,
+        }
+    return {name: float(value) for name, value in metrics.items()}
+
+
+def simulate_portfolio(trades: pd.DataFrame, bars=None, capital: float = 100_000.0,
+                       sizing: str = 'fixed_fractional', fraction: float = 0.01, atr_period: int = 14,
+                       atr_multiple: float = 2.0, compounding: bool = True, point_value=1.0,
+                       max_leverage: float = 10.0):
+    """
+    size_trades() + equity_curve() + portfolio_metrics() over several symbols and parameter sets.
+
+    :return: (sized trades, bar-level equity curve, metrics dict)
+    """
+    sized = size_trades(trades, bars, capital, sizing, fraction, atr_period, atr_multiple, compounding, point_value,
+                        max_leverage)
+    curve = equity_curve(sized, bars, capital, point_value)
+    return sized, curve, portfolio_metrics(curve)
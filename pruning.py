@@ -0,0 +1,335 @@
+import math
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+
+from chunked import ChunkedFeatures
+from instrumentation import stage
+from kernels import (
+    without_scaling_resume, scaling_resume, mae_mfe, trades_to_frame, TRADE_DTYPE, STATE_SIZE,
+)
+from sweep import SweepData, save_trades, VARIANTS
+
+METRICS = ('trades', 'total_pnl', 'average_pnl', 'max_drawdown', 'win_rate', 'expectancy')
+_OPS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+_RULE = re.compile(r"^\s*(?P<metric>\w+)\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>[-+.\deE]+)"
+                   r"(?:\s+after\s+(?P<min_trades>\d+)(?:\s+trades)?)?\s*$")
+
+
+class RunningMetrics:
+    """
+    Summary metrics of the trades closed so far, updated one batch of PnLs at a time.
+
+    Definitions follow generate_summary (drawdown from the running peak of cumulative PnL,
+    expectancy from win rate, average win and average loss).
+    """
+    def __init__(self):
+        self.trades = 0
+        self.wins = 0
+        self.losses = 0
+        self.win_pnl = 0.0
+        self.loss_pnl = 0.0
+        self.cumulative = 0.0
+        self.peak = -np.inf
+        self.max_drawdown = np.nan
+
+    def update(self, pnl: np.ndarray):
+        if len(pnl) == 0:
+            return
+        self.trades += len(pnl)
+        wins, losses = pnl > 0, pnl < 0
+        self.wins += int(wins.sum())
+        self.losses += int(losses.sum())
+        self.win_pnl += pnl[wins].sum()
+        self.loss_pnl += pnl[losses].sum()
+        # summed in trade order from the carried total, like the trade logs' Cumulative PnL
+        cum = np.cumsum(np.r_[self.cumulative, pnl])[1:]
+        peak = np.maximum.accumulate(np.maximum(cum, self.peak))
+        self.max_drawdown = np.fmax(self.max_drawdown, (peak - cum).max())
+        self.cumulative, self.peak = cum[-1], peak[-1]
+
+    @property
+    def total_pnl(self):
+        return self.cumulative
+
+    @property
+    def average_pnl(self):
+        return self.cumulative / self.trades if self.trades else np.nan
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades * 100 if self.trades else np.nan
+
+    @property
+    def expectancy(self):
+        if not self.trades:
+            return np.nan
+        avg_win = self.win_pnl / self.wins if self.wins else np.nan
+        avg_loss = self.loss_pnl / self.losses if self.losses else np.nan
+        rate = self.wins / self.trades
+        return rate * avg_win + (1 - rate) * avg_loss
+
+    def as_dict(self):
+        return {metric: getattr(self, metric) for metric in METRICS}
+
+
+class Rule:
+    """
+    Prune a combo when `metric op threshold` holds once at least `min_trades` trades closed.
+
+    e.g. Rule('max_drawdown', '>', 1000) or Rule.parse("expectancy < 0 after 50 trades")
+    """
+    def __init__(self, metric: str, op: str, threshold: float, min_trades: int = 0):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+        if op not in _OPS:
+            raise ValueError(f"Unknown operator {op!r}, expected one of {tuple(_OPS)}")
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.min_trades = min_trades
+
+    @classmethod
+    def parse(cls, text: str):
+        match = _RULE.match(text)
+        if match is None:
+            raise ValueError(f"Cannot parse rule {text!r}, expected e.g. 'max_drawdown > 1000 after 20'")
+        return cls(match['metric'], match['op'], float(match['threshold']), int(match['min_trades'] or 0))
+
+    def __call__(self, metrics: RunningMetrics) -> bool:
+        # NaN metrics (e.g. expectancy without losing trades) never prune
+        return metrics.trades >= self.min_trades and bool(_OPS[self.op](getattr(metrics, self.metric), self.threshold))
+
+    def __str__(self):
+        after = f" after {self.min_trades}" if self.min_trades else ""
+        return f"{self.metric} {self.op} {self.threshold:g}{after}"
+
+    __repr__ = __str__
+
+
+def as_rules(rules):
+    return [rule if isinstance(rule, Rule) else Rule.parse(rule) for rule in rules or ()]
+
+
+class ComboRun:
+    """
+    One (lag, window) combo that can be advanced through the history and resumed later.
+
+    The compiled kernels run block by block from the carried position state, and the
+    running metrics are checked against the pruning rules after every block. Features are
+    built per block too (ChunkedFeatures, carrying swing levels and pending grabs), so a combo
+    never holds full-history arrays; with a FeatureCache the cached arrays are sliced instead.
+    """
+    def __init__(self, data: SweepData, window: int, lag: int, variant: str = 'without_scaling', rules=(),
+                 start: int = 0):
+        """
+        :param start: first bar the combo may trade on, flat (bar start - 1 is only looked back to)
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+        self.data = data
+        self.window = window
+        self.lag = lag
+        self.variant = variant
+        self.rules = as_rules(rules)
+        self.bar = start             # bars [start, bar) are done
+        self.state = np.zeros(STATE_SIZE)
+        self.blocks = []
+        self.metrics = RunningMetrics()
+        self.pruned_by = None        # Rule that stopped the combo
+        self.pruned_at = None        # bar where it stopped
+        self.release()
+
+    @property
+    def pruned(self) -> bool:
+        return self.pruned_by is not None
+
+    def advance(self, stop: int, check_every: int = 50_000):
+        """
+        Run bars [self.bar, stop) in blocks of `check_every` bars, stopping early if a rule fires.
+        """
+        stop = min(stop, len(self.data))
+        if self.pruned or self.bar >= stop:
+            return self
+        while self.bar < stop and not self.pruned:
+            end = min(stop, self.bar + check_every)
+            with stage('features', bars=end - self.bar):
+                signal, swing_high, swing_low = self._features(self.bar, end, check_every)
+            with stage('run_backtest.array', bars=end - self.bar) as timer:
+                trades = self._run_block(signal, swing_high, swing_low, self.bar, end)
+                timer.add(trades=len(trades))
+            self.bar = end
+            self.blocks.append(trades)
+            self.metrics.update(trades['pnl'])
+            for rule in self.rules:
+                if rule(self.metrics):
+                    self.pruned_by, self.pruned_at = rule, end
+                    break
+        if self.pruned:
+            self.release()
+        return self
+
+    def release(self):
+        """
+        Drop the carried features; a later advance() rebuilds them from bar 0.
+        """
+        self._chunked = None   # ChunkedFeatures, positioned at self.bar
+        self._prev = None      # (signal, swing_high, swing_low) of bar self.bar - 1
+        self._cached = None    # full-history arrays from the FeatureCache
+
+    def _features(self, start, end, check_every):
+        # (signal, swing_high, swing_low) of bars [max(0, start - 1), end)
+        first = max(0, start - 1)
+        if self.data.feature_cache is not None:
+            if self._cached is None:
+                self._cached = self.data.features(self.window, self.lag, self.variant)
+            return tuple(a[first:end] for a in self._cached)
+        if self._chunked is None:
+            self._chunked = ChunkedFeatures(self.data.h, self.data.l, self.window, self.lag, self.variant)
+            # levels and pending grabs carry over from the start of the history
+            for bar in range(0, start, check_every):
+                self._next_block(bar, min(start, bar + check_every))
+        return self._next_block(start, end)
+
+    def _next_block(self, start, end):
+        d = self.data
+        signal, swing_high, swing_low, _, _ = self._chunked.block(start, end, d.o[start:end], d.c[start:end])
+        block = (signal, swing_high, swing_low)
+        if self._prev is not None:
+            block = tuple(np.concatenate([p, a]) for p, a in zip(self._prev, block))
+        self._prev = tuple(a[-1:] for a in block)
+        return block
+
+    def _run_block(self, signal, swing_high, swing_low, start, end):
+        # the kernels look one bar back: a resumed block starts at the previous block's last bar
+        first = max(0, start - 1)
+        block = slice(first, end)
+        trades = np.empty(end - first, dtype=TRADE_DTYPE)
+        d = self.data
+        if self.variant == 'scaling':
+            k = scaling_resume(signal, d.o[block], d.h[block], d.l[block], swing_high, swing_low, trades,
+                               self.state, first)
+        else:
+            k = without_scaling_resume(signal, d.o[block], d.h[block], d.l[block], trades, self.state, first)
+        return trades[:k].copy()
+
+    def trades(self) -> np.ndarray:
+        return np.concatenate(self.blocks) if self.blocks else np.empty(0, dtype=TRADE_DTYPE)
+
+    def trade_log(self, with_mae_mfe: bool = True) -> pd.DataFrame:
+        """
+        Trades closed so far, in the run_combo() layout.
+        """
+        trades = self.trades()
+        with stage('trade_log', trades=len(trades)):
+            bt = trades_to_frame(self.data.index, trades, with_units=(self.variant == 'scaling'))
+            if not bt.empty:
+                bt['Cumulative PnL'] = bt['PnL'].cumsum()
+                bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+        if with_mae_mfe and not bt.empty:
+            with stage('calculate_mae_mfe', trades=len(trades)):
+                bt['MAE'], bt['MFE'] = mae_mfe(
+                    self.data.h, self.data.l, trades['entry_bar'], trades['exit_bar'],
+                    trades['entry_price'], trades['direction'] == 1,
+                )
+        return bt
+
+    def status(self, outcome: str = None, rung: int = None):
+        row = {'Lag': self.lag, 'Window': self.window,
+               'Status': outcome or ('pruned' if self.pruned else 'completed' if self.bar >= len(self.data) else 'open'),
+               'Rule': str(self.pruned_by) if self.pruned else None,
+               'Bars': self.bar}
+        if rung is not None:
+            row['Rung'] = rung
+        row.update(self.metrics.as_dict())
+        return row
+
+
+def pruned_sweep(df, window_values, lag_values, rules, variant: str = 'without_scaling', check_every: int = 50_000,
+                 output_dir=None, store=None, symbol_name: str = "gold", with_mae_mfe: bool = True,
+                 feature_cache=None):
+    """
+    Sweep the grid, aborting each combo as soon as one of `rules` fires.
+
+    Only combos that reach the end of the history are written (CSV / TradeStore) or returned.
+
+    :param rules: Rule objects or strings such as "max_drawdown > 1000" or "expectancy < 0 after 50"
+    :param check_every: bars between rule checks
+    :param feature_cache: FeatureCache for a DataFrame input (a SweepData brings its own)
+    :return: (list of (lag, window, trade log) of completed combos, DataFrame with one status row per combo)
+    """
+    data = df if isinstance(df, SweepData) else SweepData.from_frame(df, feature_cache)
+    rules = as_rules(rules)
+    results, rows = [], []
+    for window in window_values:
+        for lag in lag_values:
+            run = ComboRun(data, window, lag, variant, rules).advance(len(data), check_every)
+            rows.append(run.status())
+            if run.pruned:
+                print(f"✂️ Pruned Lag: {lag}, Window: {window} at bar {run.pruned_at:,} ({run.pruned_by})")
+                continue
+            bt = run.trade_log(with_mae_mfe)
+            if output_dir is not None or store is not None:
+                save_trades(bt, output_dir, lag, window, symbol_name, store)
+            else:
+                results.append((lag, window, bt))
+        data.release(window)
+    return results, pd.DataFrame(rows)
+
+
+def successive_halving(df, window_values, lag_values, variant: str = 'without_scaling', metric: str = 'total_pnl',
+                       eta: int = 2, rungs: int = None, rules=(), check_every: int = 50_000,
+                       with_mae_mfe: bool = True, feature_cache=None):
+    """
+    Successive halving over growing time slices of the history.
+
+    Every combo first runs on the first len/eta**(rungs-1) bars; after each rung only the best
+    1/eta of the survivors by `metric` (higher is better, max_drawdown lower is better) continue
+    to the next, eta times longer slice. Survivors resume from their saved position state, so no
+    bar is backtested twice. Pruning `rules` apply throughout.
+
+    :param rungs: number of slices, by default enough to get down to about eta finalists
+    :return: (list of (lag, window, full-history trade log) of the finalists, DataFrame of every combo's
+             last status with the rung it reached)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+    data = df if isinstance(df, SweepData) else SweepData.from_frame(df, feature_cache)
+    runs = [ComboRun(data, window, lag, variant, rules) for window in window_values for lag in lag_values]
+    if rungs is None:
+        rungs = max(1, math.ceil(math.log(max(1, len(runs)), eta)))
+    n = len(data)
+    rows = []
+    alive = runs
+    for rung in range(rungs):
+        budget = n if rung == rungs - 1 else max(1, n // eta ** (rungs - 1 - rung))
+        for run in alive:
+            run.advance(budget, check_every)
+        survivors = [run for run in alive if not run.pruned]
+        rows.extend(run.status('pruned', rung) for run in alive if run.pruned)
+        if rung < rungs - 1:
+            survivors.sort(key=lambda run: _rank(run, metric))
+            keep = max(1, math.ceil(len(survivors) / eta))
+            rows.extend(run.status('halved', rung) for run in survivors[keep:])
+            for run in survivors[keep:]:
+                run.release()
+            survivors = survivors[:keep]
+            print(f"📅 Rung {rung}: {budget:,} bars, {len(survivors)} of {len(alive)} combos continue")
+        # a window's extrema (built on FeatureCache misses) go once no surviving combo uses it
+        for window in {run.window for run in alive} - {run.window for run in survivors}:
+            data.release(window)
+        alive = survivors
+    rows.extend(run.status('completed', rungs - 1) for run in alive)
+    finalists = [(run.lag, run.window, run.trade_log(with_mae_mfe)) for run in alive]
+    report = pd.DataFrame(rows).sort_values(['Rung', metric], ascending=[False, metric == 'max_drawdown'],
+                                            ignore_index=True) if rows else pd.DataFrame(rows)
+    return finalists, report
+
+
+def _rank(run: ComboRun, metric: str):
+    value = getattr(run.metrics, metric)
+    if np.isnan(value):
+        return (1, 0.0)
+    return (0, value if metric == 'max_drawdown' else -value)
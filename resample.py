@@ -0,0 +1,263 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    OHLC_COLUMNS, CACHE_VERSION, default_cache_dir, load_raw_columns, load_column, read_meta, write_meta,
+)
+from instrumentation import stage
+from sweep import SweepData, VARIANTS
+
+_TIMEFRAME = re.compile(r"^\s*(?P<count>\d+)\s*(?P<unit>m|min|h|d)?\s*$", re.IGNORECASE)
+_MINUTES = {'m': 1, 'min': 1, 'h': 60, 'd': 1440}
+
+
+def timeframe_minutes(timeframe) -> int:
+    """
+    Bar length in minutes of 15, '15m', '15min', '1h' or '1d'.
+    """
+    if isinstance(timeframe, (int, np.integer)):
+        minutes = int(timeframe)
+    else:
+        match = _TIMEFRAME.match(str(timeframe))
+        if match is None:
+            raise ValueError(f"Cannot parse timeframe {timeframe!r}, expected e.g. 15, '15m' or '1h'")
+        minutes = int(match['count']) * _MINUTES[(match['unit'] or 'm').lower()]
+    if minutes <= 0:
+        raise ValueError(f"Timeframe must be at least one minute, got {timeframe!r}")
+    return minutes
+
+
+def timeframe_label(minutes: int) -> str:
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440}d"
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+class Resampler:
+    """
+    OHLC bars aggregated into several clock-aligned timeframes in one pass over blocks of a history.
+
+    Bars fall into [k * step + origin, (k + 1) * step + origin) buckets labelled by their start, like
+    pandas' resample(). Only buckets holding at least one source bar produce a bar, so session
+    gaps (nights, weekends, holidays) never create flat filler bars and a bar never pools data
+    from two buckets; the buckets at a session's edges keep just the source bars they hold. The
+    last, possibly unfinished bucket of every timeframe is carried to the next block.
+    """
+    def __init__(self, timeframes, time_dtype: str = 'datetime64[ns]', origin_minutes: int = 0):
+        """
+        :param timeframes: bar lengths, see timeframe_minutes()
+        :param time_dtype: unit of the int64 times passed to update()
+        :param origin_minutes: bucket offset from the epoch, e.g. 30 for hourly bars starting at :30
+        """
+        unit = np.timedelta64(1, np.datetime_data(np.dtype(time_dtype))[0])
+        self.minutes = [timeframe_minutes(tf) for tf in timeframes]
+        self.steps = [int(np.timedelta64(m, 'm') // unit) for m in self.minutes]
+        self.origin = int(np.timedelta64(origin_minutes, 'm') // unit)
+        self.time_dtype = time_dtype
+        self._pending = [None] * len(self.minutes)  # (bucket, o, h, l, c) not finished yet
+        self._last_time = None
+
+    def update(self, t: np.ndarray, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray):
+        """
+        Add the next block of source bars (times ascending, int64); returns {minutes: finished bar columns}.
+        """
+        t = np.asarray(t, dtype=np.int64)
+        if len(t) == 0:
+            return {m: _empty_bars() for m in self.minutes}
+        if np.any(t[1:] < t[:-1]) or (self._last_time is not None and t[0] < self._last_time):
+            raise ValueError("Source bars must be in time order")
+        self._last_time = t[-1]
+        o, h, l, c = (np.asarray(col, dtype=np.float64) for col in (o, h, l, c))
+        out = {}
+        for k, (minutes, step) in enumerate(zip(self.minutes, self.steps)):
+            bucket = (t - self.origin) // step
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            bars = {
+                'bucket': bucket[starts],
+                'o': o[starts],
+                'h': np.fmax.reduceat(h, starts),
+                'l': np.fmin.reduceat(l, starts),
+                'c': c[np.r_[starts[1:], len(t)] - 1],
+            }
+            pending = self._pending[k]
+            if pending is not None:
+                if pending[0] == bars['bucket'][0]:
+                    # the carried bucket continues in this block
+                    bars['o'][0] = pending[1]
+                    bars['h'][0] = np.fmax(pending[2], bars['h'][0])
+                    bars['l'][0] = np.fmin(pending[3], bars['l'][0])
+                else:
+                    bars = {key: np.r_[pending[i], values] for i, (key, values) in enumerate(bars.items())}
+            self._pending[k] = tuple(values[-1] for values in bars.values())
+            out[minutes] = self._finish({key: values[:-1] for key, values in bars.items()}, step)
+        return out
+
+    def flush(self):
+        """
+        The unfinished last bar of every timeframe, as if the history ended here.
+        """
+        out = {}
+        for k, (minutes, step) in enumerate(zip(self.minutes, self.steps)):
+            pending, self._pending[k] = self._pending[k], None
+            if pending is None:
+                out[minutes] = _empty_bars()
+            else:
+                keys = ('bucket', 'o', 'h', 'l', 'c')
+                out[minutes] = self._finish({key: np.array([value]) for key, value in zip(keys, pending)}, step)
+        return out
+
+    def _finish(self, bars, step):
+        bucket = bars.pop('bucket').astype(np.int64)
+        bars['t'] = bucket * step + self.origin
+        return bars
+
+
+def _empty_bars():
+    bars = {col: np.empty(0, dtype=np.float64) for col in OHLC_COLUMNS}
+    bars['t'] = np.empty(0, dtype=np.int64)
+    return bars
+
+
+def resample_frame(df: pd.DataFrame, timeframes, origin_minutes: int = 0):
+    """
+    {minutes: OHLC DataFrame} of an in-memory frame, every timeframe from one pass.
+    """
+    time_dtype = str(df.index.dtype)
+    resampler = Resampler(timeframes, time_dtype, origin_minutes)
+    blocks = [resampler.update(df.index.to_numpy().view(np.int64), *(df[col].to_numpy() for col in OHLC_COLUMNS)),
+              resampler.flush()]
+    return {minutes: _frame({key: np.concatenate([block[minutes][key] for block in blocks])
+                             for key in OHLC_COLUMNS + ['t']}, time_dtype)
+            for minutes in resampler.minutes}
+
+
+def _frame(bars, time_dtype):
+    index = pd.DatetimeIndex(bars.pop('t').view(time_dtype), name='t')
+    return pd.DataFrame(bars, index=index, copy=False)
+
+
+def timeframe_cache_dir(cache_dir: str, minutes: int, origin_minutes: int = 0) -> str:
+    suffix = f"+{origin_minutes}" if origin_minutes else ""
+    return os.path.join(cache_dir, "timeframes", timeframe_label(minutes) + suffix)
+
+
+def build_timeframes(csv_path: str, timeframes, cache_dir: str = None, origin_minutes: int = 0,
+                     chunk_rows: int = 1_000_000):
+    """
+    Resample the CSV's binary cache into every timeframe that is missing or stale, in one pass.
+
+    The source is read memory-mapped, `chunk_rows` bars at a time, and each timeframe is appended
+    to its own raw column files under `<cache_dir>/timeframes/<label>/`, in the base cache's layout.
+    A timeframe stays valid as long as the base cache was built from the same source file.
+
+    :return: {minutes: timeframe cache dir}
+    """
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    columns, time_dtype = load_raw_columns(csv_path, cache_dir)
+    source_digest = read_meta(cache_dir)['source_digest']
+    dirs = {timeframe_minutes(tf): None for tf in timeframes}
+    stale = []
+    for minutes in dirs:
+        dirs[minutes] = timeframe_cache_dir(cache_dir, minutes, origin_minutes)
+        meta = read_meta(dirs[minutes])
+        if meta is None or meta['source_digest'] != source_digest:
+            stale.append(minutes)
+    if not stale:
+        return dirs
+
+    n = len(columns['t'])
+    resampler = Resampler(stale, time_dtype, origin_minutes)
+    files, rows = {}, dict.fromkeys(stale, 0)
+    for minutes in stale:
+        os.makedirs(dirs[minutes], exist_ok=True)
+        meta_path = os.path.join(dirs[minutes], "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        files[minutes] = {col: open(os.path.join(dirs[minutes], f"{col}.bin"), 'wb') for col in OHLC_COLUMNS + ['t']}
+    try:
+        with stage('resample', bars=n):
+            for start in range(0, n, chunk_rows):
+                block = slice(start, min(n, start + chunk_rows))
+                _append(files, rows, resampler.update(*(columns[col][block] for col in ['t'] + OHLC_COLUMNS)))
+            _append(files, rows, resampler.flush())
+    finally:
+        for handles in files.values():
+            for f in handles.values():
+                f.close()
+    for minutes in stale:
+        write_meta(dirs[minutes], {
+            'version': CACHE_VERSION,
+            'source': os.path.abspath(csv_path),
+            'source_digest': source_digest,
+            'minutes': minutes,
+            'origin_minutes': origin_minutes,
+            'time_dtype': time_dtype,
+            'rows': rows[minutes],
+        })
+    return dirs
+
+
+def _append(files, rows, out):
+    for minutes, bars in out.items():
+        for col, values in bars.items():
+            values.tofile(files[minutes][col])
+        rows[minutes] += len(bars['t'])
+
+
+def load_timeframes(csv_path: str, timeframes, cache_dir: str = None, origin_minutes: int = 0, mmap: bool = True):
+    """
+    {minutes: OHLC DataFrame} of the CSV, resampled once and then served memory-mapped from the cache.
+    """
+    dirs = build_timeframes(csv_path, timeframes, cache_dir, origin_minutes)
+    frames = {}
+    for minutes, directory in dirs.items():
+        meta = read_meta(directory)
+        bars = {col: load_column(directory, col, np.float64, meta['rows'], mmap) for col in OHLC_COLUMNS}
+        bars['t'] = load_column(directory, 't', np.int64, meta['rows'], mmap)
+        frames[minutes] = _frame(bars, meta['time_dtype'])
+    return frames
+
+
+def timeframe_sweep(csv_path: str, timeframes, window_values, lag_values, output_dir=None, store_dir=None,
+                    variants=VARIANTS, symbol_name: str = None, max_workers: int = None, feature_cache=None,
+                    progress=None):
+    """
+    (lag, window) sweep of both backtester variants on every timeframe of one source file.
+
+    The source is parsed into the binary cache at most once and resampled into all timeframes in
+    one pass; each timeframe's sweep then runs on the pool from its memory-mapped bars. Trade logs
+    are named `<symbol>_<label>_lag<lag>_win<window>`, so generate_summary() reports every timeframe
+    as its own symbol.
+
+    :param output_dir: / store_dir: per-variant subdirectories receive CSVs / TradeStore partitions;
+                       with neither, trade logs are returned
+    :return: {(timeframe label, variant): parallel_sweep() results}
+    """
+    from sweep_executor import parallel_sweep
+    from trade_store import TradeStore
+
+    symbol_name = symbol_name or os.path.splitext(os.path.basename(csv_path))[0]
+    results = {}
+    for minutes, df in load_timeframes(csv_path, timeframes).items():
+        label = timeframe_label(minutes)
+        print(f"📅 {symbol_name} {label}: {len(df):,} bars")
+        for variant in variants:
+            store = TradeStore(os.path.join(store_dir, variant)) if store_dir is not None else None
+            results[label, variant] = parallel_sweep(
+                df, window_values, lag_values,
+                output_dir=os.path.join(output_dir, variant) if output_dir is not None else None,
+                variant=variant, symbol_name=f"{symbol_name}_{label}", max_workers=max_workers,
+                store=store, feature_cache=feature_cache, progress=progress,
+            )
+    return results
+
+
+def load_timeframe_sweep_data(csv_path: str, timeframe, cache_dir: str = None, feature_cache=None):
+    """
+    SweepData of one timeframe straight over its memory-mapped cache.
+    """
+    df = load_timeframes(csv_path, [timeframe], cache_dir)[timeframe_minutes(timeframe)]
+    return SweepData(*(df[col].to_numpy() for col in OHLC_COLUMNS), index=df.index, feature_cache=feature_cache)
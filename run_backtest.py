@@ -7,11 +7,10 @@ import concurrent.futures
 import warnings
 from backtesting_without_scaling import SwingBacktesterWithoutScaling  # assuming the class is in this file/module
 # ✅ Backtest function accepts DataFrame as argument
-def run_backtest_for_params(df, window, lag, output_dir):
-    symbol_name = "gold"  # From df_path, hardcoded here
+def run_backtest_for_params(df, window, lag, output_dir, symbol_name="gold"):
 
-    bt = SwingBacktesterWithoutScaling(data=df.copy(), lag=lag, window=window)
-    bt.run_backtest()
+    bt = SwingBacktesterWithoutScaling(data=df, lag=lag, window=window)  # the class copies df itself
+    bt.run_backtest(engine="array")
 
     if bt.bt is not None and not bt.bt.empty:
         bt.calculate_mae_mfe()
@@ -0,0 +1,239 @@
+import math
+import os
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_ohlc
+from features import NO_GRAB, BEARISH_GRAB, BULLISH_GRAB
+
+SwingFeatures = namedtuple('SwingFeatures', [
+    'time', 'is_swing_high', 'is_swing_low', 'swing_high_level', 'swing_low_level', 'liquidity_grab', 'entry_signal',
+])
+
+# (window, lag) grid of the parity check, for both variants
+PARITY_WINDOWS = (1, 4, 8)
+PARITY_LAGS = (1, 6, 12)
+PARITY_VARIANTS = ('without_scaling', 'scaling')
+
+
+class _RollingExtremum:
+    """
+    Monotonic-deque max (or min) over the centered window [j - window, j + window], skipping NaNs.
+    """
+    def __init__(self, window: int, is_max: bool):
+        self.window = window
+        self.is_max = is_max
+        self.items = deque()  # (bar index, value), values monotonic from the front
+
+    def push(self, i: int, value: float):
+        if math.isnan(value):
+            return
+        items = self.items
+        if self.is_max:
+            while items and items[-1][1] <= value:
+                items.pop()
+        else:
+            while items and items[-1][1] >= value:
+                items.pop()
+        items.append((i, value))
+
+    def value_at(self, j: int) -> float:
+        items = self.items
+        while items and items[0][0] < j - self.window:
+            items.popleft()
+        return items[0][1] if items else math.nan
+
+
+class StreamingSwingDetector:
+    """
+    Incremental swing / liquidity-grab / entry-signal detector fed one OHLC bar at a time.
+
+    Produces the same values as the batch process_all() of SwingBacktesterWithoutScaling
+    (variant='without_scaling') or SwingBacktesterWithScaling (variant='scaling') with O(window + lag)
+    state. The centered window of the non-scaling variant looks window - lag bars ahead when
+    lag < window, so its features for a bar are released that many bars later; every other
+    combination is released on the bar itself. Call flush() at the end of a history to release
+    the held-back bars with the truncated windows the batch path uses.
+    """
+    def __init__(self, window: int, lag: int, variant: str = 'without_scaling'):
+        if variant not in ('without_scaling', 'scaling'):
+            raise ValueError(f"Unknown variant {variant!r}, expected 'without_scaling' or 'scaling'")
+        self.window = window
+        self.lag = lag
+        self.variant = variant
+        self.grab_shift = 1 if variant == 'without_scaling' else window + lag + 1
+        self._max_h = _RollingExtremum(window, is_max=True)
+        self._min_l = _RollingExtremum(window, is_max=False)
+        self._n = 0          # bars received
+        self._centered = 0   # bars whose centered extrema are known
+        self._bars = deque()     # (h, l) of received bars whose centered extrema are not known yet
+        self._pending = deque()  # bars waiting to be released
+        self._flags = deque()    # (is_swing_high, is_swing_low) / (max_h, min_l) keyed from _flags_start
+        self._flags_start = 0
+        self._grabs = deque(maxlen=self.grab_shift)
+        self.swing_high_level = math.nan
+        self.swing_low_level = math.nan
+
+    def update(self, t, o: float, h: float, l: float, c: float):
+        """
+        Add one bar; returns the list of SwingFeatures released by it (in bar order).
+        """
+        i = self._n
+        self._n += 1
+        self._max_h.push(i, h)
+        self._min_l.push(i, l)
+        self._bars.append((h, l))
+        self._pending.append((i, t, o, h, l, c))
+        if i - self.window >= 0:
+            self._center_next()
+        return self._release()
+
+    def flush(self):
+        """
+        Release every held-back bar as if the history ended here.
+        """
+        while self._centered < self._n:
+            self._center_next()
+        return self._release()
+
+    def _center_next(self):
+        j = self._centered
+        self._centered += 1
+        h, l = self._bars.popleft()
+        max_h = self._max_h.value_at(j)
+        min_l = self._min_l.value_at(j)
+        if self.variant == 'without_scaling':
+            self._flags.append((h == max_h, l == min_l))
+        else:
+            self._flags.append((max_h, min_l))
+
+    def _flags_for(self, k: int):
+        """
+        Swing flags of bar k, or None if they depend on bars not seen yet.
+        """
+        if self.variant == 'without_scaling':
+            src = k - self.lag
+            if src < 0:
+                # no lagged pivot yet: counts as a swing, like the batch column
+                return True, True
+        else:
+            src = k - self.window - self.lag
+            if src < 0:
+                return False, False
+        if src >= self._centered:
+            return None
+        while self._flags_start < src:
+            self._flags.popleft()
+            self._flags_start += 1
+        return self._flags[src - self._flags_start]
+
+    def _release(self):
+        out = []
+        while self._pending:
+            k, t, o, h, l, c = self._pending[0]
+            flags = self._flags_for(k)
+            if flags is None:
+                break
+            self._pending.popleft()
+            if self.variant == 'without_scaling':
+                is_swing_high, is_swing_low = flags
+            else:
+                is_swing_high, is_swing_low = h == flags[0], l == flags[1]
+            out.append(self._features(t, o, h, l, c, is_swing_high, is_swing_low))
+        return out
+
+    def _features(self, t, o, h, l, c, is_swing_high, is_swing_low):
+        if is_swing_high and not math.isnan(h):
+            self.swing_high_level = h
+        if is_swing_low and not math.isnan(l):
+            self.swing_low_level = l
+        if l < self.swing_low_level:
+            grab = BEARISH_GRAB
+        elif h > self.swing_high_level:
+            grab = BULLISH_GRAB
+        else:
+            grab = NO_GRAB
+        grab_prev = self._grabs[0] if len(self._grabs) == self.grab_shift else NO_GRAB
+        self._grabs.append(grab)
+        if grab_prev == BEARISH_GRAB and c > o:
+            signal = 1
+        elif grab_prev == BULLISH_GRAB and c < o:
+            signal = -1
+        else:
+            signal = 0
+        return SwingFeatures(t, bool(is_swing_high), bool(is_swing_low),
+                             self.swing_high_level, self.swing_low_level, grab, signal)
+
+
+def stream_frame(df: pd.DataFrame, window: int, lag: int, variant: str = 'without_scaling'):
+    """
+    Replay a DataFrame bar by bar; returns (features DataFrame, mean per-bar update latency in seconds).
+    """
+    detector = StreamingSwingDetector(window, lag, variant)
+    rows = []
+    start = time.perf_counter()
+    for t, o, h, l, c in zip(df.index, df['o'].to_numpy(), df['h'].to_numpy(), df['l'].to_numpy(), df['c'].to_numpy()):
+        rows.extend(detector.update(t, float(o), float(h), float(l), float(c)))
+    rows.extend(detector.flush())
+    latency = (time.perf_counter() - start) / max(1, len(df))
+    return pd.DataFrame(rows, columns=SwingFeatures._fields).set_index('time'), latency
+
+
+def check_parity(df: pd.DataFrame, window: int, lag: int, variant: str = 'without_scaling'):
+    """
+    Assert the streamed features equal the batch backtester's columns; returns mean per-bar latency.
+    """
+    if variant == 'without_scaling':
+        from backtesting_without_scaling import SwingBacktesterWithoutScaling as Backtester
+    else:
+        from backtesting_scaling import SwingBacktesterWithScaling as Backtester
+    batch = Backtester(data=df, lag=lag, window=window).data
+    streamed, latency = stream_frame(df, window, lag, variant)
+
+    for col in ['is_swing_high', 'is_swing_low', 'liquidity_grab', 'entry_signal']:
+        np.testing.assert_array_equal(streamed[col].to_numpy(), batch[col].to_numpy(), err_msg=col)
+    for col in ['swing_high_level', 'swing_low_level']:
+        np.testing.assert_array_equal(streamed[col].to_numpy(dtype=np.float64),
+                                      batch[col].to_numpy(dtype=np.float64), err_msg=col)
+    return latency
+
+
+def parity_grid(df: pd.DataFrame, windows=PARITY_WINDOWS, lags=PARITY_LAGS, variants=PARITY_VARIANTS):
+    """
+    check_parity() over every (variant, window, lag); raises on the first mismatch.
+
+    :return: list of (variant, window, lag, mean per-bar latency in seconds)
+    """
+    results = []
+    for variant in variants:
+        for window in windows:
+            for lag in lags:
+                latency = check_parity(df, window, lag, variant)
+                print(f"✅ {variant} lag={lag} win={window}: parity OK, {latency * 1e6:.1f} µs/bar")
+                results.append((variant, window, lag, latency))
+    return results
+
+
+def synthetic_parity(n: int = 5_000, seed: int = 0, windows=PARITY_WINDOWS, lags=PARITY_LAGS,
+                     variants=PARITY_VARIANTS):
+    """
+    parity_grid() on seeded synthetic bars, so the check runs without the gold history.
+    """
+    from benchmarks.synthetic import synthetic_ohlc
+    return parity_grid(synthetic_ohlc(n, seed=seed), windows, lags, variants)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Streaming vs batch feature parity check")
+    parser.add_argument('--bars', type=int, default=5_000, help="synthetic bars to replay")
+    parser.add_argument('--full', action='store_true', help="also replay the full ./data/gold.csv history")
+    args = parser.parse_args()
+
+    synthetic_parity(args.bars)
+    if args.full:
+        parity_grid(load_ohlc(os.path.join("./data", "gold.csv")))
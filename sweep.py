@@ -0,0 +1,179 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_cache import ohlc_digest
+from features import rolling_extrema, without_scaling_features, scaling_features, feature_arrays
+from instrumentation import stage, combo_report, start_sweep_reports, write_sweep_report
+from kernels import without_scaling_kernel, scaling_kernel, mae_mfe, trades_to_frame, TRADE_DTYPE
+
+VARIANTS = ('without_scaling', 'scaling')
+
+
+class SweepData:
+    """
+    Read-only OHLC arrays shared by every (lag, window) combo of a parameter sweep.
+
+    Rolling extrema depend only on the window, so they are computed once per window
+    and every lag is derived from them with a shift; no DataFrame is copied per combo.
+    With a FeatureCache, combos already computed for the same OHLC are loaded instead.
+    """
+    def __init__(self, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray, index: pd.Index,
+                 feature_cache=None):
+        self.o = _read_only(o)
+        self.h = _read_only(h)
+        self.l = _read_only(l)
+        self.c = _read_only(c)
+        self.index = index
+        self.feature_cache = feature_cache
+        self._extrema = {}
+        self._digest = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, feature_cache=None):
+        """
+        :param df: DataFrame with ['o','h','l','c'] indexed by datetime
+        """
+        return cls(*(df[col].to_numpy(dtype=np.float64) for col in ['o', 'h', 'l', 'c']), index=df.index,
+                   feature_cache=feature_cache)
+
+    def __len__(self):
+        return len(self.o)
+
+    def extrema(self, window: int):
+        if window not in self._extrema:
+            self._extrema[window] = rolling_extrema(self.h, self.l, window)
+        return self._extrema[window]
+
+    def release(self, window: int):
+        self._extrema.pop(window, None)
+
+    def features(self, window: int, lag: int, variant: str = 'without_scaling'):
+        """
+        (entry_signal, is_swing_high, is_swing_low) arrays for one combo.
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+        if self.feature_cache is not None:
+            key = self.feature_cache.key(self.digest(), window, lag, variant)
+            arrays = self.feature_cache.get_or_compute(key, lambda: feature_arrays(
+                self.o, self.h, self.l, self.c, *self.extrema(window), window, lag, variant))
+            return arrays['entry_signal'], arrays['is_swing_high'], arrays['is_swing_low']
+        max_h, min_l = self.extrema(window)
+        if variant == 'without_scaling':
+            return without_scaling_features(self.o, self.h, self.l, self.c, max_h, min_l, lag)
+        return scaling_features(self.o, self.h, self.l, self.c, max_h, min_l, window, lag)
+
+    def digest(self) -> str:
+        """
+        Content hash of the OHLC arrays, the data part of FeatureCache keys.
+        """
+        if self._digest is None:
+            self._digest = ohlc_digest(self.o, self.h, self.l, self.c)
+        return self._digest
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    values.setflags(write=False)
+    return values
+
+
+def combo_trades(data: SweepData, window: int, lag: int, variant: str = 'without_scaling') -> np.ndarray:
+    """
+    Raw TRADE_DTYPE records of one combo over the whole history (bar numbers instead of times).
+    """
+    bars = len(data)
+    with stage('features', bars=bars):
+        signal, swing_high, swing_low = data.features(window, lag, variant)
+    with stage('run_backtest.array', bars=bars) as timer:
+        trades = np.empty(len(data), dtype=TRADE_DTYPE)
+        if variant == 'scaling':
+            n_trades = scaling_kernel(signal, data.o, data.h, data.l, swing_high, swing_low, trades)
+        else:
+            n_trades = without_scaling_kernel(signal, data.o, data.h, data.l, trades)
+        timer.add(trades=n_trades)
+    return trades[:n_trades]
+
+
+def run_combo(data: SweepData, window: int, lag: int, variant: str = 'without_scaling', with_mae_mfe: bool = True):
+    """
+    Backtest one (lag, window) combo on shared arrays.
+
+    Returns the same trade log as the backtester classes' run_backtest() + calculate_mae_mfe().
+    """
+    bars = len(data)
+    trades = combo_trades(data, window, lag, variant)
+    n_trades = len(trades)
+
+    with stage('trade_log', trades=n_trades):
+        bt = trades_to_frame(data.index, trades, with_units=(variant == 'scaling'))
+        if not bt.empty:
+            bt['Cumulative PnL'] = bt['PnL'].cumsum()
+            bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+    if with_mae_mfe and not bt.empty:
+        with stage('calculate_mae_mfe', bars=bars, trades=n_trades):
+            bt['MAE'], bt['MFE'] = mae_mfe(
+                data.h, data.l, trades['entry_bar'], trades['exit_bar'],
+                trades['entry_price'], trades['direction'] == 1,
+            )
+    return bt
+
+
+def run_sweep(df, window_values, lag_values, variant: str = 'without_scaling', with_mae_mfe: bool = True,
+              feature_cache=None):
+    """
+    Run every (lag, window) combo from one set of shared arrays.
+
+    Yields (lag, window, trade log DataFrame); extrema of a window are dropped once all its lags ran.
+
+    :param feature_cache: FeatureCache for a DataFrame input (a SweepData brings its own)
+    """
+    data = df if isinstance(df, SweepData) else SweepData.from_frame(df, feature_cache)
+    for window in window_values:
+        for lag in lag_values:
+            yield lag, window, run_combo(data, window, lag, variant, with_mae_mfe)
+        data.release(window)
+
+
+def save_trades(bt: pd.DataFrame, output_dir: str, lag: int, window: int, symbol_name: str = "gold", store=None):
+    """
+    Write one trade log as `<symbol>_lag<lag>_win<window>.csv`, or into `store` (a TradeStore) if given.
+    """
+    if bt is not None and not bt.empty:
+        with stage('write', trades=len(bt)) as timer:
+            if store is not None:
+                output = store.write(bt, lag, window, symbol_name)
+            else:
+                os.makedirs(output_dir, exist_ok=True)
+                output = os.path.join(output_dir, f"{symbol_name}_lag{lag}_win{window}.csv")
+                bt.to_csv(output, index=False)
+            timer.add(bytes=os.path.getsize(output))
+        print(f"📅 Saved to: {output}")
+    else:
+        print(f"⚠️ No trades generated for {symbol_name} (Lag: {lag}, Window: {window})")
+
+
+def save_sweep(df, window_values, lag_values, output_dir, variant: str = 'without_scaling',
+               symbol_name: str = "gold", store=None, feature_cache=None, report_dir=None, profile: str = None):
+    """
+    Shared-feature replacement for calling run_backtest_for_params once per combo.
+
+    :param report_dir: if set, a JSON stage report per combo plus an aggregated sweep.json are written there
+    :param profile: None, 'cprofile' or 'sample' profiling in every combo report (needs report_dir)
+    """
+    start = time.perf_counter()
+    if report_dir is not None:
+        reports = start_sweep_reports(report_dir, [symbol_name], window_values, lag_values, variant, profile)
+    data = df if isinstance(df, SweepData) else SweepData.from_frame(df, feature_cache)
+    for window in window_values:
+        for lag in lag_values:
+            with combo_report(report_dir, symbol_name, lag, window, variant, profile):
+                bt = run_combo(data, window, lag, variant)
+                save_trades(bt, output_dir, lag, window, symbol_name, store)
+        data.release(window)
+    if report_dir is not None:
+        write_sweep_report(report_dir, time.perf_counter() - start, reports, variant=variant, workers=1,
+                           profile=profile)
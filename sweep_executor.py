@@ -0,0 +1,151 @@
+import concurrent.futures
+import math
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import combo_report, start_sweep_reports, write_sweep_report
+from sweep import SweepData, run_combo, save_trades
+
+# Per-worker state, set once by _init_worker
+_worker_data = None
+_worker_shm = None
+
+
+class SharedOHLC:
+    """
+    o/h/l/c plus the datetime index (as int64 epoch values) placed once in a shared memory block.
+
+    Workers attach by name and view the block as NumPy arrays, so the DataFrame is
+    never pickled per task.
+    """
+    columns = ['o', 'h', 'l', 'c']
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        :param df: DataFrame with ['o','h','l','c'] indexed by datetime
+        """
+        self.n = len(df)
+        # asi8 is UTC-based for tz-aware indexes; the unit and timezone rebuild it in attach()
+        self.unit = df.index.unit
+        self.tz = df.index.tz
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, (len(self.columns) + 1) * self.n * 8))
+        self.name = self.shm.name
+        block = np.ndarray((len(self.columns) + 1, self.n), dtype=np.float64, buffer=self.shm.buf)
+        for row, col in enumerate(self.columns):
+            block[row] = df[col].to_numpy(dtype=np.float64)
+        block[-1].view(np.int64)[:] = df.index.asi8
+
+    def spec(self):
+        return self.name, self.n, self.unit, self.tz
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(name: str, n: int, unit: str = 'ns', tz=None):
+    """
+    Map a SharedOHLC block into a read-only SweepData; returns (SweepData, SharedMemory).
+
+    Only the creating process unlinks the block (SharedOHLC.close).
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    block = np.ndarray((len(SharedOHLC.columns) + 1, n), dtype=np.float64, buffer=shm.buf)
+    index = pd.DatetimeIndex(block[-1].view(np.int64).view(f'datetime64[{unit}]'))
+    if tz is not None:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    data = SweepData(block[0], block[1], block[2], block[3], index)
+    return data, shm
+
+
+def _init_worker(spec):
+    global _worker_data, _worker_shm
+    _worker_data, _worker_shm = attach(*spec)
+
+
+def _run_task(window, lags, variant, output_dir, symbol_name, store, feature_cache=None, report_dir=None,
+              profile=None):
+    """
+    One chunk of lags for a single window, so each worker computes the window's extrema once.
+    """
+    _worker_data.feature_cache = feature_cache
+    out = []
+    for lag in lags:
+        with combo_report(report_dir, symbol_name, lag, window, variant, profile):
+            bt = run_combo(_worker_data, window, lag, variant)
+            if output_dir is None and store is None:
+                out.append((lag, window, bt))
+            else:
+                save_trades(bt, output_dir, lag, window, symbol_name, store)
+                out.append((lag, window, len(bt)))
+    _worker_data.release(window)
+    return out
+
+
+def print_progress(done: int, total: int, elapsed: float, eta: float):
+    print(f"⏳ {done}/{total} combos done in {elapsed:.1f}s, ETA {eta:.1f}s")
+
+
+def parallel_sweep(df, window_values, lag_values, output_dir=None, variant: str = 'without_scaling',
+                   symbol_name: str = "gold", max_workers: int = None, chunksize: int = None, progress=None,
+                   store=None, feature_cache=None, report_dir=None, profile: str = None):
+    """
+    Run the (lag, window) grid on a process pool over shared-memory OHLC arrays.
+
+    :param output_dir: if set, workers write each trade log CSV and return trade counts;
+                       otherwise trade log DataFrames are returned
+    :param store: TradeStore to write trade logs into instead of CSVs (also returns trade counts)
+    :param max_workers: pool size, defaults to os.cpu_count()
+    :param chunksize: lags per task; tasks never mix windows. Defaults to ~4 tasks per worker
+    :param progress: callback(done, total, elapsed_seconds, eta_seconds) after every finished task
+    :param feature_cache: FeatureCache shared by the workers; cached combos skip feature computation
+    :param report_dir: if set, workers write a JSON stage report per combo and sweep.json aggregates them
+    :param profile: None, 'cprofile' or 'sample' profiling in every combo report (needs report_dir)
+    :return: list of (lag, window, trade log or trade count)
+    """
+    max_workers = max(1, max_workers or os.cpu_count())
+    total = len(window_values) * len(lag_values)
+    if chunksize is None:
+        chunksize = min(max(1, math.ceil(total / (4 * max_workers))), max(1, len(lag_values)))
+    lag_chunks = [lag_values[i:i + chunksize] for i in range(0, len(lag_values), chunksize)]
+
+    results = []
+    start = time.perf_counter()
+    if report_dir is not None:
+        reports = start_sweep_reports(report_dir, [symbol_name], window_values, lag_values, variant, profile)
+    with SharedOHLC(df) as shared:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(shared.spec(),)
+        ) as executor:
+            futures = {
+                executor.submit(_run_task, window, lags, variant, output_dir, symbol_name, store, feature_cache,
+                                report_dir, profile): len(lags)
+                for window in window_values
+                for lags in lag_chunks
+            }
+            done = 0
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    print(f"❌ Error: {e}")
+                # a failed task's combos are finished too, so progress still reaches the total
+                done += futures[future]
+                if progress is not None:
+                    elapsed = time.perf_counter() - start
+                    eta = elapsed / done * (total - done) if done else float('nan')
+                    progress(done, total, elapsed, eta)
+    if report_dir is not None:
+        write_sweep_report(report_dir, time.perf_counter() - start, reports, variant=variant, workers=max_workers,
+                           chunksize=chunksize, bars=len(df), profile=profile)
+    return results
@@ -0,0 +1,131 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from kernels import DIRECTIONS, EXIT_REASONS
+
+# Stored per partition; 'Cumulative PnL' and 'Duration' are derived again on read
+PRICE_COLUMNS = ['Entry Price', 'Exit Price', 'SL Price']
+VALUE_COLUMNS = ['PnL', 'MAE', 'MFE']
+_PARTITION = re.compile(r"^(?P<symbol>.+)_lag(?P<lag>\d+)_win(?P<window>\d+)\.npz$")
+
+
+def _key(name: str) -> str:
+    return name.lower().replace(' ', '_')
+
+
+class TradeStore:
+    """
+    Typed, columnar trade logs for every (symbol, lag, window) partition of a sweep.
+
+    Each partition is one compressed .npz of int64 epoch times, int8 Direction / Exit Reason
+    codes, float32 prices and float64 PnL/MAE/MFE; partitions are written independently, so
+    pool workers can write concurrently without a shared manifest.
+    """
+    def __init__(self, path: str, price_dtype=np.float32):
+        self.path = path
+        self.price_dtype = np.dtype(price_dtype)
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return any(_PARTITION.match(os.path.basename(file)) for file in glob.glob(os.path.join(path, "*.npz")))
+
+    def partition_path(self, lag: int, window: int, symbol: str = "gold") -> str:
+        return os.path.join(self.path, f"{symbol}_lag{lag}_win{window}.npz")
+
+    def partitions(self):
+        """
+        Sorted list of (symbol, lag, window) present in the store.
+        """
+        found = []
+        for file in os.listdir(self.path):
+            match = _PARTITION.match(file)
+            if match:
+                found.append((match['symbol'], int(match['lag']), int(match['window'])))
+        return sorted(found)
+
+    def write(self, bt: pd.DataFrame, lag: int, window: int, symbol: str = "gold") -> str:
+        """
+        Store one trade log (as produced by run_backtest + calculate_mae_mfe); returns the partition path,
+        or None for an empty log (like the CSV writer, nothing is written).
+        """
+        if bt is None or bt.empty:
+            return None
+        time_dtype = str(bt['Entry Time'].dtype)
+        columns = {
+            'time_dtype': np.array(time_dtype),
+            'entry_time': bt['Entry Time'].to_numpy(dtype=time_dtype).view(np.int64),
+            'exit_time': bt['Exit Time'].to_numpy(dtype=time_dtype).view(np.int64),
+            'direction': (bt['Direction'] == DIRECTIONS[1]).to_numpy(dtype=np.int8),
+            'exit_reason': EXIT_REASONS.get_indexer(bt['Exit Reason']).astype(np.int8),
+        }
+        for col in PRICE_COLUMNS:
+            columns[_key(col)] = bt[col].to_numpy(dtype=self.price_dtype)
+        for col in VALUE_COLUMNS + ['Units']:
+            if col in bt:
+                columns[_key(col)] = bt[col].to_numpy()
+
+        path = self.partition_path(lag, window, symbol)
+        # written through a handle: np.savez would append .npz to the name and make it look like a partition
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp, path)
+        return path
+
+    def read_partition(self, lag: int, window: int, symbol: str = "gold") -> pd.DataFrame:
+        """
+        One trade log in the original column layout, with categorical Direction / Exit Reason.
+        """
+        with np.load(self.partition_path(lag, window, symbol)) as z:
+            time_dtype = str(z['time_dtype'])
+            bt = pd.DataFrame({
+                'Entry Time': z['entry_time'].view(time_dtype),
+                'Exit Time': z['exit_time'].view(time_dtype),
+                'Direction': pd.Categorical.from_codes(z['direction'], categories=DIRECTIONS),
+                'Entry Price': z['entry_price'],
+                'Exit Price': z['exit_price'],
+                'PnL': z['pnl'],
+                'Exit Reason': pd.Categorical.from_codes(z['exit_reason'], categories=EXIT_REASONS),
+                'SL Price': z['sl_price'],
+            })
+            if 'units' in z:
+                bt['Units'] = z['units']
+            bt['Cumulative PnL'] = bt['PnL'].cumsum()
+            bt['Duration'] = (bt['Exit Time'] - bt['Entry Time']).dt.total_seconds() / 60
+            for col in ['MAE', 'MFE']:
+                if _key(col) in z:
+                    bt[col] = z[_key(col)]
+        return bt
+
+    def iter_partitions(self):
+        """
+        Yields (symbol, lag, window, trade log) for every partition.
+        """
+        for symbol, lag, window in self.partitions():
+            yield symbol, lag, window, self.read_partition(lag, window, symbol)
+
+    def read(self) -> pd.DataFrame:
+        """
+        All partitions in one table, keyed by 'Symbol', 'Lag' and 'Window' columns.
+        """
+        frames = []
+        for symbol, lag, window, bt in self.iter_partitions():
+            frames.append(bt.assign(Symbol=symbol, Lag=lag, Window=window))
+        if not frames:
+            return pd.DataFrame([])
+        trades = pd.concat(frames, ignore_index=True)
+        trades['Symbol'] = trades['Symbol'].astype('category')
+        return trades
+
+    def export_csv(self, output_dir: str):
+        """
+        Write the classic one-CSV-per-combo layout, e.g. for the notebook.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        for symbol, lag, window, bt in self.iter_partitions():
+            bt.to_csv(os.path.join(output_dir, f"{symbol}_lag{lag}_win{window}.csv"), index=False)
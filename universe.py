@@ -0,0 +1,133 @@
+import concurrent.futures
+import glob
+import math
+import os
+import time
+
+from data_loader import load_columns, load_sweep_data
+from instrumentation import combo_report, start_sweep_reports, write_sweep_report
+from sweep import run_combo, save_trades
+
+# Per-worker state: the one symbol whose arrays this worker currently maps
+_worker_symbol = None
+_worker_data = None
+
+
+def discover_symbols(data_dir: str, pattern: str = "*.csv"):
+    """
+    {symbol: csv path} for every data file in `data_dir`, the symbol being the file name stem.
+    """
+    paths = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    return {os.path.splitext(os.path.basename(path))[0]: path for path in paths}
+
+
+def _prepare_symbol(csv_path: str) -> int:
+    """
+    Build (or validate) the binary cache of one file; returns its bar count.
+    """
+    _, index = load_columns(csv_path)
+    return len(index)
+
+
+def _symbol_data(symbol: str, csv_path: str, feature_cache=None):
+    """
+    SweepData of `symbol`, memory-mapped from its cache; the previous symbol's arrays are dropped.
+    """
+    global _worker_symbol, _worker_data
+    if _worker_symbol != symbol:
+        _worker_symbol, _worker_data = None, None  # unmap before mapping the next symbol
+        _worker_data = load_sweep_data(csv_path, feature_cache=feature_cache)
+        _worker_symbol = symbol
+    return _worker_data
+
+
+def _run_symbol_task(symbol, csv_path, window, lags, variant, output_dir, store, feature_cache=None,
+                     report_dir=None, profile=None):
+    """
+    One chunk of lags for a single (symbol, window).
+    """
+    data = _symbol_data(symbol, csv_path, feature_cache)
+    out = []
+    for lag in lags:
+        with combo_report(report_dir, symbol, lag, window, variant, profile):
+            bt = run_combo(data, window, lag, variant)
+            save_trades(bt, output_dir, lag, window, symbol, store)
+            out.append((symbol, lag, window, len(bt)))
+    data.release(window)
+    return out
+
+
+def universe_sweep(symbols, window_values, lag_values, output_dir=None, variant: str = 'without_scaling',
+                   max_workers: int = None, chunksize: int = None, progress=None, store=None, feature_cache=None,
+                   report_dir=None, profile: str = None):
+    """
+    Run the (symbol x lag x window) grid on one process pool.
+
+    Every symbol is read through the memory-mapped binary cache (data_loader), so workers share
+    its pages through the OS instead of pickling frames. Tasks are queued symbol by symbol, so
+    at any time only about `max_workers` symbols are mapped, and a worker drops a symbol's
+    arrays as soon as it moves on to the next one.
+
+    :param symbols: {symbol: csv path}, e.g. from discover_symbols(), or a data directory
+    :param output_dir: folder the workers write `<symbol>_lag<lag>_win<window>.csv` trade logs into
+    :param store: TradeStore to write trade logs into instead of CSVs. One of output_dir / store is
+                  required: a whole universe of trade logs is not held in the parent's memory
+    :param max_workers: pool size, defaults to os.cpu_count()
+    :param chunksize: lags per task; tasks never mix symbols or windows. Defaults to ~4 tasks per worker
+    :param progress: callback(done, total, elapsed_seconds, eta_seconds) after every finished task
+    :param feature_cache: FeatureCache shared by the workers; cached combos skip feature computation
+    :param report_dir: if set, workers write a JSON stage report per combo and sweep.json aggregates them
+    :param profile: None, 'cprofile' or 'sample' profiling in every combo report (needs report_dir)
+    :return: list of (symbol, lag, window, trade count)
+    """
+    if output_dir is None and store is None:
+        raise ValueError("universe_sweep needs output_dir or store to write the trade logs to")
+    if isinstance(symbols, str):
+        symbols = discover_symbols(symbols)
+    max_workers = max(1, max_workers or os.cpu_count())
+    total = len(symbols) * len(window_values) * len(lag_values)
+    if chunksize is None:
+        chunksize = min(max(1, math.ceil(total / (4 * max_workers))), max(1, len(lag_values)))
+    lag_chunks = [lag_values[i:i + chunksize] for i in range(0, len(lag_values), chunksize)]
+
+    results = []
+    start = time.perf_counter()
+    if report_dir is not None:
+        reports = start_sweep_reports(report_dir, list(symbols), window_values, lag_values, variant, profile)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # caches are built up front, in parallel, so workers never race to write the same one
+        prepared = {symbol: executor.submit(_prepare_symbol, path) for symbol, path in symbols.items()}
+        ready = {}
+        for symbol, future in prepared.items():
+            try:
+                bars = future.result()
+            except Exception as e:
+                print(f"❌ Error loading {symbol}: {e}")
+                continue
+            ready[symbol] = symbols[symbol]
+            print(f"✅ {symbol}: {bars:,} bars")
+        total = len(ready) * len(window_values) * len(lag_values)
+
+        futures = {
+            executor.submit(_run_symbol_task, symbol, path, window, lags, variant, output_dir, store,
+                            feature_cache, report_dir, profile): len(lags)
+            for symbol, path in ready.items()
+            for window in window_values
+            for lags in lag_chunks
+        }
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"❌ Error: {e}")
+            # a failed task's combos are finished too, so progress still reaches the total
+            done += futures[future]
+            if progress is not None:
+                elapsed = time.perf_counter() - start
+                eta = elapsed / done * (total - done) if done else float('nan')
+                progress(done, total, elapsed, eta)
+    if report_dir is not None:
+        write_sweep_report(report_dir, time.perf_counter() - start, reports, variant=variant, workers=max_workers,
+                           chunksize=chunksize, symbols=list(ready), profile=profile)
+    return results
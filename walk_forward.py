@@ -0,0 +1,214 @@
+import collections
+import concurrent.futures
+import math
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import sweep_executor
+from generate_summary import summarize
+from kernels import mae_mfe
+from pruning import ComboRun
+from sweep import combo_trades
+from sweep_executor import SharedOHLC
+
+warnings.filterwarnings('ignore')
+
+Fold = collections.namedtuple('Fold', ['fold', 'train_start', 'train_stop', 'test_start', 'test_stop'])
+
+# lower is better for these summary metrics, higher for every other one
+LOWER_IS_BETTER = ('Max Drawdown',)
+
+
+def walk_forward_folds(n: int, train_bars: int, test_bars: int, step: int = None, anchored: bool = False):
+    """
+    Rolling (or anchored) train/test splits of `n` bars; test slices follow each other without overlap.
+
+    :param step: bars between fold starts, defaults to test_bars (must not be smaller, or test trades repeat)
+    :param anchored: every train slice starts at bar 0 instead of rolling forward
+    :return: list of Fold(fold, train_start, train_stop, test_start, test_stop), stops exclusive
+    """
+    step = step or test_bars
+    if train_bars <= 0 or test_bars <= 0:
+        raise ValueError("train_bars and test_bars must be positive")
+    if step < test_bars:
+        raise ValueError(f"step ({step}) must be at least test_bars ({test_bars}) so test slices do not overlap")
+    folds = []
+    start = 0
+    while start + train_bars < n:
+        test_start = start + train_bars
+        folds.append(Fold(len(folds), 0 if anchored else start, test_start, test_start, min(n, test_start + test_bars)))
+        start += step
+    return folds
+
+
+def _score_task(window, lags, variant, folds, feature_cache=None):
+    """
+    Train-slice summaries of one window's lags for every fold, from one full-history run per combo.
+
+    A combo's train trades are its trades entered and closed inside the train slice, so overlapping
+    train slices share the same backtest instead of repeating it.
+    """
+    data = sweep_executor._worker_data
+    data.feature_cache = feature_cache
+    frames = []
+    for lag in lags:
+        trades = combo_trades(data, window, lag, variant)
+        if not len(trades):
+            continue
+        mae, mfe = mae_mfe(data.h, data.l, trades['entry_bar'], trades['exit_bar'], trades['entry_price'],
+                           trades['direction'] == 1)
+        rows, fold_ids = [], []
+        for fold in folds:
+            inside = np.flatnonzero((trades['entry_bar'] >= fold.train_start) & (trades['exit_bar'] < fold.train_stop))
+            rows.append(inside)
+            fold_ids.append(np.full(len(inside), fold.fold))
+        rows = np.concatenate(rows)
+        frames.append(pd.DataFrame({
+            'Fold': np.concatenate(fold_ids), 'Lag': lag, 'Window': window,
+            'PnL': trades['pnl'][rows], 'MAE': mae[rows], 'MFE': mfe[rows],
+        }))
+    data.release(window)
+    if not frames:
+        return summarize(pd.DataFrame(), keys=('Fold', 'Lag', 'Window'))
+    return summarize(pd.concat(frames, ignore_index=True), keys=('Fold', 'Lag', 'Window'))
+
+
+def _test_task(fold, window, lag, variant, feature_cache=None):
+    """
+    Out-of-sample trade log of the chosen combo on one test slice, starting flat at its first bar.
+    """
+    data = sweep_executor._worker_data
+    data.feature_cache = feature_cache
+    bt = ComboRun(data, window, lag, variant, start=fold.test_start).advance(fold.test_stop).trade_log()
+    bt.insert(0, 'Fold', fold.fold)
+    bt.insert(1, 'Lag', lag)
+    bt.insert(2, 'Window', window)
+    return fold.fold, bt
+
+
+def select_best(scores: pd.DataFrame, metric: str = 'Total PnL', min_trades: int = 1) -> pd.DataFrame:
+    """
+    Best (lag, window) row of every fold by `metric` among combos with at least `min_trades` train trades.
+
+    Ties go to the smallest window, then the smallest lag.
+    """
+    if metric not in scores:
+        raise ValueError(f"Unknown metric {metric!r}, expected a summary column")
+    eligible = scores[(scores['Total Trades'] >= min_trades) & scores[metric].notna()]
+    ascending = metric in LOWER_IS_BETTER
+    ranked = eligible.sort_values(['Fold', metric, 'Window', 'Lag'], ascending=[True, ascending, True, True],
+                                  kind='stable')
+    return ranked.drop_duplicates('Fold').reset_index(drop=True)
+
+
+def walk_forward(df, window_values, lag_values, train_bars: int, test_bars: int, step: int = None,
+                 anchored: bool = False, variant: str = 'without_scaling', metric: str = 'Total PnL',
+                 min_trades: int = 1, max_workers: int = None, feature_cache=None, progress=None):
+    """
+    Walk-forward optimization of the (lag, window) grid.
+
+    Each combo is backtested once over the whole history on the shared-memory worker pool, and
+    every fold's train score is the summary of its trades inside that fold's train slice. The best
+    combo of each fold is then re-run from flat on the fold's test slice, folds in parallel, and the
+    out-of-sample trades are stitched in fold order. Features come from the single full-history pass
+    (and the FeatureCache if given), so they are never recomputed per fold.
+
+    :param train_bars: bars in each train slice (or the first one if anchored)
+    :param test_bars: bars in each out-of-sample test slice
+    :param metric: summary column picking the best combo ('Max Drawdown' is minimized, others maximized)
+    :param min_trades: fewest train trades a combo needs to be picked
+    :param progress: callback(done, total, elapsed_seconds, eta_seconds) after every finished task
+    :return: (stitched out-of-sample trade log with 'Fold', 'Lag', 'Window' columns and a running
+              'Cumulative PnL', one row per fold with its bounds, pick and train / test results)
+    """
+    folds = walk_forward_folds(len(df), train_bars, test_bars, step, anchored)
+    if not folds:
+        raise ValueError(f"{len(df)} bars leave no test slice after {train_bars} train bars")
+    max_workers = max(1, max_workers or os.cpu_count())
+    chunksize = min(max(1, math.ceil(len(window_values) * len(lag_values) / (4 * max_workers))),
+                    max(1, len(lag_values)))
+    lag_chunks = [lag_values[i:i + chunksize] for i in range(0, len(lag_values), chunksize)]
+
+    start = time.perf_counter()
+    scores, tests = [], {}
+    with SharedOHLC(df) as shared:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=sweep_executor._init_worker, initargs=(shared.spec(),)
+        ) as executor:
+            futures = [executor.submit(_score_task, window, lags, variant, folds, feature_cache)
+                       for window in window_values for lags in lag_chunks]
+            scored, total = len(futures), len(futures) + len(folds)
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                scores.append(future.result())
+                _report(progress, done, total, start)
+            scores = pd.concat(scores, ignore_index=True) if scores else pd.DataFrame()
+            best = select_best(scores, metric, min_trades) if not scores.empty else scores
+
+            picks = {row.Fold: (int(row.Window), int(row.Lag)) for row in best.itertuples(index=False)}
+            futures = [executor.submit(_test_task, fold, *picks[fold.fold], variant, feature_cache)
+                       for fold in folds if fold.fold in picks]
+            for done, future in enumerate(concurrent.futures.as_completed(futures), scored + 1):
+                fold, bt = future.result()
+                tests[fold] = bt
+                _report(progress, done, total, start)
+
+    logs = [tests[fold] for fold in sorted(tests) if not tests[fold].empty]
+    oos = pd.concat(logs, ignore_index=True) if logs else pd.DataFrame()
+    if not oos.empty:
+        oos['Cumulative PnL'] = oos['PnL'].cumsum()
+    return oos, _fold_table(df.index, folds, best, tests, metric)
+
+
+def _report(progress, done, total, start):
+    if progress is not None:
+        elapsed = time.perf_counter() - start
+        progress(done, total, elapsed, elapsed / done * (total - done) if done else float('nan'))
+
+
+def _fold_table(index, folds, best, tests, metric):
+    picks = best.set_index('Fold') if not best.empty else None
+    rows = []
+    for fold in folds:
+        picked = picks is not None and fold.fold in picks.index
+        bt = tests.get(fold.fold, pd.DataFrame())
+        rows.append({
+            'Fold': fold.fold,
+            'Train Start': index[fold.train_start], 'Train End': index[fold.train_stop - 1],
+            'Test Start': index[fold.test_start], 'Test End': index[fold.test_stop - 1],
+            'Lag': picks.at[fold.fold, 'Lag'] if picked else None,
+            'Window': picks.at[fold.fold, 'Window'] if picked else None,
+            f'Train {metric}': picks.at[fold.fold, metric] if picked else np.nan,
+            'Train Trades': picks.at[fold.fold, 'Total Trades'] if picked else 0,
+            'Test Trades': len(bt),
+            'Test PnL': bt['PnL'].sum() if not bt.empty else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    from data_loader import load_ohlc
+    from sweep_executor import print_progress
+    from universe import discover_symbols
+
+    output_dir = "./WalkForward/without_scaling"
+    os.makedirs(output_dir, exist_ok=True)
+    window_values = [1, 2, 3, 4, 5, 6, 7, 8]
+    lag_values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+
+    for symbol, csv_path in discover_symbols("./data").items():
+        df = load_ohlc(csv_path)
+        # ✅ 250k bars to train on, the next 62.5k out of sample, rolled forward by the test length
+        oos, folds = walk_forward(df, window_values, lag_values, train_bars=250_000, test_bars=62_500,
+                                  metric='Sortino Ratio', min_trades=30, progress=print_progress)
+        oos.to_csv(os.path.join(output_dir, f"{symbol}_oos_trades.csv"), index=False)
+        folds.to_csv(os.path.join(output_dir, f"{symbol}_folds.csv"), index=False)
+        print(f"✅ {symbol}: {len(folds)} folds, {len(oos)} out-of-sample trades, "
+              f"PnL {oos['PnL'].sum() if not oos.empty else 0.0:.2f}")
+
+
+if __name__ == "__main__":
+    main()